@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import random
+import time
+from collections import Counter
+from curl_cffi.requests import AsyncSession
+from Download_faturas_linux import (EnergisaBase, mes_atual, ano_atual, MAX_WORKERS_DOWNLOAD,
+                                    REQUISICOES_POR_SEGUNDO, MAX_TENTATIVAS_DOWNLOAD, BACKOFF_BASE,
+                                    STATUS_REPETIR, HEADERS_SESSAO, PASSO_HTTP, PASSO_ARQUIVO,
+                                    BAIXADA, JA_BAIXADA, FALHA)
+from arquivo_fatura import GravadorPdf, fatura_ja_baixada
+
+# Variante asyncio da EnergisaAutomacao: login, consulta das unidades e centenas de downloads
+# (SegundaVia/Download) no mesmo event loop, com um semáforo limitando os downloads simultâneos.
+# O fluxo do login vem da EnergisaBase (mesmos geradores de passos da EnergisaAutomacao); aqui ficam só
+# o transporte (AsyncSession) e os downloads. Arquivos (PDFs, .sha256, cache de sessão) são lidos e
+# gravados em asyncio.to_thread, fora do event loop.
+# Usada pelo CLI do Download_faturas_linux.py com --async.
+
+
+class LimitadorTaxaAsync:
+    """Token bucket para corrotinas: no máximo `requisicoes_por_segundo` em média"""
+
+    def __init__(self, requisicoes_por_segundo, rajada=1):
+        self.intervalo = 1.0 / requisicoes_por_segundo
+        self.capacidade = rajada
+        self.fichas = rajada
+        self.ultima = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def aguardar(self):
+        async with self.lock:
+            agora = time.monotonic()
+            self.fichas = min(self.capacidade, self.fichas + (agora - self.ultima) / self.intervalo)
+            self.ultima = agora
+            if self.fichas < 1:
+                await asyncio.sleep((1 - self.fichas) * self.intervalo)
+                self.fichas = 1
+                self.ultima = time.monotonic()
+            self.fichas -= 1
+
+
+class EnergisaAutomacaoAsync(EnergisaBase):
+    """
+    Mesmo fluxo da EnergisaAutomacao com curl_cffi AsyncSession (impersonate="chrome110").
+    Usar como `async with EnergisaAutomacaoAsync(documento) as automacao:` para abrir e fechar a sessão.
+    """
+
+    async def __aenter__(self):
+        self.session = AsyncSession(headers=dict(HEADERS_SESSAO))
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def executar_login_automatico(self):
+        return await self._executar_passos(self._passos_login())
+
+    async def consultar_unidades_consumidoras(self):
+        return await self._executar_passos(self._passos_consultar_unidades())
+
+    async def _executar_passos(self, passos):
+        """Executa um fluxo da EnergisaBase no event loop; exceções do transporte voltam para o fluxo"""
+        resposta, erro = None, None
+        while True:
+            try:
+                passo = passos.throw(erro) if erro is not None else passos.send(resposta)
+            except StopIteration as fim:
+                return fim.value
+            resposta, erro = None, None
+            try:
+                resposta = await self._executar_passo(passo)
+            except Exception as e:
+                erro = e
+
+    async def _executar_passo(self, passo):
+        tipo = passo[0]
+        if tipo == PASSO_HTTP:
+            _, metodo, url, kwargs = passo
+            return await self.session.request(metodo, url, **kwargs)
+        if tipo == PASSO_ARQUIVO:
+            _, funcao, args = passo
+            return await asyncio.to_thread(funcao, *args)
+        _, solicitado_em, tempo_limite = passo
+        return await self._leitor_codigo().aguardar_codigo_async(self.session, solicitado_em, tempo_limite)
+
+    async def _post_com_retentativa(self, url, **kwargs):
+        """POST respeitando o limite de taxa; 429/5xx e falhas de conexão são repetidos com backoff exponencial"""
+        for tentativa in range(MAX_TENTATIVAS_DOWNLOAD):
+            response = None
+            if self.limitador:
+                await self.limitador.aguardar()
+            try:
+                response = await self.session.post(url, **kwargs)
+            except Exception as e:
+                if tentativa == MAX_TENTATIVAS_DOWNLOAD - 1:
+                    raise
+                logging.warning(f"Falha na requisição ({e}). Tentativa {tentativa + 1}/{MAX_TENTATIVAS_DOWNLOAD}")
+            else:
+                if response.status_code not in STATUS_REPETIR or tentativa == MAX_TENTATIVAS_DOWNLOAD - 1:
+                    return response
+                logging.warning(f"Status {response.status_code}. Tentativa {tentativa + 1}/{MAX_TENTATIVAS_DOWNLOAD}")
+                if kwargs.get('stream'):
+                    await response.aclose()
+
+            espera = BACKOFF_BASE * 2 ** tentativa + random.uniform(0, 1)
+            retry_after = response.headers.get('Retry-After') if response is not None else None
+            if retry_after and retry_after.isdigit():
+                espera = max(espera, int(retry_after))
+            await asyncio.sleep(espera)
+
+    async def baixar_fatura(self, cdc, digito_verificador, codigo_empresa, mes=mes_atual, ano=ano_atual):
+        """Mesmos resultados e registro no diário da EnergisaAutomacao.baixar_fatura"""
+        inicio = time.monotonic()
+        resultado, status_http, erro = await self._baixar_fatura(cdc, digito_verificador, codigo_empresa, mes, ano)
+        await asyncio.to_thread(self._registrar_tentativa, cdc, digito_verificador, codigo_empresa, mes, ano,
+                                resultado, status_http, erro, time.monotonic() - inicio)
+        return resultado
+
+    async def _baixar_fatura(self, cdc, digito_verificador, codigo_empresa, mes, ano):
+        """Retorna (resultado, código HTTP, erro)"""
+        if not self.login_completo or not cdc:
+            return FALHA, None, "sessão não autenticada"
+
+        nome_arquivo = self._caminho_fatura(cdc, digito_verificador, codigo_empresa, mes, ano)
+        if await asyncio.to_thread(fatura_ja_baixada, nome_arquivo):
+            logging.info(f"CDC {cdc}: fatura já baixada ({nome_arquivo}), pulando.")
+            self.faturas_puladas.append(nome_arquivo)
+            return JA_BAIXADA, None, None
+
+        logging.info(f"INICIANDO DOWNLOAD DA FATURA PARA CDC {cdc}...")
+        payload = self._payload_download(cdc, digito_verificador, codigo_empresa, mes, ano)
+        headers = self._headers_download(self.session.cookies.get_dict())
+        status_http = None
+
+        try:
+            response = await self._post_com_retentativa(
+                f"{self.BASE_URL}/api/clientes/SegundaVia/Download",
+                json=payload,
+                headers=headers,
+                timeout=30,
+                impersonate="chrome110",
+                stream=True
+            )
+
+            try:
+                status_http = response.status_code
+                if response.status_code == 200:
+                    gravador = await asyncio.to_thread(GravadorPdf, nome_arquivo)
+                    try:
+                        async for bloco in response.aiter_content():
+                            await asyncio.to_thread(gravador.escrever, bloco)
+                    except Exception:
+                        await asyncio.to_thread(gravador.descartar)
+                        raise
+
+                    if await asyncio.to_thread(gravador.concluir):
+                        logging.info(f"PDF salvo: {nome_arquivo}")
+                        return BAIXADA, status_http, None
+                    resultado, erro = self._resultado_sem_pdf(gravador)
+                    return resultado, status_http, erro
+
+                corpo = (await response.acontent()).decode('utf-8', errors='replace')
+                logging.info(f"CDC {cdc}: erro {response.status_code}: {corpo}")
+                return self._resultado_erro_http(status_http), status_http, corpo[:500]
+            finally:
+                await response.aclose()
+
+        except Exception as e:
+            logging.error(f"Erro no download do CDC {cdc}: {e}")
+            return FALHA, status_http, f"{type(e).__name__}: {e}"
+
+    async def baixar_fatura_direto(self, cdc, digito_verificador, codigo_empresa, mes=mes_atual, ano=ano_atual):
+        return await self.baixar_fatura(cdc, digito_verificador, codigo_empresa, mes, ano) in (BAIXADA, JA_BAIXADA)
+
+    async def baixar_faturas_para_todas_unidades(self, mes=mes_atual, ano=ano_atual, max_workers=MAX_WORKERS_DOWNLOAD,
+                                                 requisicoes_por_segundo=REQUISICOES_POR_SEGUNDO):
+        """Baixa as faturas de todas as unidades com no máximo `max_workers` downloads ao mesmo tempo"""
+        if not self.login_completo:
+            return False
+
+        logging.info(f"\nBAIXANDO FATURAS DE {mes}/{ano} PARA TODAS AS UNIDADES (async, {max_workers} simultâneos)...")
+
+        if not self.unidades_encontradas:
+            logging.info("Nenhuma unidade disponível")
+            return False
+
+        tarefas = self._tarefas_do_mes(mes, ano)
+        if not tarefas:
+            return False
+        return await self.baixar_tarefas(tarefas, max_workers, requisicoes_por_segundo) > 0
+
+    async def repetir_falhas(self, max_workers=MAX_WORKERS_DOWNLOAD, requisicoes_por_segundo=REQUISICOES_POR_SEGUNDO):
+        """Baixa de novo só as faturas cuja última tentativa registrada no diário falhou"""
+        if not self.login_completo or self.diario is None:
+            return False
+
+        tarefas = await asyncio.to_thread(self._tarefas_com_falha)
+        if not tarefas:
+            return True
+        return await self.baixar_tarefas(tarefas, max_workers, requisicoes_por_segundo) == len(tarefas)
+
+    async def baixar_tarefas(self, tarefas, max_workers=MAX_WORKERS_DOWNLOAD,
+                             requisicoes_por_segundo=REQUISICOES_POR_SEGUNDO):
+        """
+        Baixa uma lista de (unidade, mes, ano); retorna quantas faturas estão no disco ao final.
+        A contagem por resultado (baixada, ja_baixada, sem_fatura, falha) fica em self.resultados.
+        """
+        self.resultados = Counter()
+        self.limitador = LimitadorTaxaAsync(requisicoes_por_segundo) if requisicoes_por_segundo else None
+        semaforo = asyncio.Semaphore(max_workers)
+
+        async def baixar(unidade, mes, ano):
+            async with semaforo:
+                self.resultados[await self.baixar_fatura(unidade['cdc'], unidade['digitoVerificadorCdc'],
+                                                         unidade['codigoEmpresaWeb'], mes, ano)] += 1
+
+        await asyncio.gather(*(baixar(unidade, mes, ano) for unidade, mes, ano in tarefas))
+        return self._resumo_downloads(len(tarefas))
+
+
+async def executar(documento, mes=mes_atual, ano=ano_atual, max_workers=MAX_WORKERS_DOWNLOAD,
+                   requisicoes_por_segundo=REQUISICOES_POR_SEGUNDO, diario=None, calendario=None,
+                   repetir_falhas=False):
+    """
+    Login + download de todas as unidades do documento (ou, com repetir_falhas, só das faturas que
+    falharam no diário). Retorna as UCs que falharam, ou None se o login falhou.
+    """
+    async with EnergisaAutomacaoAsync(documento) as automacao:
+        automacao.diario = diario
+        automacao.calendario = calendario
+        if not await automacao.executar_login_automatico():
+            logging.error("Falha no login.")
+            return None
+        logging.info("Login concluído! Iniciando download das faturas...")
+        if repetir_falhas:
+            await automacao.repetir_falhas(max_workers, requisicoes_por_segundo)
+        else:
+            await automacao.baixar_faturas_para_todas_unidades(mes, ano, max_workers, requisicoes_por_segundo)
+        return automacao.falhas_uc
@@ -1,10 +1,19 @@
-import requests
-import msal
 import json
 import os
+import argparse
 import time
 import re
+import random
+import threading
+from contextlib import nullcontext
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from curl_cffi import requests as curl_requests
+from cache_sessao import CacheSessao, CAMPOS_TOKENS
+from arquivo_fatura import GravadorPdf, fatura_ja_baixada
+from diario_tentativas import DiarioTentativas, CAMINHO_DIARIO_PADRAO, chave_unidade, unidade_da_chave
+from calendario_faturamento import CalendarioFaturamento
+from leitor_codigo_graph import LeitorCodigoSeguranca, token_graph_msal, agora_utc, TEMPO_LIMITE
 from dotenv import load_dotenv
 from datetime import datetime
 import logging
@@ -27,16 +36,75 @@ logging.basicConfig(
 
 error_uc=[]
 
-class EnergisaAutomacao:
-    BASE_URL = "https://servicos.energisa.com.br"
-
-    def __init__(self, documento):
+# Download concorrente: quantidade de downloads simultâneos e limite de requisições por segundo
+# (todas as threads somadas), para ficar abaixo do throttling da Energisa
+MAX_WORKERS_DOWNLOAD = int(os.getenv('ENERGISA_MAX_WORKERS', 4))
+REQUISICOES_POR_SEGUNDO = float(os.getenv('ENERGISA_REQUISICOES_POR_SEGUNDO', 2))
+MAX_TENTATIVAS_DOWNLOAD = 4
+BACKOFF_BASE = 2  # segundos; dobra a cada nova tentativa
+STATUS_REPETIR = {429, 500, 502, 503, 504}
+STATUS_SESSAO_INVALIDA = {401, 403, 429}
+
+# Resultados de baixar_fatura
+BAIXADA = 'baixada'
+JA_BAIXADA = 'ja_baixada'
+SEM_FATURA = 'sem_fatura'
+FALHA = 'falha'
+
+# Renovação dos tokens em cache pelo refresh token (endpoint do portal; sobrescrevível se a Energisa mudar a rota)
+URL_RENOVAR_TOKEN = os.getenv('ENERGISA_URL_RENOVAR_TOKEN', "/api/autenticacao/UsuarioClienteEnergisa/RefreshToken")
+
+HEADERS_SESSAO = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Content-Type': 'application/json'
+}
+PASTA_FATURAS = "faturas"  # PDFs baixados (relativa ao diretório de execução)
+UNIDADE_LOGIN = {"codigoEmpresaWeb": "6", "cdc": "3359145", "digitoVerificador": "4", "posicao": "0"}
+
+# Passos produzidos pelos fluxos da EnergisaBase (geradores _passos_*); cada variante os executa com o
+# próprio transporte e devolve o resultado ao gerador (ou a exceção, que o fluxo trata como antes)
+PASSO_HTTP = 'http'        # (PASSO_HTTP, metodo, url, kwargs) -> resposta da sessão curl_cffi
+PASSO_ARQUIVO = 'arquivo'  # (PASSO_ARQUIVO, funcao, args) -> retorno; disco (no asyncio, em asyncio.to_thread)
+PASSO_CODIGO = 'codigo'    # (PASSO_CODIGO, solicitado_em, tempo_limite) -> código lido no e-mail (ou None)
+
+
+class LimitadorTaxa:
+    """Token bucket compartilhado entre as threads: no máximo `requisicoes_por_segundo` em média"""
+
+    def __init__(self, requisicoes_por_segundo, rajada=1):
+        self.intervalo = 1.0 / requisicoes_por_segundo
+        self.capacidade = rajada
+        self.fichas = rajada
+        self.ultima = time.monotonic()
+        self.lock = threading.Lock()
+
+    def aguardar(self):
+        while True:
+            with self.lock:
+                agora = time.monotonic()
+                self.fichas = min(self.capacidade, self.fichas + (agora - self.ultima) / self.intervalo)
+                self.ultima = agora
+                if self.fichas >= 1:
+                    self.fichas -= 1
+                    return
+                espera = (1 - self.fichas) * self.intervalo
+            time.sleep(espera)
+
+
+class EnergisaBase:
+    """
+    Estado e fluxo do login, comuns à EnergisaAutomacao (curl_cffi síncrono, threads) e à
+    EnergisaAutomacaoAsync (Download_faturas_async.py). O fluxo (cache de sessão, renovação dos tokens,
+    código por e-mail, validação, consulta das unidades) é escrito uma vez, como geradores que montam as
+    requisições, produzem passos (PASSO_*) e interpretam as respostas; cada variante só executa os passos
+    com o seu transporte em `_executar_passos`. A sessão curl_cffi de cada variante fica em `self.session`.
+    """
+    # Sobrescrevível para apontar para o portal simulado (mock_energisa.py) nos testes de carga
+    BASE_URL = os.getenv('ENERGISA_BASE_URL', "https://servicos.energisa.com.br")
+
+    def __init__(self, documento, cache=None):
         self.documento = documento
-        self.session = curl_requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Content-Type': 'application/json'
-        })
+        self.cache = cache if cache is not None else CacheSessao()
         self.access_token = None
         self.udk_token = None
         self.utk_token = None
@@ -44,39 +112,287 @@ class EnergisaAutomacao:
         self.retk_token = None
         self.unidades_encontradas = []
         self.login_completo = False
+        self.codigo_solicitado_em = None
+        self.faturas_puladas = []
+        self.limitador = None
+        self.session = None
+        self.resultados = Counter()
+        self.falhas_uc = []
+        self.calendario = None  # CalendarioFaturamento opcional (calendario_faturamento.py)
+        self.faturas_adiadas = []
+        self.diario = None  # DiarioTentativas opcional (diario_tentativas.py)
+        # Lock opcional em volta do login por código no e-mail (várias automações lendo a mesma caixa)
+        self.lock_codigo_email = None
+
+    # ---- Cache da sessão (cache_sessao.py) ----
+
+    def _tokens(self):
+        return {campo: getattr(self, campo) for campo in CAMPOS_TOKENS}
+
+    def _payload_tokens(self):
+        return {"ate": self.access_token, "udk": self.udk_token, "utk": self.utk_token,
+                "refreshToken": self.refresh_token, "retk": self.retk_token}
+
+    def _salvar_sessao(self, sessao):
+        cookies = [{'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path} for c in sessao.cookies.jar]
+        try:
+            self.cache.salvar(self.documento, self._tokens(), cookies)
+        except OSError as e:
+            logging.warning(f"Não foi possível salvar o cache de sessão: {e}")
+
+    def _restaurar_sessao(self, dados, sessao):
+        for campo, valor in dados.get('tokens', {}).items():
+            if campo in CAMPOS_TOKENS:
+                setattr(self, campo, valor)
+        for cookie in dados.get('cookies', []):
+            sessao.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'])
+
+    def _aplicar_tokens_renovados(self, dados):
+        """Atualiza os tokens com a resposta da renovação; False se a Energisa recusou"""
+        infos = dados.get("infos") or {}
+        if dados.get("errored") or not isinstance(infos, dict):
+            return False
+        self.access_token = infos.get("ate") or infos.get("accessTokenEnergisa") or self.access_token
+        self.udk_token = infos.get("udk", self.udk_token)
+        self.utk_token = infos.get("utk", self.utk_token)
+        self.refresh_token = infos.get("refreshToken", self.refresh_token)
+        self.retk_token = infos.get("retk", self.retk_token)
+        return True
+
+    def _descartar_cache(self):
+        logging.info("Sessão em cache inválida; será feito o login por código de segurança.")
+        self.cache.apagar(self.documento)
+        self.access_token = self.udk_token = self.utk_token = self.refresh_token = self.retk_token = None
+        self.login_completo = False
+        return False
+
+    def _obter_token_graph(self):
+        try:
+            logging.debug("Obtendo token do Microsoft Graph...")
+            token = token_graph_msal()
+            if token:
+                logging.info("Token Graph obtido com sucesso.")
+            return token
+        except Exception as e:
+            logging.exception("Erro ao obter token Graph")
+            return None
+
+    def _extrair_codigo_html(self, html):
+        digitos = re.findall(r'<td><div[^>]*><p[^>]*>(\d)</p></div></td>', html)
+        if digitos and len(digitos) >= 4:
+            return ''.join(digitos[:4])
+
+        texto = re.sub(r'<[^>]+>', ' ', html)
+        texto = re.sub(r'\s+', ' ', texto)
+        match = re.search(r'código de segurança[^\d]*(\d)\s*(\d)\s*(\d)\s*(\d)', texto, re.IGNORECASE)
+        return ''.join(match.groups()) if match else None
+
+    def _mapear_unidades(self, unidades_data):
+        """Converte a resposta da API nas unidades usadas no download (só as ativas)"""
+        logging.info(f" {len(unidades_data)} unidades encontradas:")
+
+        unidades_mapeadas = []
+        for uc in unidades_data:
+            unidade = {
+                'cdc': uc.get('numeroUc'),
+                'digitoVerificadorCdc': uc.get('digitoVerificador'),
+                'codigoEmpresaWeb': uc.get('codigoEmpresaWeb'),
+                'endereco': f"{uc.get('endereco', '')}, {uc.get('complemento', '')}",
+                'nome': uc.get('nomeTitular'),
+                'cidade': uc.get('nomeMunicipio'),
+                'situacao': 'ATIVA' if uc.get('ucAtiva') else 'INATIVA'
+            }
+            if unidade['situacao'] == 'INATIVA':
+                pass
+            else:
+                unidades_mapeadas.append(unidade)
+                logging.info(f"  UC: {unidade['codigoEmpresaWeb']}/{unidade['cdc']}-{unidade['digitoVerificadorCdc']} | {unidade['nome']} | STATUS: {unidade['situacao']}")
+
+
+        return unidades_mapeadas
+
+    def _payload_download(self, cdc, digito_verificador, codigo_empresa, mes, ano):
+        # Paylod usando as mesma chamadas do postman
+        return {
+            "codigoEmpresaWeb": codigo_empresa,
+            "cdc": cdc,
+            "digitoVerificadorCdc": digito_verificador,
+            "ano": ano,
+            "mes": mes,
+            "cdcRed": None,
+            "fatura": 0,
+            "ate": self.access_token,
+            "udk": self.udk_token,
+            "utk": self.utk_token,
+            "refreshToken": self.refresh_token,
+            "retk": self.retk_token
+        }
+
+    @staticmethod
+    def _headers_download(cookies):
+        # Headers iguais ao usados no postman
+        return {
+            'User-Agent': 'Mozilla/5.0 (Linux; Android 6.0; Nexus 5 Build/MRA58N) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Mobile Safari/537.36',
+            'Content-Type': 'application/json',
+            'Cookie': "; ".join([f"{k}={v}" for k, v in cookies.items()])
+        }
+
+    @staticmethod
+    def _caminho_fatura(cdc, digito_verificador, codigo_empresa, mes, ano):
+        # mes pode vir como texto ('05'), então é convertido antes de formatar
+        return fr"{PASTA_FATURAS}/Data_{ano}-{int(mes):02d}_UC_{codigo_empresa}{cdc}{digito_verificador}.pdf"
+
+    # ---- Resultado dos downloads ----
+
+    @staticmethod
+    def _resultado_sem_pdf(gravador):
+        """(resultado, erro) de um 200 cujo corpo não virou PDF"""
+        # 200 com JSON/HTML no lugar do PDF é a resposta do portal para mês sem fatura
+        if gravador.motivo == 'nao_pdf':
+            return SEM_FATURA, "resposta sem PDF"
+        return FALHA, f"PDF incompleto ({gravador.tamanho} bytes)"
+
+    @staticmethod
+    def _resultado_erro_http(status_http):
+        # 4xx fora de STATUS_SESSAO_INVALIDA: o portal recusou esta fatura, repetir não adianta
+        if 400 <= status_http < 500 and status_http not in STATUS_SESSAO_INVALIDA:
+            return SEM_FATURA
+        return FALHA
+
+    def _registrar_tentativa(self, cdc, digito_verificador, codigo_empresa, mes, ano, resultado, status_http, erro,
+                             duracao):
+        """Registra a tentativa no diário (se houver) e guarda em falhas_uc as que falharam"""
+        if self.diario is not None:
+            self.diario.registrar('download', self.documento, chave_unidade(codigo_empresa, cdc, digito_verificador),
+                                  resultado, mes=mes, ano=ano,
+                                  caminho=self._caminho_fatura(cdc, digito_verificador, codigo_empresa, mes, ano),
+                                  http=status_http, erro=erro, duracao=duracao)
+        if resultado == FALHA:
+            self.falhas_uc.append(fr"{cdc}-{digito_verificador} ({int(mes):02d}/{ano})")
+
+    def _tarefas_do_mes(self, mes, ano):
+        """(unidade, mes, ano) de todas as unidades, menos as adiadas pelo calendário (se houver)"""
+        tarefas = [(unidade, mes, ano) for unidade in self.unidades_encontradas]
+        if self.calendario is not None:
+            # Só pede ao portal as faturas que o histórico indica já estarem emitidas
+            tarefas, self.faturas_adiadas = self.calendario.filtrar(
+                tarefas, lambda u: chave_unidade(u['codigoEmpresaWeb'], u['cdc'], u['digitoVerificadorCdc']))
+            if self.faturas_adiadas:
+                logging.info(f"{len(self.faturas_adiadas)} UC(s) adiada(s): fatura de {mes}/{ano} ainda não esperada")
+        return tarefas
+
+    def _tarefas_com_falha(self):
+        """(unidade, mes, ano) das faturas cuja última tentativa registrada no diário falhou"""
+        falhas = self.diario.falhas('download', self.documento)
+        logging.info(f"\nREPETINDO {len(falhas)} DOWNLOAD(S) COM FALHA...")
+        return [(unidade_da_chave(falha['chave']), falha['mes'], falha['ano']) for falha in falhas]
+
+    def _resumo_downloads(self, total_tarefas):
+        total_baixadas = self.resultados[BAIXADA] + self.resultados[JA_BAIXADA]
+        logging.info(f"\nTOTAL: {total_baixadas}/{total_tarefas} faturas baixadas"
+                     + (f" ({len(self.faturas_puladas)} já existiam)" if self.faturas_puladas else ""))
+        return total_baixadas
+
+    # ---- Fluxo do login (geradores de passos) ----
+
+    def _http(self, metodo, caminho, **kwargs):
+        kwargs.setdefault('timeout', 15)
+        kwargs.setdefault('impersonate', "chrome110")
+        return PASSO_HTTP, metodo, f"{self.BASE_URL}{caminho}", kwargs
+
+    def _leitor_codigo(self):
+        return LeitorCodigoSeguranca(self._extrair_codigo_html, provedor_token=self._obter_token_graph)
+
+    def _passos_login(self):
+        if (yield from self._passos_login_pelo_cache()):
+            return True
 
-    def executar_login_automatico(self):
         logging.info("Iniciando login automático...")
 
-        if not self._obter_cookies_e_token():
+        if not (yield from self._passos_obter_cookies_e_token()):
             logging.error("Falha ao obter cookies e token.")
             return False
 
-        unidade_login = {"codigoEmpresaWeb": "6", "cdc": "3359145", "digitoVerificador": "4", "posicao": "0"}
+        unidade_login = UNIDADE_LOGIN
         logging.info(f"Usando unidade para login: UC {unidade_login['cdc']}")
 
-        if not self._solicitar_codigo_com_unidade(unidade_login):
-            logging.error("Falha ao solicitar código de segurança.")
+        with self.lock_codigo_email or nullcontext():
+            validado = yield from self._passos_login_por_codigo(unidade_login)
+        if not validado:
             return False
 
-        codigo = self._buscar_codigo_seguranca()
-        if not codigo:
-            logging.error("Código de segurança não encontrado.")
+        self.login_completo = True
+        logging.info("Login concluído com sucesso.")
+        self.unidades_encontradas = yield from self._passos_consultar_unidades()
+        yield PASSO_ARQUIVO, self._salvar_sessao, (self.session,)
+        return True
+
+    def _passos_login_por_codigo(self, unidade):
+        """
+        Solicita o código, espera o e-mail e valida; código recusado faz esperar o próximo e-mail até o
+        fim de TEMPO_LIMITE. True se validou, None se o código não foi solicitado ou nenhum válido chegou.
+        """
+        if not (yield from self._passos_solicitar_codigo(unidade)):
+            logging.error("Falha ao solicitar código de segurança.")
+            return None
+
+        logging.info("Aguardando o e-mail com o código de segurança...")
+        solicitado_em = self.codigo_solicitado_em or agora_utc()
+        prazo = time.monotonic() + TEMPO_LIMITE
+        while True:
+            codigo = yield PASSO_CODIGO, solicitado_em, prazo - time.monotonic()
+            if not codigo:
+                logging.error("Código de segurança não encontrado.")
+                return None
+            if (yield from self._passos_validar_codigo(codigo)):
+                return True
+            # Código recusado (ex.: e-mail de outro login): o leitor não o devolve mais, espera o próximo
+            logging.warning("Código de segurança recusado; aguardando outro e-mail...")
+
+    def _passos_renovar_tokens(self):
+        try:
+            response = yield self._http('POST', URL_RENOVAR_TOKEN, json=self._payload_tokens())
+            return response.ok and self._aplicar_tokens_renovados(response.json())
+        except Exception as e:
+            logging.info(f"Falha ao renovar os tokens: {e}")
             return False
 
-        if self._validar_codigo(codigo):
-            self.login_completo = True
-            logging.info("Login concluído com sucesso.")
-            self.unidades_encontradas = self.consultar_unidades_consumidoras()
-            return True
+    def _passos_ativar_sessao(self):
+        """Confirma que os tokens funcionam consultando as unidades"""
+        self.login_completo = True
+        self.unidades_encontradas = yield from self._passos_consultar_unidades()
+        if not self.unidades_encontradas:
+            self.login_completo = False
+        return self.login_completo
 
-        logging.warning("Validação de código falhou.")
-        return False
+    def _passos_login_pelo_cache(self):
+        """Reaproveita os tokens salvos (renovando se estiverem perto de expirar); o e-mail só é usado se falhar"""
+        dados = yield PASSO_ARQUIVO, self.cache.carregar, (self.documento,)
+        if not dados:
+            return False
 
-    def _obter_cookies_e_token(self):
+        logging.info("Sessão encontrada no cache. Reaproveitando tokens...")
+        self._restaurar_sessao(dados, self.session)
+        renovado = False
+        if self.cache.perto_de_expirar(dados):
+            logging.info("Tokens perto de expirar; renovando com o refresh token...")
+            renovado = yield from self._passos_renovar_tokens()
+            if not renovado:
+                return (yield PASSO_ARQUIVO, self._descartar_cache, ())
+
+        if not (yield from self._passos_ativar_sessao()):
+            # Tokens recusados: tenta uma renovação antes de desistir do cache
+            if renovado or not (yield from self._passos_renovar_tokens()) or not (yield from self._passos_ativar_sessao()):
+                return (yield PASSO_ARQUIVO, self._descartar_cache, ())
+
+        yield PASSO_ARQUIVO, self._salvar_sessao, (self.session,)
+        logging.info("Login reaproveitado do cache (código por e-mail dispensado).")
+        return True
+
+    def _passos_obter_cookies_e_token(self):
         try:
-            self.session.get(f"{self.BASE_URL}/login", timeout=15, impersonate="chrome110")
-            response = self.session.get(f"{self.BASE_URL}/api/auth", timeout=15, impersonate="chrome110")
+            yield self._http('GET', "/login")
+            response = yield self._http('GET', "/api/auth")
             auth_data = response.json()
             if auth_data.get("autenticated"):
                 self.access_token = auth_data.get('accessTokenEnergisa')
@@ -86,96 +402,23 @@ class EnergisaAutomacao:
             logging.error(f"Falha na autenticação: {e}")
         return False
 
-    def _solicitar_codigo_com_unidade(self, unidade):
+    def _passos_solicitar_codigo(self, unidade):
         payload = {"ate": self.access_token, "udk": "", "utk": "", "refreshToken": "", "retk": ""}
+        self.codigo_solicitado_em = agora_utc()
         try:
-            response = self.session.post(
-                f"{self.BASE_URL}/api/autenticacao/CodigoSeguranca/EmailPorUC",
-                params=unidade, json=payload, timeout=15, impersonate="chrome110"
-            )
+            response = yield self._http('POST', "/api/autenticacao/CodigoSeguranca/EmailPorUC",
+                                        params=unidade, json=payload)
             logging.info("Código solicitado")
             return response.ok
         except Exception as e:
             logging.error(f"Falha ao solicitar código: {e}")
             return False
 
-    def _buscar_codigo_seguranca(self, max_tentativas=8, intervalo=10, espera_inicial=30):
-        logging.info(f"Aguardando {espera_inicial}s para email...")
-        time.sleep(espera_inicial)
-
-        graph_token = self._obter_token_graph()
-        if not graph_token:
-            return None
-
-        for tentativa in range(max_tentativas):
-            logging.info(f"Tentativa {tentativa + 1}/{max_tentativas}...")
-            emails = self._buscar_emails(graph_token)
-
-            for email in emails:
-                if self._is_email_valido(email):
-                    codigo = self._extrair_codigo_html(email.get('body', {}).get('content', ''))
-                    if codigo:
-                        logging.info(f"CÓDIGO ENCONTRADO: {codigo}")
-                        return codigo
-
-            if tentativa < max_tentativas - 1:
-                time.sleep(intervalo)
-        return None
-
-    def _obter_token_graph(self):
-        try:
-            logging.debug("Obtendo token do Microsoft Graph...")
-            autoridade = f"https://login.microsoftonline.com/{os.getenv('GRAPH_TENANT_ID')}"
-            aplicacao = msal.ConfidentialClientApplication(
-                client_id=os.getenv('GRAPH_CLIENT_ID'),
-                authority=autoridade,
-                client_credential=os.getenv('GRAPH_CLIENT_SECRET')
-            )
-            resultado = aplicacao.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
-            token = resultado.get('access_token')
-            if token:
-                logging.info("Token Graph obtido com sucesso.")
-            else:
-                logging.error(f"Falha ao obter token Graph: {resultado}")
-            return token
-        except Exception as e:
-            logging.exception("Erro ao obter token Graph")
-            return None
-
-    def _buscar_emails(self, token):
-        try:
-            headers = {'Authorization': f'Bearer {token}'}
-            url = f"https://graph.microsoft.com/v1.0/users/{os.getenv('BOT_USER_EMAIL')}/mailFolders/{os.getenv('BOT_EMAIL_FOLDER')}/messages"
-            params = {'$select': 'id,subject,receivedDateTime,body,from', '$orderby': 'receivedDateTime desc',
-                      '$top': 5}
-            response = requests.get(url, headers=headers, params=params)
-            return response.json().get('value', [])
-        except:
-            return []
-
-    def _is_email_valido(self, email):
-        remetente = email.get('from', {}).get('emailAddress', {}).get('address', '').lower()
-        assunto = email.get('subject', '').lower()
-        return (remetente == "sistemas@sac.energisa.com.br".lower() and
-                "código de segurança da energisa".lower() in assunto)
-
-    def _extrair_codigo_html(self, html):
-        digitos = re.findall(r'<td><div[^>]*><p[^>]*>(\d)</p></div></td>', html)
-        if digitos and len(digitos) >= 4:
-            return ''.join(digitos[:4])
-
-        texto = re.sub(r'<[^>]+>', ' ', html)
-        texto = re.sub(r'\s+', ' ', texto)
-        match = re.search(r'código de segurança[^\d]*(\d)\s*(\d)\s*(\d)\s*(\d)', texto, re.IGNORECASE)
-        return ''.join(match.groups()) if match else None
-
-    def _validar_codigo(self, codigo):
+    def _passos_validar_codigo(self, codigo):
         params = {"doc": self.documento, "codigoSegurancaRecebido": codigo}
         try:
-            response = self.session.post(
-                f"{self.BASE_URL}/api/autenticacao/UsuarioClienteEnergisa/Autenticacao/PorCpfCnpj",
-                params=params, timeout=15, impersonate="chrome110"
-            )
+            response = yield self._http('POST', "/api/autenticacao/UsuarioClienteEnergisa/Autenticacao/PorCpfCnpj",
+                                        params=params)
             dados = response.json()
             infos = dados.get("infos", {})
 
@@ -190,118 +433,180 @@ class EnergisaAutomacao:
             logging.info(f" Falha na validação: {e}")
         return False
 
-    def consultar_unidades_consumidoras(self):
+    def _passos_consultar_unidades(self):
         if not self.login_completo:
             return []
 
-        url = f"{self.BASE_URL}/api/usuarios/UnidadeConsumidora?doc={self.documento}"
-        payload = {
-            "ate": self.access_token,
-            "udk": self.udk_token,
-            "utk": self.utk_token,
-            "refreshToken": self.refresh_token,
-            "retk": self.retk_token
-        }
-
         try:
             logging.info("Consultando unidades...")
-            response = self.session.post(url, json=payload, timeout=15, impersonate="chrome110")
-            resposta = response.json()
-
-            unidades_data = resposta.get("infos", [])
-
-            logging.info(f" {len(unidades_data)} unidades encontradas:")
-
-            unidades_mapeadas = []
-            for uc in unidades_data:
-                unidade = {
-                    'cdc': uc.get('numeroUc'),
-                    'digitoVerificadorCdc': uc.get('digitoVerificador'),
-                    'codigoEmpresaWeb': uc.get('codigoEmpresaWeb'),
-                    'endereco': f"{uc.get('endereco', '')}, {uc.get('complemento', '')}",
-                    'nome': uc.get('nomeTitular'),
-                    'cidade': uc.get('nomeMunicipio'),
-                    'situacao': 'ATIVA' if uc.get('ucAtiva') else 'INATIVA'
-                }
-                if unidade['situacao'] == 'INATIVA':
-                    pass
-                else:
-                    unidades_mapeadas.append(unidade)
-                    logging.info(f"  UC: {unidade['codigoEmpresaWeb']}/{unidade['cdc']}-{unidade['digitoVerificadorCdc']} | {unidade['nome']} | STATUS: {unidade['situacao']}")
-
-
-            return unidades_mapeadas
-
+            response = yield self._http('POST', f"/api/usuarios/UnidadeConsumidora?doc={self.documento}",
+                                        json=self._payload_tokens())
+            return self._mapear_unidades(response.json().get("infos", []))
         except Exception as e:
             logging.error(f"Erro ao consultar unidades: {e}")
             return []
 
-    def baixar_fatura_direto(self, cdc, digito_verificador, codigo_empresa, mes=mes_atual, ano=ano_atual):
-        """Baixa fatura diretamente sem consultar primeiro (igual ao seu código que funciona)"""
+
+class EnergisaAutomacao(EnergisaBase):
+    def __init__(self, documento, cache=None):
+        super().__init__(documento, cache)
+        self.session = curl_requests.Session()
+        self.session.headers.update(HEADERS_SESSAO)
+        self._local = threading.local()
+
+    def executar_login_automatico(self):
+        return self._executar_passos(self._passos_login())
+
+    def consultar_unidades_consumidoras(self):
+        return self._executar_passos(self._passos_consultar_unidades())
+
+    def _executar_passos(self, passos):
+        """Executa um fluxo da EnergisaBase na thread atual; exceções do transporte voltam para o fluxo"""
+        resposta, erro = None, None
+        while True:
+            try:
+                passo = passos.throw(erro) if erro is not None else passos.send(resposta)
+            except StopIteration as fim:
+                return fim.value
+            resposta, erro = None, None
+            try:
+                resposta = self._executar_passo(passo)
+            except Exception as e:
+                erro = e
+
+    def _executar_passo(self, passo):
+        tipo = passo[0]
+        if tipo == PASSO_HTTP:
+            _, metodo, url, kwargs = passo
+            return self.session.request(metodo, url, **kwargs)
+        if tipo == PASSO_ARQUIVO:
+            _, funcao, args = passo
+            return funcao(*args)
+        _, solicitado_em, tempo_limite = passo
+        return self._leitor_codigo().aguardar_codigo(solicitado_em, tempo_limite)
+
+    def _sessao_da_thread(self):
+        """
+        Sessão curl_cffi da thread atual (a Session não é thread-safe).
+        Os tokens ficam no objeto e os cookies do login vão no header, então todas as threads usam o mesmo login.
+        """
+        if threading.current_thread() is threading.main_thread():
+            return self.session
+        sessao = getattr(self._local, 'sessao', None)
+        if sessao is None:
+            sessao = curl_requests.Session()
+            sessao.headers.update(dict(self.session.headers))
+            self._local.sessao = sessao
+        return sessao
+
+    def _post_com_retentativa(self, url, **kwargs):
+        """POST respeitando o limite de taxa; 429/5xx e falhas de conexão são repetidos com backoff exponencial"""
+        sessao = self._sessao_da_thread()
+        for tentativa in range(MAX_TENTATIVAS_DOWNLOAD):
+            response = None
+            if self.limitador:
+                self.limitador.aguardar()
+            try:
+                response = sessao.post(url, **kwargs)
+            except Exception as e:
+                if tentativa == MAX_TENTATIVAS_DOWNLOAD - 1:
+                    raise
+                logging.warning(f"Falha na requisição ({e}). Tentativa {tentativa + 1}/{MAX_TENTATIVAS_DOWNLOAD}")
+            else:
+                if response.status_code not in STATUS_REPETIR or tentativa == MAX_TENTATIVAS_DOWNLOAD - 1:
+                    return response
+                logging.warning(f"Status {response.status_code}. Tentativa {tentativa + 1}/{MAX_TENTATIVAS_DOWNLOAD}")
+                if kwargs.get('stream'):
+                    response.close()
+
+            espera = BACKOFF_BASE * 2 ** tentativa + random.uniform(0, 1)
+            retry_after = response.headers.get('Retry-After') if response is not None else None
+            if retry_after and retry_after.isdigit():
+                espera = max(espera, int(retry_after))
+            time.sleep(espera)
+
+    def baixar_fatura(self, cdc, digito_verificador, codigo_empresa, mes=mes_atual, ano=ano_atual):
+        """
+        Baixa a fatura do mês e retorna o resultado: 'baixada', 'ja_baixada', 'sem_fatura'
+        (o portal respondeu, mas não há PDF para o mês) ou 'falha' (vale tentar de novo).
+        Com self.diario, cada tentativa fica registrada (status, código HTTP, erro e duração).
+        """
+        inicio = time.monotonic()
+        resultado, status_http, erro = self._baixar_fatura(cdc, digito_verificador, codigo_empresa, mes, ano)
+        self._registrar_tentativa(cdc, digito_verificador, codigo_empresa, mes, ano, resultado, status_http, erro,
+                                  time.monotonic() - inicio)
+        return resultado
+
+    def _baixar_fatura(self, cdc, digito_verificador, codigo_empresa, mes, ano):
+        """Retorna (resultado, código HTTP, erro)"""
         if not self.login_completo or not cdc:
-            return False
+            return FALHA, None, "sessão não autenticada"
 
-        logging.info(f"\nINICIANDO DOWNLOAD DA FATURA PARA CDC {cdc}...")
-        # Paylod usando as mesma chamadas do postman
-        payload = {
-            "codigoEmpresaWeb": codigo_empresa,
-            "cdc": cdc,
-            "digitoVerificadorCdc": digito_verificador,
-            "ano": ano,
-            "mes": mes,
-            "cdcRed": None,
-            "fatura": 0,
-            "ate": self.access_token,
-            "udk": self.udk_token,
-            "utk": self.utk_token,
-            "refreshToken": self.refresh_token,
-            "retk": self.retk_token
-        }
+        # Reexecuções só baixam o que falta: PDF do mês já baixado e íntegro é pulado
+        nome_arquivo = self._caminho_fatura(cdc, digito_verificador, codigo_empresa, mes, ano)
+        if fatura_ja_baixada(nome_arquivo):
+            logging.info(f"CDC {cdc}: fatura já baixada ({nome_arquivo}), pulando.")
+            self.faturas_puladas.append(nome_arquivo)
+            return JA_BAIXADA, None, None
 
-        # Headers iguais ao usados no postman
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Linux; Android 6.0; Nexus 5 Build/MRA58N) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Mobile Safari/537.36',
-            'Content-Type': 'application/json',
-            'Cookie': "; ".join([f"{k}={v}" for k, v in self.session.cookies.get_dict().items()])
-        }
+        logging.info(f"\nINICIANDO DOWNLOAD DA FATURA PARA CDC {cdc}...")
+        payload = self._payload_download(cdc, digito_verificador, codigo_empresa, mes, ano)
+        headers = self._headers_download(self.session.cookies.get_dict())
+        status_http = None
 
         try:
-            response = self.session.post(
+            response = self._post_com_retentativa(
                 f"{self.BASE_URL}/api/clientes/SegundaVia/Download",
                 json=payload,
                 headers=headers,
                 timeout=30,
-                impersonate="chrome110"
+                impersonate="chrome110",
+                stream=True
             )
 
-            logging.info(f"Status: {response.status_code}")
-
-            if response.status_code == 200:
-                if response.content.startswith(b'%PDF'):
-                    # Salva o PDF
-                    nome_arquivo = fr"faturas/Data_{ano}-{mes:02d}_UC_{codigo_empresa}{cdc}{digito_verificador}.pdf"
-                    os.makedirs("../faturas", exist_ok=True)
-
-                    with open(nome_arquivo, 'wb') as f:
-                        f.write(response.content)
-
-                    logging.info(f"PDF salvo: {nome_arquivo}")
-                    return True
-                else:
-                    logging.error("Resposta não é PDF válido")
-                    logging.error(f"Conteúdo: {response.text[:200]}...")
+            try:
+                status_http = response.status_code
+                logging.info(f"Status: {response.status_code}")
+
+                if response.status_code == 200:
+                    # Grava em blocos num .part; só vira o PDF final se vier completo
+                    gravador = GravadorPdf(nome_arquivo)
+                    try:
+                        for bloco in response.iter_content():
+                            gravador.escrever(bloco)
+                    except Exception:
+                        gravador.descartar()
+                        raise
+
+                    if gravador.concluir():
+                        logging.info(f"PDF salvo: {nome_arquivo}")
+                        return BAIXADA, status_http, None
                     error_uc.append(fr"{cdc}-{digito_verificador}")
-            else:
-                logging.info(f"Erro {response.status_code}: {response.text}")
+                    resultado, erro = self._resultado_sem_pdf(gravador)
+                    return resultado, status_http, erro
+
+                corpo = b''.join(response.iter_content()).decode('utf-8', errors='replace')
+                logging.info(f"Erro {response.status_code}: {corpo}")
                 error_uc.append(fr"{cdc}-{digito_verificador}")
+                return self._resultado_erro_http(status_http), status_http, corpo[:500]
+            finally:
+                response.close()
 
         except Exception as e:
             logging.error(f"Erro no download: {e}")
+            return FALHA, status_http, f"{type(e).__name__}: {e}"
 
-        return False
-
-    def baixar_faturas_para_todas_unidades(self, mes=mes_atual, ano=ano_atual):
-        """Tenta baixar faturas para todas as unidades encontradas"""
+    def baixar_fatura_direto(self, cdc, digito_verificador, codigo_empresa, mes=mes_atual, ano=ano_atual):
+        """Baixa fatura diretamente sem consultar primeiro (igual ao seu código que funciona)"""
+        return self.baixar_fatura(cdc, digito_verificador, codigo_empresa, mes, ano) in (BAIXADA, JA_BAIXADA)
+
+    def baixar_faturas_para_todas_unidades(self, mes=mes_atual, ano=ano_atual, max_workers=1,
+                                           requisicoes_por_segundo=None, limitador=None):
+        """
+        Tenta baixar faturas para todas as unidades encontradas.
+        Com max_workers > 1 os downloads são feitos em paralelo, limitados a requisicoes_por_segundo
+        (ou a um `limitador` compartilhado com outras sessões).
+        """
         if not self.login_completo:
             return False
 
@@ -311,35 +616,108 @@ class EnergisaAutomacao:
             logging.info("Nenhuma unidade disponível")
             return False
 
-        total_baixadas = 0
+        tarefas = self._tarefas_do_mes(mes, ano)
+        if not tarefas:
+            return False
+        return self.baixar_tarefas(tarefas, max_workers, requisicoes_por_segundo, limitador) > 0
 
-        for unidade in self.unidades_encontradas:
-            cdc = unidade['cdc']
+    def repetir_falhas(self, max_workers=1, requisicoes_por_segundo=None):
+        """Baixa de novo só as faturas cuja última tentativa registrada no diário falhou"""
+        if not self.login_completo or self.diario is None:
+            return False
 
-            # Tentar baixar fatura diretamente
-            if self.baixar_fatura_direto(
+        tarefas = self._tarefas_com_falha()
+        if not tarefas:
+            return True
+        return self.baixar_tarefas(tarefas, max_workers, requisicoes_por_segundo) == len(tarefas)
+
+    def baixar_tarefas(self, tarefas, max_workers=1, requisicoes_por_segundo=None, limitador=None):
+        """
+        Baixa uma lista de (unidade, mes, ano); retorna quantas faturas estão no disco ao final.
+        A contagem por resultado (baixada, ja_baixada, sem_fatura, falha) fica em self.resultados.
+        """
+        self.resultados = Counter()
+        self.limitador = limitador or (LimitadorTaxa(requisicoes_por_segundo) if requisicoes_por_segundo else None)
+
+        if max_workers > 1:
+            logging.info(f"Download concorrente: {max_workers} workers, "
+                         f"{requisicoes_por_segundo or 'sem limite de'} requisições/s")
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="download") as executor:
+                futuros = [
+                    executor.submit(self.baixar_fatura, unidade['cdc'], unidade['digitoVerificadorCdc'],
+                                    unidade['codigoEmpresaWeb'], mes, ano)
+                    for unidade, mes, ano in tarefas
+                ]
+                for futuro in as_completed(futuros):
+                    self.resultados[futuro.result()] += 1
+        else:
+            for unidade, mes, ano in tarefas:
+                cdc = unidade['cdc']
+
+                # Tentar baixar fatura diretamente
+                self.resultados[self.baixar_fatura(
                     cdc,
                     unidade['digitoVerificadorCdc'],
                     unidade['codigoEmpresaWeb'],
                     mes,
                     ano
-            ):
-                total_baixadas += 1
-
-        logging.info(f"\nTOTAL: {total_baixadas}/{len(self.unidades_encontradas)} faturas baixadas")
-
-        return total_baixadas > 0
-
-
-if __name__ == "__main__":
-    automacao = EnergisaAutomacao(documento="10425282000122")
+                )] += 1
+
+        return self._resumo_downloads(len(tarefas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download das faturas da Energisa de todas as UCs do documento")
+    parser.add_argument("--documento", default="10425282000122", help="CPF/CNPJ do titular")
+    parser.add_argument("--mes", type=int, default=int(mes_atual))
+    parser.add_argument("--ano", type=int, default=ano_atual)
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS_DOWNLOAD, help="Downloads simultâneos")
+    parser.add_argument("--requisicoes-por-segundo", type=float, default=REQUISICOES_POR_SEGUNDO)
+    parser.add_argument("--async", dest="modo_async", action="store_true",
+                        help="Usa a variante asyncio (curl_cffi AsyncSession) em um único event loop")
+    parser.add_argument("--diario", default=CAMINHO_DIARIO_PADRAO, help="SQLite com o diário das tentativas")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Baixa de novo só as faturas cuja última tentativa no diário falhou")
+    parser.add_argument("--pre-verificar", action="store_true",
+                        help="Pula as UCs cuja fatura do mês ainda não é esperada (calendário aprendido do diário)")
+    args = parser.parse_args()
+
+    diario = DiarioTentativas(args.diario)
+    calendario = CalendarioFaturamento.do_diario(diario, args.documento) if args.pre_verificar else None
+    inicio = time.time()
+
+    if args.modo_async:
+        import asyncio
+        from Download_faturas_async import executar
+
+        falhas = asyncio.run(executar(args.documento, args.mes, args.ano, args.workers, args.requisicoes_por_segundo,
+                                      diario=diario, calendario=calendario, repetir_falhas=args.retry_failed))
+        if falhas is not None:
+            logging.info(f"U/C que não baixaram a fatura: {falhas}")
+            logging.info(f"Diário desta execução: {diario.resumo(inicio)}")
+        diario.fechar()
+        return
+
+    automacao = EnergisaAutomacao(documento=args.documento)
+    automacao.diario = diario
+    automacao.calendario = calendario
 
     if automacao.executar_login_automatico():
         logging.info("Login concluído! Iniciando download das faturas...")
-        automacao.baixar_faturas_para_todas_unidades(mes=mes_atual, ano=ano_atual)
+        if args.retry_failed:
+            automacao.repetir_falhas(max_workers=args.workers, requisicoes_por_segundo=args.requisicoes_por_segundo)
+        else:
+            automacao.baixar_faturas_para_todas_unidades(mes=args.mes, ano=args.ano, max_workers=args.workers,
+                                                         requisicoes_por_segundo=args.requisicoes_por_segundo)
         logging.info(f"U/C que não baixaram a fatura: {error_uc}")
+        logging.info(f"Diário desta execução: {diario.resumo(inicio)}")
     else:
         logging.error("Falha no login.")
+    diario.fechar()
+
+
+if __name__ == "__main__":
+    main()
 
 #Classe EnergisaAutomacao - encapsula o comportamento e os dados para interagir com o site da energisa | a classe define as características (atributos) e as ações (métodos) que um objeto deve ter
 #Metodos/Funções - Os métodos são as funções definidas dentro da classe. Eles definem o que o objeto pode fazer.
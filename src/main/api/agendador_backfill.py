@@ -0,0 +1,269 @@
+import argparse
+import logging
+import os
+import sqlite3
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from Download_faturas_linux import (EnergisaAutomacao, LimitadorTaxa, MAX_WORKERS_DOWNLOAD, REQUISICOES_POR_SEGUNDO,
+                                    BAIXADA, JA_BAIXADA, SEM_FATURA, FALHA)
+
+# Backfill de vários meses: fila (UC x mês) gravada em SQLite
+# - cada tarefa passa por pendente -> em_andamento -> concluida | sem_fatura | falha
+# - o estado é gravado a cada tarefa; depois de uma queda, as tarefas que ficaram em_andamento
+#   voltam para pendente e a execução continua de onde parou
+# - mês em que o portal respondeu "sem fatura" para a UC vai para um cache negativo com validade;
+#   enquanto valer, a tarefa não é reenviada (mês recente tem validade curta: a fatura pode sair depois)
+# Uso: python agendador_backfill.py --de 2024-01 --ate 2025-06 [--documento ...] [--workers 4]
+
+CAMINHO_FILA_PADRAO = os.getenv('ENERGISA_BACKFILL_DB', './backfill_faturas.sqlite')
+VALIDADE_SEM_FATURA_DIAS = float(os.getenv('ENERGISA_VALIDADE_SEM_FATURA_DIAS', 7))
+VALIDADE_SEM_FATURA_RECENTE_HORAS = 12  # mês atual e anterior: a fatura ainda pode ser emitida
+MAX_TENTATIVAS_TAREFA = 3
+
+PENDENTE = 'pendente'
+EM_ANDAMENTO = 'em_andamento'
+CONCLUIDA = 'concluida'
+FALHA_DEFINITIVA = 'falha'
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS tarefas (
+    documento TEXT NOT NULL,
+    codigo_empresa TEXT NOT NULL,
+    cdc TEXT NOT NULL,
+    digito TEXT NOT NULL,
+    ano INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pendente',
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    resultado TEXT,
+    atualizado_em REAL,
+    PRIMARY KEY (documento, codigo_empresa, cdc, ano, mes)
+);
+CREATE INDEX IF NOT EXISTS ix_tarefas_status ON tarefas (documento, status, ano, mes);
+CREATE TABLE IF NOT EXISTS sem_fatura (
+    codigo_empresa TEXT NOT NULL,
+    cdc TEXT NOT NULL,
+    ano INTEGER NOT NULL,
+    mes INTEGER NOT NULL,
+    verificado_em REAL NOT NULL,
+    expira_em REAL NOT NULL,
+    PRIMARY KEY (codigo_empresa, cdc, ano, mes)
+);
+"""
+
+
+def ler_mes(texto):
+    """'AAAA-MM' -> (ano, mes)"""
+    data = datetime.strptime(texto, '%Y-%m')
+    return data.year, data.month
+
+
+def meses_entre(inicio, fim):
+    """Lista de (ano, mes) de `inicio` até `fim` ('AAAA-MM'), inclusive"""
+    ano, mes = ler_mes(inicio)
+    ano_fim, mes_fim = ler_mes(fim)
+    meses = []
+    while (ano, mes) <= (ano_fim, mes_fim):
+        meses.append((ano, mes))
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+    return meses
+
+
+def validade_sem_fatura(ano, mes, validade_dias=VALIDADE_SEM_FATURA_DIAS, agora=None):
+    """Segundos que um 'sem fatura' vale para o mês"""
+    agora = agora or datetime.now()
+    meses_atras = (agora.year - ano) * 12 + (agora.month - mes)
+    if meses_atras <= 1:
+        return VALIDADE_SEM_FATURA_RECENTE_HORAS * 3600
+    return validade_dias * 86400
+
+
+class FilaBackfill:
+    """Fila (UC x mês) em SQLite. Só a thread que criou a fila grava nela"""
+
+    def __init__(self, caminho=CAMINHO_FILA_PADRAO, validade_dias=VALIDADE_SEM_FATURA_DIAS):
+        self.caminho = caminho
+        self.validade_dias = validade_dias
+        self.conexao = sqlite3.connect(caminho)
+        self.conexao.row_factory = sqlite3.Row
+        self.conexao.execute("PRAGMA journal_mode=WAL")
+        self.conexao.executescript(ESQUEMA)
+
+    def fechar(self):
+        self.conexao.close()
+
+    def recuperar_interrompidas(self, documento):
+        """Tarefas que ficaram em_andamento numa execução que caiu voltam para a fila"""
+        with self.conexao:
+            cursor = self.conexao.execute(
+                "UPDATE tarefas SET status = ? WHERE documento = ? AND status = ?",
+                (PENDENTE, documento, EM_ANDAMENTO))
+        if cursor.rowcount:
+            logging.info(f"{cursor.rowcount} tarefa(s) interrompida(s) voltaram para a fila")
+        return cursor.rowcount
+
+    def popular(self, documento, unidades, meses, repetir_falhas=False):
+        """Cria as tarefas que ainda não existem e aplica o cache negativo. Retorna quantas foram criadas"""
+        agora = time.time()
+        linhas = [
+            (documento, str(unidade['codigoEmpresaWeb']), str(unidade['cdc']), str(unidade['digitoVerificadorCdc']),
+             ano, mes)
+            for unidade in unidades
+            for ano, mes in meses
+        ]
+        with self.conexao:
+            antes = self.conexao.total_changes
+            self.conexao.executemany(
+                "INSERT OR IGNORE INTO tarefas (documento, codigo_empresa, cdc, digito, ano, mes) "
+                "VALUES (?, ?, ?, ?, ?, ?)", linhas)
+            criadas = self.conexao.total_changes - antes
+
+            # "Sem fatura" vencido: o mês volta a ser consultado
+            self.conexao.execute(
+                "UPDATE tarefas SET status = ?, tentativas = 0 WHERE documento = ? AND status = ? "
+                "AND NOT EXISTS (SELECT 1 FROM sem_fatura s WHERE s.codigo_empresa = tarefas.codigo_empresa "
+                "AND s.cdc = tarefas.cdc AND s.ano = tarefas.ano AND s.mes = tarefas.mes AND s.expira_em > ?)",
+                (PENDENTE, documento, SEM_FATURA, agora))
+            # Pendente com "sem fatura" ainda válido (ex.: visto por outro documento) não é reenviada
+            self.conexao.execute(
+                "UPDATE tarefas SET status = ?, resultado = 'cache' WHERE documento = ? AND status = ? "
+                "AND EXISTS (SELECT 1 FROM sem_fatura s WHERE s.codigo_empresa = tarefas.codigo_empresa "
+                "AND s.cdc = tarefas.cdc AND s.ano = tarefas.ano AND s.mes = tarefas.mes AND s.expira_em > ?)",
+                (SEM_FATURA, documento, PENDENTE, agora))
+            if repetir_falhas:
+                self.conexao.execute(
+                    "UPDATE tarefas SET status = ?, tentativas = 0 WHERE documento = ? AND status = ?",
+                    (PENDENTE, documento, FALHA_DEFINITIVA))
+        return criadas
+
+    def reservar(self, documento):
+        """Próxima tarefa pendente (mais antiga primeiro), já marcada em_andamento; None se a fila acabou"""
+        with self.conexao:
+            tarefa = self.conexao.execute(
+                "SELECT * FROM tarefas WHERE documento = ? AND status = ? "
+                "ORDER BY tentativas, ano, mes, codigo_empresa, cdc LIMIT 1",
+                (documento, PENDENTE)).fetchone()
+            if tarefa is None:
+                return None
+            self.conexao.execute(
+                "UPDATE tarefas SET status = ?, tentativas = tentativas + 1, atualizado_em = ? "
+                "WHERE documento = ? AND codigo_empresa = ? AND cdc = ? AND ano = ? AND mes = ?",
+                (EM_ANDAMENTO, time.time(), documento, tarefa['codigo_empresa'], tarefa['cdc'],
+                 tarefa['ano'], tarefa['mes']))
+        return dict(tarefa, tentativas=tarefa['tentativas'] + 1)
+
+    def registrar(self, tarefa, resultado):
+        """Grava o resultado do download da tarefa"""
+        agora = time.time()
+        if resultado in (BAIXADA, JA_BAIXADA):
+            status = CONCLUIDA
+        elif resultado == SEM_FATURA:
+            status = SEM_FATURA
+        elif tarefa['tentativas'] >= MAX_TENTATIVAS_TAREFA:
+            status = FALHA_DEFINITIVA
+        else:
+            status = PENDENTE
+
+        with self.conexao:
+            self.conexao.execute(
+                "UPDATE tarefas SET status = ?, resultado = ?, atualizado_em = ? "
+                "WHERE documento = ? AND codigo_empresa = ? AND cdc = ? AND ano = ? AND mes = ?",
+                (status, resultado, agora, tarefa['documento'], tarefa['codigo_empresa'], tarefa['cdc'],
+                 tarefa['ano'], tarefa['mes']))
+            if resultado == SEM_FATURA:
+                validade = validade_sem_fatura(tarefa['ano'], tarefa['mes'], self.validade_dias)
+                self.conexao.execute(
+                    "INSERT INTO sem_fatura (codigo_empresa, cdc, ano, mes, verificado_em, expira_em) "
+                    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (codigo_empresa, cdc, ano, mes) "
+                    "DO UPDATE SET verificado_em = excluded.verificado_em, expira_em = excluded.expira_em",
+                    (tarefa['codigo_empresa'], tarefa['cdc'], tarefa['ano'], tarefa['mes'], agora, agora + validade))
+        return status
+
+    def resumo(self, documento):
+        linhas = self.conexao.execute(
+            "SELECT status, COUNT(*) FROM tarefas WHERE documento = ? GROUP BY status", (documento,))
+        return {status: total for status, total in linhas}
+
+
+def executar_fila(automacao, fila, documento, max_workers=MAX_WORKERS_DOWNLOAD,
+                  requisicoes_por_segundo=REQUISICOES_POR_SEGUNDO):
+    """
+    Consome a fila com no máximo `max_workers` downloads simultâneos.
+    As threads só baixam; reservas e resultados são gravados nesta thread, um a um.
+    """
+    automacao.limitador = LimitadorTaxa(requisicoes_por_segundo) if requisicoes_por_segundo else None
+    contagem = Counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="backfill") as executor:
+        em_voo = {}
+        while True:
+            while len(em_voo) < max_workers:
+                tarefa = fila.reservar(documento)
+                if tarefa is None:
+                    break
+                futuro = executor.submit(automacao.baixar_fatura, tarefa['cdc'], tarefa['digito'],
+                                         tarefa['codigo_empresa'], tarefa['mes'], tarefa['ano'])
+                em_voo[futuro] = tarefa
+            if not em_voo:
+                break
+
+            concluidos, _ = wait(em_voo, return_when=FIRST_COMPLETED)
+            for futuro in concluidos:
+                tarefa = em_voo.pop(futuro)
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    logging.error(f"CDC {tarefa['cdc']} {tarefa['mes']:02d}/{tarefa['ano']}: {e}")
+                    resultado = FALHA
+                fila.registrar(tarefa, resultado)
+                contagem[resultado] += 1
+
+    return contagem
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill das faturas da Energisa por intervalo de meses")
+    parser.add_argument("--documento", default="10425282000122", help="CPF/CNPJ do titular")
+    parser.add_argument("--de", required=True, help="Primeiro mês (AAAA-MM)")
+    parser.add_argument("--ate", default=datetime.now().strftime('%Y-%m'), help="Último mês (AAAA-MM)")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS_DOWNLOAD, help="Downloads simultâneos")
+    parser.add_argument("--requisicoes-por-segundo", type=float, default=REQUISICOES_POR_SEGUNDO)
+    parser.add_argument("--banco", default=CAMINHO_FILA_PADRAO, help="Arquivo SQLite da fila")
+    parser.add_argument("--validade-sem-fatura-dias", type=float, default=VALIDADE_SEM_FATURA_DIAS)
+    parser.add_argument("--repetir-falhas", action="store_true",
+                        help=f"Volta para a fila as tarefas que falharam {MAX_TENTATIVAS_TAREFA} vezes")
+    args = parser.parse_args()
+
+    try:
+        meses = meses_entre(args.de, args.ate)
+    except ValueError:
+        parser.error("--de/--ate devem estar no formato AAAA-MM")
+    if not meses:
+        parser.error("--de deve ser anterior ou igual a --ate")
+
+    automacao = EnergisaAutomacao(documento=args.documento)
+    if not automacao.executar_login_automatico():
+        logging.error("Falha no login.")
+        return
+    if not automacao.unidades_encontradas:
+        logging.info("Nenhuma unidade disponível")
+        return
+
+    fila = FilaBackfill(args.banco, args.validade_sem_fatura_dias)
+    try:
+        fila.recuperar_interrompidas(args.documento)
+        criadas = fila.popular(args.documento, automacao.unidades_encontradas, meses, args.repetir_falhas)
+        logging.info(f"Backfill {args.de} a {args.ate}: {len(automacao.unidades_encontradas)} UC(s) x "
+                     f"{len(meses)} mês(es), {criadas} tarefa(s) nova(s)")
+
+        contagem = executar_fila(automacao, fila, args.documento, args.workers, args.requisicoes_por_segundo)
+        logging.info(f"Resultados desta execução: {dict(contagem)}")
+        logging.info(f"Situação da fila: {fila.resumo(args.documento)}")
+    finally:
+        fila.fechar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import hashlib
+import logging
+import os
+from pathlib import Path
+
+# Gravação dos PDFs baixados
+# - o corpo da resposta é gravado em blocos num arquivo .part e só é renomeado (atômico)
+#   para o nome final se começar com %PDF e terminar com o trailer %%EOF
+# - ao lado do PDF fica um .sha256; na próxima execução, a UC cujo PDF do mês existe e confere
+#   com o hash é pulada, então reexecuções depois de falhas só baixam o que falta
+
+TAMANHO_BLOCO_HASH = 1024 * 1024
+TAMANHO_CAUDA = 2048  # o %%EOF fica no fim do arquivo (pode haver espaços/quebras depois dele)
+
+
+def caminho_hash(caminho_pdf):
+    caminho_pdf = Path(caminho_pdf)
+    return caminho_pdf.with_name(caminho_pdf.name + '.sha256')
+
+
+def hash_arquivo(caminho):
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(TAMANHO_BLOCO_HASH), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def pdf_completo(inicio, cauda):
+    return inicio.startswith(b'%PDF') and b'%%EOF' in cauda
+
+
+def _gravar_hash(caminho_pdf, hexdigest):
+    arquivo_hash = caminho_hash(caminho_pdf)
+    temporario = arquivo_hash.with_name(arquivo_hash.name + '.tmp')
+    temporario.write_text(hexdigest, encoding='utf-8')
+    os.replace(temporario, arquivo_hash)
+
+
+def fatura_ja_baixada(caminho_pdf):
+    """
+    True se o PDF existe e confere com o .sha256 gravado no download.
+    PDFs antigos sem .sha256 são aceitos se estiverem completos (%PDF ... %%EOF) e ganham o .sha256.
+    """
+    caminho_pdf = Path(caminho_pdf)
+    if not caminho_pdf.is_file():
+        return False
+
+    arquivo_hash = caminho_hash(caminho_pdf)
+    if arquivo_hash.exists():
+        return arquivo_hash.read_text(encoding='utf-8').strip() == hash_arquivo(caminho_pdf)
+
+    with open(caminho_pdf, 'rb') as f:
+        inicio = f.read(5)
+        f.seek(max(caminho_pdf.stat().st_size - TAMANHO_CAUDA, 0))
+        cauda = f.read()
+    if not pdf_completo(inicio, cauda):
+        return False
+    _gravar_hash(caminho_pdf, hash_arquivo(caminho_pdf))
+    return True
+
+
+class GravadorPdf:
+    """Recebe o corpo da resposta em blocos; `concluir()` valida e publica o arquivo"""
+
+    def __init__(self, caminho_pdf):
+        self.caminho_pdf = Path(caminho_pdf)
+        self.caminho_pdf.parent.mkdir(parents=True, exist_ok=True)
+        self.temporario = self.caminho_pdf.with_name(self.caminho_pdf.name + '.part')
+        self._arquivo = open(self.temporario, 'wb')
+        self._sha = hashlib.sha256()
+        self._inicio = b''
+        self._cauda = b''
+        self.tamanho = 0
+        self.motivo = None  # por que concluir() recusou: 'nao_pdf' ou 'incompleto'
+
+    def escrever(self, bloco):
+        if not bloco:
+            return
+        if len(self._inicio) < 5:
+            self._inicio += bloco[:5 - len(self._inicio)]
+        self._cauda = (self._cauda + bloco)[-TAMANHO_CAUDA:]
+        self._sha.update(bloco)
+        self._arquivo.write(bloco)
+        self.tamanho += len(bloco)
+
+    def concluir(self):
+        """Renomeia para o nome final se o PDF estiver completo; senão descarta. Retorna True se publicou"""
+        self._arquivo.close()
+        if not self._inicio.startswith(b'%PDF'):
+            logging.error(f"Resposta não é PDF válido ({self.caminho_pdf.name})")
+            self.motivo = 'nao_pdf'
+            self.descartar()
+            return False
+        if b'%%EOF' not in self._cauda:
+            logging.error(f"PDF incompleto, sem %%EOF ({self.caminho_pdf.name}, {self.tamanho} bytes)")
+            self.motivo = 'incompleto'
+            self.descartar()
+            return False
+
+        os.replace(self.temporario, self.caminho_pdf)
+        _gravar_hash(self.caminho_pdf, self._sha.hexdigest())
+        return True
+
+    def descartar(self):
+        if not self._arquivo.closed:
+            self._arquivo.close()
+        self.temporario.unlink(missing_ok=True)
@@ -0,0 +1,90 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from cryptography.fernet import Fernet, InvalidToken
+
+# Cache criptografado da sessão da Energisa (tokens + cookies), um arquivo por documento
+# Evita repetir o login por código de segurança no e-mail (30 a 110 s) a cada execução.
+# A chave Fernet vem de ENERGISA_CACHE_KEY (gerar com: python cache_sessao.py --gerar-chave);
+# sem a chave o cache fica desligado, para os tokens nunca serem gravados em texto puro.
+
+PASTA_CACHE_PADRAO = os.getenv('ENERGISA_CACHE_DIR', './cache_sessao')
+MARGEM_EXPIRACAO = 5 * 60     # segundos antes do vencimento em que o token já é renovado
+VALIDADE_SEM_EXP = 30 * 60    # validade assumida quando o token não informa o vencimento (não é JWT)
+CAMPOS_TOKENS = ("access_token", "udk_token", "utk_token", "refresh_token", "retk_token")
+
+
+def expiracao_token(token):
+    """Vencimento (timestamp) de um token JWT pelo campo 'exp', sem validar a assinatura. None se não for JWT"""
+    try:
+        carga = token.split('.')[1]
+        carga += '=' * (-len(carga) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(carga)).get('exp')
+        return float(exp) if exp else None
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class CacheSessao:
+    def __init__(self, chave=None, pasta=PASTA_CACHE_PADRAO):
+        chave = chave or os.getenv('ENERGISA_CACHE_KEY')
+        self.fernet = Fernet(chave) if chave else None
+        self.pasta = Path(pasta)
+        if not self.fernet:
+            logging.warning("ENERGISA_CACHE_KEY não definida: cache de sessão desligado.")
+
+    @property
+    def ativo(self):
+        return self.fernet is not None
+
+    def _arquivo(self, documento):
+        # Nome do arquivo sem o documento em claro
+        return self.pasta / f"{hashlib.sha256(documento.encode()).hexdigest()[:16]}.sessao"
+
+    def carregar(self, documento):
+        """Dados salvos da sessão ({tokens, cookies, salvo_em, expira_em}) ou None"""
+        if not self.ativo:
+            return None
+        arquivo = self._arquivo(documento)
+        if not arquivo.exists():
+            return None
+        try:
+            return json.loads(self.fernet.decrypt(arquivo.read_bytes()))
+        except (InvalidToken, ValueError, OSError) as e:
+            logging.warning(f"Cache de sessão ilegível ({type(e).__name__}); será refeito.")
+            return None
+
+    def salvar(self, documento, tokens, cookies):
+        if not self.ativo:
+            return
+        expiracoes = [exp for exp in (expiracao_token(tokens.get(campo)) for campo in ("access_token", "utk_token"))
+                      if exp]
+        dados = {
+            'tokens': tokens,
+            'cookies': cookies,
+            'salvo_em': time.time(),
+            'expira_em': min(expiracoes) if expiracoes else time.time() + VALIDADE_SEM_EXP,
+        }
+        self.pasta.mkdir(parents=True, exist_ok=True)
+        arquivo = self._arquivo(documento)
+        temporario = arquivo.with_suffix('.tmp')
+        temporario.write_bytes(self.fernet.encrypt(json.dumps(dados).encode()))
+        os.chmod(temporario, 0o600)
+        temporario.replace(arquivo)
+
+    def apagar(self, documento):
+        self._arquivo(documento).unlink(missing_ok=True)
+
+    @staticmethod
+    def perto_de_expirar(dados):
+        return dados.get('expira_em', 0) - time.time() < MARGEM_EXPIRACAO
+
+
+if __name__ == "__main__":
+    import sys
+    if "--gerar-chave" in sys.argv:
+        print(Fernet.generate_key().decode())
@@ -0,0 +1,80 @@
+from datetime import datetime
+
+# Pré-verificação de disponibilidade das faturas, sem chamar o portal
+# O portal não tem uma listagem barata das faturas emitidas: a única forma de saber é o POST em
+# SegundaVia/Download. Então o calendário de faturamento de cada UC é aprendido do diário
+# (diario_tentativas.py): num mês em que houve 'sem_fatura' no dia D e depois 'baixada', a fatura
+# daquela UC só sai a partir do dia D + 1. Com esse histórico:
+# - no mês corrente, a UC só é tentada a partir do menor dia de emissão já observado (menos uma folga)
+# - (UC, mês) com 'sem_fatura' recente não é tentado de novo antes de REVERIFICAR_HORAS
+# - meses futuros nunca são tentados
+# UC sem histórico suficiente é sempre tentada.
+
+MARGEM_DIAS = 1          # tenta a UC um dia antes do menor dia de emissão observado
+MESES_MINIMOS = 2        # meses com o dia de emissão delimitado antes de confiar no calendário
+REVERIFICAR_HORAS = 12   # intervalo mínimo entre duas tentativas 'sem_fatura' do mesmo (UC, mês)
+
+
+class CalendarioFaturamento:
+    def __init__(self, historico, margem_dias=MARGEM_DIAS, meses_minimos=MESES_MINIMOS,
+                 reverificar_horas=REVERIFICAR_HORAS):
+        """`historico`: tentativas de download do diário (chave, mes, ano, status, registrado_em) em ordem"""
+        self.margem_dias = margem_dias
+        self.reverificar_horas = reverificar_horas
+        self.dia_previsto = {}          # chave da UC -> primeiro dia do mês em que a fatura costuma existir
+        self.ultima_sem_fatura = {}     # (chave, ano, mes) -> timestamp, se a última tentativa foi 'sem_fatura'
+        self._aprender(historico, meses_minimos)
+
+    def _aprender(self, historico, meses_minimos):
+        ultimo_dia_sem_fatura = {}   # (chave, ano, mes) -> último dia com 'sem_fatura' antes da primeira 'baixada'
+        dias_emissao = {}            # chave -> [dia limite inferior de cada mês]
+
+        for tentativa in historico:
+            if not tentativa['mes'] or not tentativa['ano']:
+                continue
+            item = (tentativa['chave'], tentativa['ano'], tentativa['mes'])
+            if tentativa['status'] == 'sem_fatura':
+                self.ultima_sem_fatura[item] = tentativa['registrado_em']
+            else:
+                self.ultima_sem_fatura.pop(item, None)
+
+            # Só tentativas feitas dentro do próprio mês da fatura dizem algo sobre o dia de emissão
+            data = datetime.fromtimestamp(tentativa['registrado_em'])
+            if (data.year, data.month) != (tentativa['ano'], tentativa['mes']):
+                continue
+            if tentativa['status'] == 'sem_fatura':
+                ultimo_dia_sem_fatura[item] = data.day
+            elif tentativa['status'] == 'baixada' and item in ultimo_dia_sem_fatura:
+                dias_emissao.setdefault(tentativa['chave'], []).append(ultimo_dia_sem_fatura.pop(item) + 1)
+
+        for chave, dias in dias_emissao.items():
+            if len(dias) >= meses_minimos:
+                self.dia_previsto[chave] = max(min(dias) - self.margem_dias, 1)
+
+    @classmethod
+    def do_diario(cls, diario, documento=None, **kwargs):
+        return cls(diario.historico('download', documento, status=('baixada', 'sem_fatura')), **kwargs)
+
+    def esperada(self, chave, mes, ano, agora=None):
+        """True se vale tentar o download da fatura (UC, mês) agora"""
+        agora = agora or datetime.now()
+        mes, ano = int(mes), int(ano)
+        if (ano, mes) > (agora.year, agora.month):
+            return False
+
+        ultima = self.ultima_sem_fatura.get((chave, ano, mes))
+        if ultima and agora.timestamp() - ultima < self.reverificar_horas * 3600:
+            return False
+
+        if (ano, mes) == (agora.year, agora.month):
+            dia = self.dia_previsto.get(chave)
+            if dia and agora.day < dia:
+                return False
+        return True
+
+    def filtrar(self, tarefas, chave_de, agora=None):
+        """Separa as tarefas (unidade, mes, ano) em (a tentar, adiadas); `chave_de(unidade)` dá a chave da UC"""
+        tentar, adiadas = [], []
+        for unidade, mes, ano in tarefas:
+            (tentar if self.esperada(chave_de(unidade), mes, ano, agora) else adiadas).append((unidade, mes, ano))
+        return tentar, adiadas
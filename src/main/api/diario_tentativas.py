@@ -0,0 +1,104 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Diário persistente das tentativas de download e extração (uma linha por tentativa)
+# - etapa 'download': chave = empresa:cdc:dígito da UC, com mês/ano, status, código HTTP, erro e duração
+# - etapa 'extracao': chave = nome do PDF, com o caminho do arquivo
+# O item conta como falha enquanto a última tentativa dele tiver status 'falha';
+# `--retry-failed` no downloader e no pipeline refaz só esses itens.
+
+CAMINHO_DIARIO_PADRAO = os.getenv('ENERGISA_DIARIO_DB', './diario_faturas.sqlite')
+STATUS_FALHA = 'falha'
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS tentativas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    registrado_em REAL NOT NULL,
+    documento TEXT,
+    etapa TEXT NOT NULL,
+    chave TEXT NOT NULL,
+    mes INTEGER,
+    ano INTEGER,
+    caminho TEXT,
+    status TEXT NOT NULL,
+    http INTEGER,
+    erro TEXT,
+    duracao REAL
+);
+CREATE INDEX IF NOT EXISTS ix_tentativas_item ON tentativas (etapa, documento, chave, ano, mes);
+"""
+
+
+def chave_unidade(codigo_empresa, cdc, digito_verificador):
+    return f"{codigo_empresa}:{cdc}:{digito_verificador}"
+
+
+def unidade_da_chave(chave):
+    """Inverso de chave_unidade, no formato de unidades_encontradas"""
+    codigo_empresa, cdc, digito_verificador = chave.split(':')
+    return {'codigoEmpresaWeb': codigo_empresa, 'cdc': cdc, 'digitoVerificadorCdc': digito_verificador}
+
+
+class DiarioTentativas:
+    """Gravável de várias threads (uma conexão protegida por lock; cada tentativa é uma transação curta)"""
+
+    def __init__(self, caminho=CAMINHO_DIARIO_PADRAO):
+        self.caminho = caminho
+        self.lock = threading.Lock()
+        self.conexao = sqlite3.connect(caminho, check_same_thread=False)
+        self.conexao.row_factory = sqlite3.Row
+        self.conexao.execute("PRAGMA journal_mode=WAL")
+        self.conexao.executescript(ESQUEMA)
+
+    def registrar(self, etapa, documento, chave, status, mes=None, ano=None, caminho=None, http=None, erro=None,
+                  duracao=None):
+        with self.lock, self.conexao:
+            self.conexao.execute(
+                "INSERT INTO tentativas (registrado_em, documento, etapa, chave, mes, ano, caminho, status, http, "
+                "erro, duracao) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), documento, etapa, chave, int(mes) if mes else None, int(ano) if ano else None,
+                 str(caminho) if caminho else None, status, http, str(erro)[:2000] if erro else None, duracao))
+
+    def falhas(self, etapa, documento=None):
+        """Itens cuja última tentativa na etapa falhou"""
+        filtro_documento = "AND documento = ?" if documento else ""
+        parametros = (etapa, documento) if documento else (etapa,)
+        with self.lock:
+            linhas = self.conexao.execute(
+                "SELECT t.* FROM tentativas t JOIN ("
+                f"  SELECT MAX(id) AS id FROM tentativas WHERE etapa = ? {filtro_documento}"
+                "   GROUP BY documento, chave, ano, mes"
+                f") ultima ON ultima.id = t.id WHERE t.status = '{STATUS_FALHA}' ORDER BY t.ano, t.mes, t.chave",
+                parametros).fetchall()
+        return [dict(linha) for linha in linhas]
+
+    def historico(self, etapa, documento=None, status=None):
+        """Tentativas da etapa em ordem de registro (opcionalmente só do documento e dos status pedidos)"""
+        condicoes, parametros = ["etapa = ?"], [etapa]
+        if documento:
+            condicoes.append("documento = ?")
+            parametros.append(documento)
+        if status:
+            condicoes.append(f"status IN ({', '.join('?' * len(status))})")
+            parametros.extend(status)
+        with self.lock:
+            linhas = self.conexao.execute(
+                f"SELECT * FROM tentativas WHERE {' AND '.join(condicoes)} ORDER BY id", parametros).fetchall()
+        return [dict(linha) for linha in linhas]
+
+    def resumo(self, desde):
+        """Contagem por etapa e status das tentativas registradas a partir de `desde` (timestamp)"""
+        with self.lock:
+            linhas = self.conexao.execute(
+                "SELECT etapa, status, COUNT(*) FROM tentativas WHERE registrado_em >= ? GROUP BY etapa, status",
+                (desde,)).fetchall()
+        resumo = {}
+        for etapa, status, total in linhas:
+            resumo.setdefault(etapa, {})[status] = total
+        return resumo
+
+    def fechar(self):
+        with self.lock:
+            self.conexao.close()
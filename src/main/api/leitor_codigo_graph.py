@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import msal
+import requests
+
+# Leitura do código de segurança da Energisa na caixa do bot pelo Microsoft Graph
+# - um único app MSAL por processo (o cache de tokens do MSAL é reaproveitado entre logins)
+# - polling com intervalo curto e crescente (2 s, 3 s, 4.5 s ... até 10 s) em vez de 30 s fixos
+# - $filter por data de recebimento e remetente: só chegam mensagens novas da Energisa
+# - o corpo (HTML) só é pedido para mensagens novas com o assunto esperado
+# - e-mail cujo código já foi lido neste processo não volta: logins seguidos (vários documentos) não
+#   pegam o código do login anterior, que ainda cai na janela de FOLGA_RELOGIO
+
+GRAPH_BASE_URL = os.getenv('GRAPH_BASE_URL', "https://graph.microsoft.com/v1.0")
+GRAPH_ESCOPO = ["https://graph.microsoft.com/.default"]
+REMETENTE_CODIGO = "sistemas@sac.energisa.com.br"
+ASSUNTO_CODIGO = "código de segurança da energisa"
+
+INTERVALO_INICIAL = 2.0
+FATOR_BACKOFF = 1.5
+INTERVALO_MAXIMO = 10.0
+TEMPO_LIMITE = 110.0          # mesmo tempo total que o fluxo antigo (30 s + 8 x 10 s)
+FOLGA_RELOGIO = timedelta(seconds=60)  # tolerância entre o relógio local e o do servidor de e-mail
+
+_apps_msal = {}
+_apps_lock = threading.Lock()
+
+# Mensagens de código já lidas, por caixa (usuario, pasta): {'ids': set(), 'ultima': receivedDateTime}
+_consumidas = {}
+_consumidas_lock = threading.Lock()
+
+
+def _app_msal(tenant_id, client_id, client_secret):
+    chave = (tenant_id, client_id)
+    with _apps_lock:
+        if chave not in _apps_msal:
+            _apps_msal[chave] = msal.ConfidentialClientApplication(
+                client_id=client_id,
+                authority=f"https://login.microsoftonline.com/{tenant_id}",
+                client_credential=client_secret,
+            )
+        return _apps_msal[chave]
+
+
+def token_graph_msal():
+    """Token de aplicativo do Graph (o MSAL devolve o token em cache enquanto for válido)"""
+    aplicacao = _app_msal(os.getenv('GRAPH_TENANT_ID'), os.getenv('GRAPH_CLIENT_ID'), os.getenv('GRAPH_CLIENT_SECRET'))
+    resultado = aplicacao.acquire_token_for_client(scopes=GRAPH_ESCOPO)
+    token = resultado.get('access_token')
+    if not token:
+        logging.error(f"Falha ao obter token Graph: {resultado}")
+    return token
+
+
+class LeitorCodigoSeguranca:
+    """
+    Procura o e-mail com o código de segurança recebido depois de `solicitado_em`.
+    `provedor_token` e `base_url` podem ser trocados (ex.: Graph simulado nos testes de carga).
+    """
+
+    def __init__(self, extrair_codigo, provedor_token=token_graph_msal, base_url=GRAPH_BASE_URL,
+                 usuario=None, pasta=None):
+        self.extrair_codigo = extrair_codigo
+        self.provedor_token = provedor_token
+        self.base_url = base_url.rstrip('/')
+        self.usuario = usuario or os.getenv('BOT_USER_EMAIL')
+        self.pasta = pasta or os.getenv('BOT_EMAIL_FOLDER')
+        self._vistas = set()
+
+    def _url_mensagens(self):
+        return f"{self.base_url}/users/{self.usuario}/mailFolders/{self.pasta}/messages"
+
+    def _consumidas_da_caixa(self):
+        with _consumidas_lock:
+            return _consumidas.setdefault((self.usuario, self.pasta), {'ids': set(), 'ultima': None})
+
+    def _consumir(self, mensagem):
+        """Marca a mensagem como usada no processo: nenhum leitor da mesma caixa a devolve de novo"""
+        recebida = _data_graph(mensagem.get('receivedDateTime'))
+        consumidas = self._consumidas_da_caixa()
+        with _consumidas_lock:
+            consumidas['ids'].add(mensagem['id'])
+            if recebida and (consumidas['ultima'] is None or recebida > consumidas['ultima']):
+                consumidas['ultima'] = recebida
+
+    def _parametros_lista(self, solicitado_em):
+        desde = solicitado_em - FOLGA_RELOGIO
+        ultima = self._consumidas_da_caixa()['ultima']
+        if ultima and ultima > desde:
+            # Só mensagens a partir da última já usada (as do mesmo segundo são separadas pelo id)
+            desde = ultima
+        desde = desde.strftime('%Y-%m-%dT%H:%M:%SZ')
+        # O Graph exige que a propriedade do $orderby apareça primeiro no $filter
+        return {
+            '$filter': f"receivedDateTime ge {desde} and from/emailAddress/address eq '{REMETENTE_CODIGO}'",
+            '$orderby': 'receivedDateTime desc',
+            '$select': 'id,subject,receivedDateTime',
+            '$top': 10,
+        }
+
+    def _novas_candidatas(self, mensagens):
+        """
+        Mensagens ainda não lidas (nem usadas por outro login do processo) com o assunto do código.
+        A candidata só entra em `_vistas` depois que o corpo for baixado e lido: se o GET do corpo
+        falhar, ela volta na próxima consulta.
+        """
+        consumidas = self._consumidas_da_caixa()
+        with _consumidas_lock:
+            usadas = set(consumidas['ids'])
+        novas = []
+        for mensagem in mensagens:
+            if mensagem['id'] in self._vistas or mensagem['id'] in usadas:
+                continue
+            if ASSUNTO_CODIGO in mensagem.get('subject', '').lower():
+                novas.append(mensagem)
+            else:
+                self._vistas.add(mensagem['id'])
+        return novas
+
+    @staticmethod
+    def _intervalos(tempo_limite):
+        inicio = time.monotonic()
+        intervalo = INTERVALO_INICIAL
+        while time.monotonic() - inicio < tempo_limite:
+            yield intervalo
+            intervalo = min(intervalo * FATOR_BACKOFF, INTERVALO_MAXIMO)
+
+    def aguardar_codigo(self, solicitado_em, tempo_limite=TEMPO_LIMITE):
+        """Polling síncrono; retorna o código ou None ao fim do tempo limite"""
+        token = self.provedor_token()
+        if not token:
+            return None
+        headers = {'Authorization': f'Bearer {token}'}
+
+        for tentativa, intervalo in enumerate(self._intervalos(tempo_limite), 1):
+            time.sleep(intervalo)
+            try:
+                response = requests.get(self._url_mensagens(), headers=headers,
+                                        params=self._parametros_lista(solicitado_em), timeout=15)
+                response.raise_for_status()
+                for mensagem in self._novas_candidatas(response.json().get('value', [])):
+                    resposta_corpo = requests.get(f"{self._url_mensagens()}/{mensagem['id']}", headers=headers,
+                                                  params={'$select': 'body'}, timeout=15)
+                    resposta_corpo.raise_for_status()
+                    codigo = self.extrair_codigo(resposta_corpo.json().get('body', {}).get('content', ''))
+                    self._vistas.add(mensagem['id'])
+                    if codigo:
+                        self._consumir(mensagem)
+                        logging.info(f"Código encontrado na tentativa {tentativa}")
+                        return codigo
+            except Exception as e:
+                logging.warning(f"Falha ao consultar e-mails (tentativa {tentativa}): {e}")
+        return None
+
+    async def aguardar_codigo_async(self, sessao, solicitado_em, tempo_limite=TEMPO_LIMITE):
+        """Mesmo polling em asyncio, com uma curl_cffi AsyncSession"""
+        token = await asyncio.to_thread(self.provedor_token)
+        if not token:
+            return None
+        headers = {'Authorization': f'Bearer {token}'}
+
+        for tentativa, intervalo in enumerate(self._intervalos(tempo_limite), 1):
+            await asyncio.sleep(intervalo)
+            try:
+                response = await sessao.get(self._url_mensagens(), headers=headers,
+                                            params=self._parametros_lista(solicitado_em), timeout=15)
+                response.raise_for_status()
+                for mensagem in self._novas_candidatas(response.json().get('value', [])):
+                    resposta_corpo = await sessao.get(f"{self._url_mensagens()}/{mensagem['id']}", headers=headers,
+                                                      params={'$select': 'body'}, timeout=15)
+                    resposta_corpo.raise_for_status()
+                    codigo = self.extrair_codigo(resposta_corpo.json().get('body', {}).get('content', ''))
+                    self._vistas.add(mensagem['id'])
+                    if codigo:
+                        self._consumir(mensagem)
+                        logging.info(f"Código encontrado na tentativa {tentativa}")
+                        return codigo
+            except Exception as e:
+                logging.warning(f"Falha ao consultar e-mails (tentativa {tentativa}): {e}")
+        return None
+
+
+def agora_utc():
+    return datetime.now(timezone.utc)
+
+
+def _data_graph(valor):
+    """receivedDateTime do Graph ('2025-05-12T14:03:27Z') como datetime com fuso; None se ausente ou inválido"""
+    try:
+        return datetime.fromisoformat(valor.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
@@ -0,0 +1,264 @@
+import argparse
+import asyncio
+import hashlib
+import random
+import re
+import secrets
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+
+# Portal da Energisa e caixa de e-mail (Microsoft Graph) simulados, para testes de carga do downloader
+# Implementa só as rotas usadas por EnergisaAutomacao, com latência, taxa de erro (503), limite de
+# requisições por segundo (429 + Retry-After) e meses sem fatura configuráveis.
+# O código de segurança pedido em EmailPorUC vira uma mensagem na caixa simulada, lida pelo mesmo
+# LeitorCodigoSeguranca do fluxo real.
+# Uso: python mock_energisa.py --porta 8765 --latencia-ms 150 --taxa-erro 0.02 --limite-rps 20
+#      ENERGISA_BASE_URL=http://127.0.0.1:8765  GRAPH_BASE_URL=http://127.0.0.1:8765/graph/v1.0
+
+REMETENTE_CODIGO = "sistemas@sac.energisa.com.br"
+ASSUNTO_CODIGO = "Código de segurança da Energisa"
+VALIDADE_CODIGO = timedelta(minutes=10)
+
+
+class ConfigMock:
+    def __init__(self, latencia_ms=150, variacao_latencia_ms=50, taxa_erro=0.0, limite_rps=0.0,
+                 taxa_sem_fatura=0.0, ucs_por_documento=20, tamanho_pdf_kb=150, atraso_email_s=1.0):
+        self.latencia_ms = latencia_ms
+        self.variacao_latencia_ms = variacao_latencia_ms
+        self.taxa_erro = taxa_erro
+        self.limite_rps = limite_rps          # 0 = sem limite
+        self.taxa_sem_fatura = taxa_sem_fatura
+        self.ucs_por_documento = ucs_por_documento
+        self.tamanho_pdf_kb = tamanho_pdf_kb
+        self.atraso_email_s = atraso_email_s  # tempo até o e-mail com o código "chegar"
+
+
+class LimiteServidor:
+    """Token bucket do lado do servidor; acima do limite a requisição recebe 429"""
+
+    def __init__(self, requisicoes_por_segundo):
+        self.capacidade = max(requisicoes_por_segundo, 1)
+        self.intervalo = 1.0 / requisicoes_por_segundo if requisicoes_por_segundo else 0
+        self.fichas = self.capacidade
+        self.ultima = time.monotonic()
+        self.lock = threading.Lock()
+
+    def permitir(self):
+        if not self.intervalo:
+            return True
+        with self.lock:
+            agora = time.monotonic()
+            self.fichas = min(self.capacidade, self.fichas + (agora - self.ultima) / self.intervalo)
+            self.ultima = agora
+            if self.fichas >= 1:
+                self.fichas -= 1
+                return True
+            return False
+
+
+def pdf_simulado(tamanho_kb, identificador):
+    """PDF mínimo (%PDF ... %%EOF) com o tamanho pedido, aceito pelo GravadorPdf"""
+    cabecalho = f"%PDF-1.4\n% fatura simulada {identificador}\n".encode()
+    rodape = b"\n%%EOF\n"
+    preenchimento = max(tamanho_kb * 1024 - len(cabecalho) - len(rodape), 0)
+    return cabecalho + b"%" * preenchimento + rodape
+
+
+def sorteio_estavel(*partes):
+    """Número em [0, 1) fixo para as mesmas partes (o mesmo mês segue sem fatura entre execuções)"""
+    digest = hashlib.sha256(":".join(map(str, partes)).encode()).digest()
+    return int.from_bytes(digest[:8], 'big') / 2 ** 64
+
+
+def html_codigo(codigo):
+    # Mesmo formato do e-mail real: um dígito por célula
+    celulas = "".join(f'<td><div style="x"><p style="y">{digito}</p></div></td>' for digito in codigo)
+    return f"<html><body><p>Seu código de segurança:</p><table><tr>{celulas}</tr></table></body></html>"
+
+
+def criar_app(config=None):
+    config = config or ConfigMock()
+    app = FastAPI(title="Energisa simulada", description="Portal e caixa de e-mail simulados para testes de carga")
+    limite = LimiteServidor(config.limite_rps)
+    estatisticas = Counter()
+    codigos = {}      # código -> validade
+    tokens = set()    # utk emitidos
+    mensagens = []    # caixa de e-mail simulada
+
+    async def simular_rede():
+        atraso = config.latencia_ms + random.uniform(-config.variacao_latencia_ms, config.variacao_latencia_ms)
+        await asyncio.sleep(max(atraso, 0) / 1000)
+
+    def novos_tokens():
+        utk = secrets.token_hex(16)
+        tokens.add(utk)
+        return {"ate": secrets.token_hex(16), "udk": secrets.token_hex(8), "utk": utk,
+                "refreshToken": secrets.token_hex(16), "retk": secrets.token_hex(8)}
+
+    def resposta_erro_ou_limite():
+        """429/503 antes do processamento, conforme a configuração"""
+        if not limite.permitir():
+            estatisticas['429'] += 1
+            return JSONResponse({"errored": True, "message": "Too many requests"}, status_code=429,
+                                headers={"Retry-After": "1"})
+        if config.taxa_erro and random.random() < config.taxa_erro:
+            estatisticas['503'] += 1
+            return JSONResponse({"errored": True, "message": "Serviço indisponível"}, status_code=503)
+        return None
+
+    # ---- Portal ----
+
+    @app.get("/login")
+    async def login():
+        resposta = HTMLResponse("<html><body>login</body></html>")
+        resposta.set_cookie("sessao_mock", secrets.token_hex(8))
+        return resposta
+
+    @app.get("/api/auth")
+    async def auth():
+        await simular_rede()
+        return {"autenticated": True, "accessTokenEnergisa": secrets.token_hex(16)}
+
+    @app.post("/api/autenticacao/CodigoSeguranca/EmailPorUC")
+    async def email_por_uc():
+        await simular_rede()
+        codigo = f"{random.randint(0, 9999):04d}"
+        codigos[codigo] = datetime.now(timezone.utc) + VALIDADE_CODIGO
+        recebido = datetime.now(timezone.utc) + timedelta(seconds=config.atraso_email_s)
+        mensagens.append({
+            "id": secrets.token_hex(12),
+            "subject": ASSUNTO_CODIGO,
+            "receivedDateTime": recebido.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            "from": {"emailAddress": {"address": REMETENTE_CODIGO}},
+            "body": {"contentType": "html", "content": html_codigo(codigo)},
+            "_disponivel_em": recebido,
+        })
+        estatisticas['codigos'] += 1
+        return {"errored": False, "infos": {"message": "Código enviado"}}
+
+    @app.post("/api/autenticacao/UsuarioClienteEnergisa/Autenticacao/PorCpfCnpj")
+    async def autenticar(doc: str, codigoSegurancaRecebido: str):
+        await simular_rede()
+        validade = codigos.pop(codigoSegurancaRecebido, None)
+        if not validade or validade < datetime.now(timezone.utc):
+            return {"errored": True, "infos": {"message": "Código de segurança inválido"}}
+        estatisticas['logins'] += 1
+        return {"errored": False, "infos": {"message": "Logado com sucesso", **novos_tokens()}}
+
+    @app.post("/api/autenticacao/UsuarioClienteEnergisa/RefreshToken")
+    async def renovar(request: Request):
+        await simular_rede()
+        corpo = await request.json()
+        if corpo.get("utk") not in tokens:
+            return JSONResponse({"errored": True, "infos": {"message": "Sessão expirada"}}, status_code=401)
+        estatisticas['renovacoes'] += 1
+        return {"errored": False, "infos": novos_tokens()}
+
+    @app.post("/api/usuarios/UnidadeConsumidora")
+    async def unidades(doc: str, request: Request):
+        await simular_rede()
+        corpo = await request.json()
+        if corpo.get("utk") not in tokens:
+            return JSONResponse({"errored": True, "infos": []}, status_code=401)
+        base = int(hashlib.sha256(doc.encode()).hexdigest()[:5], 16) * 100
+        return {"errored": False, "infos": [
+            {"numeroUc": str(base + i), "digitoVerificador": str(i % 10), "codigoEmpresaWeb": "6",
+             "endereco": f"Rua Simulada {i}", "complemento": "", "nomeTitular": f"EMPRESA {doc}",
+             "nomeMunicipio": "CUIABA", "ucAtiva": True}
+            for i in range(config.ucs_por_documento)
+        ]}
+
+    @app.post("/api/clientes/SegundaVia/Download")
+    async def download(request: Request):
+        recusa = resposta_erro_ou_limite()
+        if recusa is not None:
+            return recusa
+        await simular_rede()
+        corpo = await request.json()
+        if corpo.get("utk") not in tokens:
+            estatisticas['401'] += 1
+            return JSONResponse({"errored": True, "message": "Não autorizado"}, status_code=401)
+
+        cdc, mes, ano = corpo.get("cdc"), corpo.get("mes"), corpo.get("ano")
+        if config.taxa_sem_fatura and sorteio_estavel(cdc, mes, ano) < config.taxa_sem_fatura:
+            estatisticas['sem_fatura'] += 1
+            # O portal responde 200 com JSON quando não há fatura no mês
+            return {"errored": True, "message": "Fatura não encontrada para o período"}
+
+        estatisticas['downloads'] += 1
+        return Response(pdf_simulado(config.tamanho_pdf_kb, f"{cdc}-{mes}-{ano}"), media_type="application/pdf")
+
+    # ---- Microsoft Graph ----
+
+    def mensagens_visiveis(filtro):
+        agora = datetime.now(timezone.utc)
+        desde = re.search(r"receivedDateTime ge (\S+)", filtro or "")
+        desde = datetime.strptime(desde.group(1), '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc) if desde else None
+        visiveis = [m for m in mensagens if m["_disponivel_em"] <= agora]
+        if desde:
+            visiveis = [m for m in visiveis if m["_disponivel_em"] >= desde]
+        return sorted(visiveis, key=lambda m: m["_disponivel_em"], reverse=True)
+
+    @app.get("/graph/v1.0/users/{usuario}/mailFolders/{pasta}/messages")
+    async def graph_listar(usuario: str, pasta: str, request: Request):
+        parametros = request.query_params
+        top = int(parametros.get("$top", 10))
+        estatisticas['graph_listagens'] += 1
+        return {"value": [{"id": m["id"], "subject": m["subject"], "receivedDateTime": m["receivedDateTime"]}
+                          for m in mensagens_visiveis(parametros.get("$filter"))[:top]]}
+
+    @app.get("/graph/v1.0/users/{usuario}/mailFolders/{pasta}/messages/{id_mensagem}")
+    async def graph_mensagem(usuario: str, pasta: str, id_mensagem: str):
+        for mensagem in mensagens:
+            if mensagem["id"] == id_mensagem:
+                return {"id": mensagem["id"], "body": mensagem["body"]}
+        return JSONResponse({"error": {"code": "ErrorItemNotFound"}}, status_code=404)
+
+    # ---- Controle ----
+
+    @app.get("/mock/estatisticas")
+    async def ver_estatisticas():
+        return dict(estatisticas)
+
+    @app.post("/mock/zerar")
+    async def zerar():
+        estatisticas.clear()
+        return {"ok": True}
+
+    return app
+
+
+def argumentos_mock(parser):
+    parser.add_argument("--latencia-ms", type=float, default=150)
+    parser.add_argument("--variacao-latencia-ms", type=float, default=50)
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="Fração dos downloads que recebem 503")
+    parser.add_argument("--limite-rps", type=float, default=0.0, help="Requisições/s de download antes do 429 (0 = sem)")
+    parser.add_argument("--taxa-sem-fatura", type=float, default=0.0, help="Fração de (UC, mês) sem fatura")
+    parser.add_argument("--ucs", type=int, default=20, help="UCs por documento")
+    parser.add_argument("--tamanho-pdf-kb", type=int, default=150)
+    parser.add_argument("--atraso-email-s", type=float, default=1.0)
+    return parser
+
+
+def config_dos_argumentos(args):
+    return ConfigMock(latencia_ms=args.latencia_ms, variacao_latencia_ms=args.variacao_latencia_ms,
+                      taxa_erro=args.taxa_erro, limite_rps=args.limite_rps, taxa_sem_fatura=args.taxa_sem_fatura,
+                      ucs_por_documento=args.ucs, tamanho_pdf_kb=args.tamanho_pdf_kb,
+                      atraso_email_s=args.atraso_email_s)
+
+
+def main():
+    parser = argumentos_mock(argparse.ArgumentParser(description="Portal da Energisa e Graph simulados"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8765)
+    args = parser.parse_args()
+    uvicorn.run(criar_app(config_dos_argumentos(args)), host=args.host, port=args.porta, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
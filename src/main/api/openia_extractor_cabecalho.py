@@ -1,7 +1,6 @@
 import os
 import json
 import pytesseract
-from pdf2image import convert_from_path
 from openai import OpenAI
 import base64
 import pdfplumber
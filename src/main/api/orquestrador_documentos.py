@@ -0,0 +1,150 @@
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from Download_faturas_linux import (EnergisaAutomacao, LimitadorTaxa, mes_atual, ano_atual, MAX_WORKERS_DOWNLOAD,
+                                    REQUISICOES_POR_SEGUNDO, BAIXADA, JA_BAIXADA, SEM_FATURA, FALHA)
+from diario_tentativas import DiarioTentativas, CAMINHO_DIARIO_PADRAO
+from calendario_faturamento import CalendarioFaturamento
+
+# Download das faturas de vários documentos (CNPJs do grupo) em paralelo
+# - cada documento tem a própria EnergisaAutomacao: sessão, cookies, tokens e cache de sessão isolados
+# - um único LimitadorTaxa é compartilhado por todas as sessões: o limite de requisições por segundo
+#   vale para o processo inteiro, não por documento
+# - o login por código no e-mail (solicitar, esperar e validar o código) é feito um documento por vez: todos os
+#   códigos chegam na mesma caixa; o leitor descarta os e-mails já usados no processo e, se o portal recusar
+#   um código, espera o próximo e-mail; logins pelo cache de sessão não passam pelo lock
+# Uso: python orquestrador_documentos.py --arquivo documentos.txt [--documentos-simultaneos 3]
+
+DOCUMENTOS_SIMULTANEOS = int(os.getenv('ENERGISA_DOCUMENTOS_SIMULTANEOS', 3))
+
+_lock_login = threading.Lock()
+
+
+def ler_documentos(caminho):
+    """Um CPF/CNPJ por linha; linhas vazias e comentários (#) são ignorados"""
+    documentos = []
+    with open(caminho, encoding='utf-8') as f:
+        for linha in f:
+            linha = linha.split('#', 1)[0].strip()
+            if linha and linha not in documentos:
+                documentos.append(linha)
+    return documentos
+
+
+def processar_documento(documento, mes, ano, max_workers, limitador, diario=None, pre_verificar=False):
+    """Login e download das faturas de um documento; retorna o resumo do documento"""
+    inicio = time.monotonic()
+    automacao = EnergisaAutomacao(documento=documento)
+    automacao.diario = diario
+    if pre_verificar and diario is not None:
+        automacao.calendario = CalendarioFaturamento.do_diario(diario, documento)
+    resumo = {'documento': documento, 'login': False, 'ucs': 0, 'resultados': {}, 'falhas_uc': [], 'adiadas': 0,
+              'duracao': 0.0}
+
+    automacao.lock_codigo_email = _lock_login
+    if automacao.executar_login_automatico():
+        resumo['login'] = True
+        resumo['ucs'] = len(automacao.unidades_encontradas)
+        automacao.baixar_faturas_para_todas_unidades(mes=mes, ano=ano, max_workers=max_workers, limitador=limitador)
+        resumo['resultados'] = dict(automacao.resultados)
+        resumo['falhas_uc'] = automacao.falhas_uc
+        resumo['adiadas'] = len(automacao.faturas_adiadas)
+    else:
+        logging.error(f"Documento {documento}: falha no login.")
+
+    resumo['duracao'] = time.monotonic() - inicio
+    return resumo
+
+
+def orquestrar(documentos, mes=mes_atual, ano=ano_atual, documentos_simultaneos=DOCUMENTOS_SIMULTANEOS,
+               max_workers=MAX_WORKERS_DOWNLOAD, requisicoes_por_segundo=REQUISICOES_POR_SEGUNDO, diario=None,
+               pre_verificar=False):
+    """Processa os documentos em paralelo sob um limite global de requisições; retorna os resumos"""
+    limitador = LimitadorTaxa(requisicoes_por_segundo) if requisicoes_por_segundo else None
+    logging.info(f"Orquestrando {len(documentos)} documento(s) de {mes}/{ano}: {documentos_simultaneos} simultâneo(s), "
+                 f"{max_workers} download(s) por documento, {requisicoes_por_segundo or 'sem limite de'} "
+                 f"requisições/s no total")
+
+    resumos = []
+    with ThreadPoolExecutor(max_workers=documentos_simultaneos, thread_name_prefix="documento") as executor:
+        futuros = {executor.submit(processar_documento, documento, mes, ano, max_workers, limitador, diario,
+                                   pre_verificar): documento
+                   for documento in documentos}
+        for futuro in as_completed(futuros):
+            try:
+                resumos.append(futuro.result())
+            except Exception as e:
+                logging.error(f"Documento {futuros[futuro]}: erro inesperado: {e}")
+                resumos.append({'documento': futuros[futuro], 'login': False, 'ucs': 0, 'resultados': {},
+                                'falhas_uc': [], 'adiadas': 0, 'duracao': 0.0, 'erro': str(e)})
+
+    # Mesma ordem da lista de entrada
+    ordem = {documento: i for i, documento in enumerate(documentos)}
+    return sorted(resumos, key=lambda resumo: ordem[resumo['documento']])
+
+
+def imprimir_resumo(resumos, duracao_total):
+    logging.info("\nRESUMO POR DOCUMENTO")
+    logging.info(f"{'documento':<16} {'login':<5} {'UCs':>4} {'baix.':>5} {'exist.':>6} {'sem fat.':>8} "
+                 f"{'adiad.':>6} {'falhas':>6} {'tempo':>8} {'fat/min':>7}")
+    totais = {'ucs': 0, BAIXADA: 0, JA_BAIXADA: 0, SEM_FATURA: 0, FALHA: 0, 'adiadas': 0}
+    for resumo in resumos:
+        resultados = resumo['resultados']
+        baixadas = resultados.get(BAIXADA, 0)
+        por_minuto = baixadas / resumo['duracao'] * 60 if resumo['duracao'] else 0.0
+        logging.info(f"{resumo['documento']:<16} {'ok' if resumo['login'] else 'FALHA':<5} {resumo['ucs']:>4} "
+                     f"{baixadas:>5} {resultados.get(JA_BAIXADA, 0):>6} {resultados.get(SEM_FATURA, 0):>8} "
+                     f"{resumo['adiadas']:>6} {resultados.get(FALHA, 0):>6} {resumo['duracao']:>7.1f}s {por_minuto:>7.1f}")
+        totais['ucs'] += resumo['ucs']
+        totais['adiadas'] += resumo['adiadas']
+        for chave in (BAIXADA, JA_BAIXADA, SEM_FATURA, FALHA):
+            totais[chave] += resultados.get(chave, 0)
+
+    por_minuto = totais[BAIXADA] / duracao_total * 60 if duracao_total else 0.0
+    logging.info(f"{'TOTAL':<16} {'':<5} {totais['ucs']:>4} {totais[BAIXADA]:>5} {totais[JA_BAIXADA]:>6} "
+                 f"{totais[SEM_FATURA]:>8} {totais['adiadas']:>6} {totais[FALHA]:>6} {duracao_total:>7.1f}s "
+                 f"{por_minuto:>7.1f}")
+
+    sem_login = [resumo['documento'] for resumo in resumos if not resumo['login']]
+    if sem_login:
+        logging.info(f"Documentos sem login: {sem_login}")
+    for resumo in resumos:
+        if resumo['falhas_uc']:
+            logging.info(f"U/C com falha ({resumo['documento']}): {resumo['falhas_uc']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download das faturas da Energisa de vários documentos em paralelo")
+    parser.add_argument("--arquivo", help="Arquivo com um CPF/CNPJ por linha")
+    parser.add_argument("--documentos", nargs="*", default=[], help="CPF/CNPJ (além dos do arquivo)")
+    parser.add_argument("--mes", type=int, default=int(mes_atual))
+    parser.add_argument("--ano", type=int, default=ano_atual)
+    parser.add_argument("--documentos-simultaneos", type=int, default=DOCUMENTOS_SIMULTANEOS)
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS_DOWNLOAD, help="Downloads simultâneos por documento")
+    parser.add_argument("--requisicoes-por-segundo", type=float, default=REQUISICOES_POR_SEGUNDO,
+                        help="Limite global, somando todos os documentos")
+    parser.add_argument("--diario", default=CAMINHO_DIARIO_PADRAO, help="SQLite com o diário das tentativas")
+    parser.add_argument("--pre-verificar", action="store_true",
+                        help="Pula as UCs cuja fatura do mês ainda não é esperada (calendário aprendido do diário)")
+    args = parser.parse_args()
+
+    documentos = ler_documentos(args.arquivo) if args.arquivo else []
+    documentos += [documento for documento in args.documentos if documento not in documentos]
+    if not documentos:
+        parser.error("informe --arquivo e/ou --documentos")
+
+    diario = DiarioTentativas(args.diario)
+    inicio = time.monotonic()
+    try:
+        resumos = orquestrar(documentos, args.mes, args.ano, args.documentos_simultaneos, args.workers,
+                             args.requisicoes_por_segundo, diario, args.pre_verificar)
+        imprimir_resumo(resumos, time.monotonic() - inicio)
+    finally:
+        diario.fechar()
+
+
+if __name__ == "__main__":
+    main()
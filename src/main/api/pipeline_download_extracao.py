@@ -0,0 +1,263 @@
+import argparse
+import logging
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from Download_faturas_linux import (EnergisaAutomacao, LimitadorTaxa, mes_atual, ano_atual, MAX_WORKERS_DOWNLOAD,
+                                    REQUISICOES_POR_SEGUNDO, BAIXADA, JA_BAIXADA, PASTA_FATURAS)
+from diario_tentativas import DiarioTentativas, CAMINHO_DIARIO_PADRAO, unidade_da_chave
+
+# O extrator das faturas baixadas fica em coord_text/Faturas_retornando_XML e o pacote database/ em coord_text/
+PASTA_EXTRATOR = Path(__file__).resolve().parents[1] / "coord_text" / "Faturas_retornando_XML"
+sys.path.insert(0, str(PASTA_EXTRATOR.parent))
+sys.path.insert(0, str(PASTA_EXTRATOR))
+
+import get_text_coord_xml_baixadas as extracao  # noqa: E402
+from database.backend_cnpj import retorno_cnpj_lote  # noqa: E402
+from database.estagio_cnpj import EstagioCnpj  # noqa: E402
+from database.manifesto import ManifestoProcessamento  # noqa: E402
+from database.registro_faturas import RegistroFaturas, hash_arquivo  # noqa: E402
+
+# Pipeline download -> extração -> XML
+# - as threads de download colocam cada PDF baixado numa fila limitada (put bloqueia se a extração
+#   ficar para trás, então os downloads seguram o ritmo em vez de acumular)
+# - as threads de extração leem os PDFs da fila e entregam as faturas prontas para esta thread,
+#   que grava o XML e o registro na hora; o XML da primeira UC sai em segundos e o tempo total
+#   fica perto de max(download, extração) em vez da soma das duas etapas
+# - com o diário (diario_tentativas.py), downloads e extrações ficam registrados; --retry-failed
+#   refaz só os downloads e as extrações que falharam
+# - cada PDF processado entra no manifesto da pasta de PDFs com o pipeline e a versão do extrator em
+#   lote, que assim não reprocessa os PDFs que o pipeline já tratou
+# Uso: python pipeline_download_extracao.py [--mes 5 --ano 2025] [--workers-extracao 2] [--retry-failed]
+
+WORKERS_EXTRACAO = 2
+TAMANHO_FILA_PDFS = 8
+FIM = None  # sentinela: uma por thread de extração
+
+# O dicttoxml registra cada chave convertida em INFO, o que afoga o log dos downloads
+logging.getLogger("dicttoxml").setLevel(logging.WARNING)
+
+
+class PipelineFaturas:
+    def __init__(self, automacao, pasta_xml=extracao.PASTA_XML, caminho_registro=None, pasta_pdfs=PASTA_FATURAS,
+                 workers_download=MAX_WORKERS_DOWNLOAD, workers_extracao=WORKERS_EXTRACAO,
+                 tamanho_fila=TAMANHO_FILA_PDFS, requisicoes_por_segundo=REQUISICOES_POR_SEGUNDO):
+        self.automacao = automacao
+        self.pasta_xml = pasta_xml
+        # Mesmo registro do extrator em lote: o que um processou o outro pula
+        self.caminho_registro = caminho_registro or str(Path(pasta_xml) / "registro_faturas.sqlite")
+        self.pasta_pdfs = pasta_pdfs
+        self.workers_download = workers_download
+        self.workers_extracao = workers_extracao
+        self.requisicoes_por_segundo = requisicoes_por_segundo
+        self.fila_pdfs = queue.Queue(maxsize=tamanho_fila)
+        self.fila_faturas = queue.Queue()
+        self.erros_extracao = []
+        self.ja_processados = 0
+        self.xmls_emitidos = 0
+
+    # ---- Produtor: downloads ----
+
+    def _baixar_e_enfileirar(self, unidade, mes, ano):
+        try:
+            resultado = self.automacao.baixar_fatura(unidade['cdc'], unidade['digitoVerificadorCdc'],
+                                                     unidade['codigoEmpresaWeb'], mes, ano)
+        except Exception as e:
+            logging.error(f"CDC {unidade['cdc']}: erro no download: {e}")
+            return None
+        if resultado in (BAIXADA, JA_BAIXADA):
+            self.fila_pdfs.put(self.automacao._caminho_fatura(unidade['cdc'], unidade['digitoVerificadorCdc'],
+                                                              unidade['codigoEmpresaWeb'], mes, ano))
+        return resultado
+
+    def _produzir(self, tarefas, pdfs):
+        try:
+            # PDFs já no disco (extrações a refazer) entram direto na fila
+            for caminho_pdf in pdfs:
+                self.fila_pdfs.put(caminho_pdf)
+            with ThreadPoolExecutor(max_workers=self.workers_download, thread_name_prefix="download") as executor:
+                for unidade, mes, ano in tarefas:
+                    executor.submit(self._baixar_e_enfileirar, unidade, mes, ano)
+        finally:
+            for _ in range(self.workers_extracao):
+                self.fila_pdfs.put(FIM)
+
+    # ---- Consumidores: extração ----
+
+    def _extrair(self, estagio_cnpj):
+        # Conexão própria só para leitura do registro (o SQLite não compartilha conexão entre threads)
+        registro_leitura = RegistroFaturas(self.caminho_registro)
+        try:
+            while True:
+                caminho_pdf = self.fila_pdfs.get()
+                if caminho_pdf is FIM:
+                    break
+                caminho_pdf = Path(caminho_pdf)
+                inicio = time.monotonic()
+                try:
+                    hash_pdf = hash_arquivo(caminho_pdf)
+                    if registro_leitura.ja_processado(hash_pdf):
+                        self._registrar_extracao(caminho_pdf, 'ja_processada', inicio)
+                        self.fila_faturas.put((caminho_pdf, hash_pdf, None))
+                        continue
+
+                    resultado_plano, tributos_data, itens_tabela_brutos = extracao.processar_regiao_parallel(
+                        caminho_pdf, estagio_cnpj=estagio_cnpj)
+                    extracao.juntar_cnpjs([resultado_plano])
+                    fatura = extracao.extrair_informacoes_estruturadas(resultado_plano, tributos_data,
+                                                                       itens_tabela_brutos)
+                    fatura['@chave_acesso'] = resultado_plano.get('nota_fiscal', {}).get('chave_acesso', '')
+                    fatura['@nome'] = caminho_pdf.name
+                    self._registrar_extracao(caminho_pdf, 'extraida', inicio)
+                    self.fila_faturas.put((caminho_pdf, hash_pdf, fatura))
+                except Exception as e:
+                    logging.error(f"Erro ao extrair {caminho_pdf.name}: {e}")
+                    self.erros_extracao.append(caminho_pdf.name)
+                    self._registrar_extracao(caminho_pdf, 'falha', inicio, erro=f"{type(e).__name__}: {e}")
+        finally:
+            registro_leitura.fechar()
+            self.fila_faturas.put(FIM)
+
+    def _registrar_extracao(self, caminho_pdf, status, inicio, erro=None):
+        if self.automacao.diario is not None:
+            self.automacao.diario.registrar('extracao', self.automacao.documento, caminho_pdf.name, status,
+                                            caminho=caminho_pdf, erro=erro, duracao=time.monotonic() - inicio)
+
+    # ---- Emissão (thread principal) ----
+
+    def _emitir(self, registro, manifesto, n_fatura, caminho_pdf, hash_pdf, fatura):
+        if fatura is None:
+            self.ja_processados += 1
+            manifesto.registrar(caminho_pdf)
+            return
+
+        fatura['@id'] = str(n_fatura)
+        cabecalho = fatura.get('cabecalho', {})
+        uc = cabecalho.get('CodigoCliente')
+        caminho_saida = str(extracao.caminho_xml_por_uc(uc, self.pasta_xml)) if uc else None
+
+        salvos = {}
+        if registro.atualizar_ultima_por_uc(uc, cabecalho.get('DataEmissao'), cabecalho.get('NumeroDocumento'),
+                                            hash_pdf, caminho_saida):
+            salvos = extracao.salvar_xmls_por_uc([fatura], self.pasta_xml)
+            if uc and fatura['@id'] not in salvos:
+                # Falha de gravação não é registrada, para ser refeita na próxima execução
+                registro.salvar()
+                self._registrar_extracao(caminho_pdf, 'falha', time.monotonic(), erro="falha ao gravar o XML")
+                return
+            self.xmls_emitidos += len(salvos)
+
+        registro.registrar_pdf(hash_pdf, caminho_pdf.name, cabecalho, salvos.get(fatura['@id']))
+        registro.salvar()
+        manifesto.registrar(caminho_pdf)
+
+    def executar(self, mes=mes_atual, ano=ano_atual):
+        if not self.automacao.login_completo or not self.automacao.unidades_encontradas:
+            logging.info("Nenhuma unidade disponível")
+            return False
+        logging.info(f"Pipeline {mes}/{ano}: {len(self.automacao.unidades_encontradas)} UC(s)")
+        return self._executar([(unidade, mes, ano) for unidade in self.automacao.unidades_encontradas], [])
+
+    def repetir_falhas(self):
+        """Refaz só os downloads e as extrações cuja última tentativa no diário falhou"""
+        diario = self.automacao.diario
+        if not self.automacao.login_completo or diario is None:
+            return False
+
+        tarefas = [(unidade_da_chave(falha['chave']), falha['mes'], falha['ano'])
+                   for falha in diario.falhas('download', self.automacao.documento)]
+        pdfs = []
+        for falha in diario.falhas('extracao', self.automacao.documento):
+            if falha['caminho'] and Path(falha['caminho']).is_file():
+                pdfs.append(falha['caminho'])
+            else:
+                logging.warning(f"PDF da extração com falha não existe mais: {falha['caminho'] or falha['chave']}")
+        logging.info(f"Repetindo {len(tarefas)} download(s) e {len(pdfs)} extração(ões) com falha")
+        return self._executar(tarefas, pdfs)
+
+    def _executar(self, tarefas, pdfs):
+        self.automacao.limitador = LimitadorTaxa(self.requisicoes_por_segundo) if self.requisicoes_por_segundo else None
+        inicio = time.monotonic()
+        primeiro_xml = None
+        registro = RegistroFaturas(self.caminho_registro)
+        Path(self.pasta_pdfs).mkdir(parents=True, exist_ok=True)
+        # Mesmo pipeline e versão do extrator em lote, que roda sobre a mesma pasta de PDFs
+        manifesto = ManifestoProcessamento(self.pasta_pdfs, Path(extracao.__file__).stem, extracao.VERSAO_PARSER)
+
+        logging.info(f"{self.workers_download} download(s) e {self.workers_extracao} extração(ões) simultâneos")
+        try:
+            with EstagioCnpj(retorno_cnpj_lote) as estagio_cnpj:
+                threads = [threading.Thread(target=self._produzir, args=(tarefas, pdfs), name="produtor", daemon=True)]
+                threads += [threading.Thread(target=self._extrair, args=(estagio_cnpj,), name=f"extracao-{i}",
+                                             daemon=True)
+                            for i in range(self.workers_extracao)]
+                for thread in threads:
+                    thread.start()
+
+                finalizados = 0
+                n_fatura = 0
+                while finalizados < self.workers_extracao:
+                    item = self.fila_faturas.get()
+                    if item is FIM:
+                        finalizados += 1
+                        continue
+                    n_fatura += 1
+                    self._emitir(registro, manifesto, n_fatura, *item)
+                    if primeiro_xml is None and self.xmls_emitidos:
+                        primeiro_xml = time.monotonic() - inicio
+                        logging.info(f"Primeiro XML emitido em {primeiro_xml:.1f} s")
+
+                for thread in threads:
+                    thread.join()
+        finally:
+            registro.fechar()
+            manifesto.fechar()
+
+        logging.info(f"\nPIPELINE CONCLUÍDO em {time.monotonic() - inicio:.1f} s: {self.xmls_emitidos} XML(s) emitido(s), "
+                     f"{self.ja_processados} PDF(s) já processado(s), {len(self.erros_extracao)} erro(s) de extração")
+        if self.erros_extracao:
+            logging.info(f"PDFs com erro na extração: {self.erros_extracao}")
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Baixa as faturas da Energisa e gera os XMLs à medida que chegam")
+    parser.add_argument("--documento", default="10425282000122", help="CPF/CNPJ do titular")
+    parser.add_argument("--mes", type=int, default=int(mes_atual))
+    parser.add_argument("--ano", type=int, default=ano_atual)
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS_DOWNLOAD, help="Downloads simultâneos")
+    parser.add_argument("--workers-extracao", type=int, default=WORKERS_EXTRACAO, help="Extrações simultâneas")
+    parser.add_argument("--tamanho-fila", type=int, default=TAMANHO_FILA_PDFS,
+                        help="PDFs baixados aguardando extração antes de os downloads esperarem")
+    parser.add_argument("--requisicoes-por-segundo", type=float, default=REQUISICOES_POR_SEGUNDO)
+    parser.add_argument("--pasta-xml", default=extracao.PASTA_XML, help="Pasta de saída dos XMLs")
+    parser.add_argument("--diario", default=CAMINHO_DIARIO_PADRAO, help="SQLite com o diário das tentativas")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Refaz só os downloads e extrações cuja última tentativa no diário falhou")
+    args = parser.parse_args()
+
+    automacao = EnergisaAutomacao(documento=args.documento)
+    automacao.diario = DiarioTentativas(args.diario)
+    inicio = time.time()
+    try:
+        if not automacao.executar_login_automatico():
+            logging.error("Falha no login.")
+            return
+
+        pipeline = PipelineFaturas(automacao, pasta_xml=args.pasta_xml, workers_download=args.workers,
+                                   workers_extracao=args.workers_extracao, tamanho_fila=args.tamanho_fila,
+                                   requisicoes_por_segundo=args.requisicoes_por_segundo)
+        if args.retry_failed:
+            pipeline.repetir_falhas()
+        else:
+            pipeline.executar(mes=args.mes, ano=args.ano)
+        logging.info(f"Diário desta execução: {automacao.diario.resumo(inicio)}")
+    finally:
+        automacao.diario.fechar()
+
+
+if __name__ == "__main__":
+    main()
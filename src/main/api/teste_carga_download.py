@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+import httpx
+import uvicorn
+from mock_energisa import criar_app, argumentos_mock, config_dos_argumentos
+
+# Teste de carga do downloader contra o portal simulado (mock_energisa.py)
+# Sobe o mock numa thread (ou usa um já rodando com --url), faz o login completo pelo código no e-mail
+# simulado e mede downloads/minuto para cada quantidade de workers pedida, no modo síncrono ou asyncio.
+# Uso: python teste_carga_download.py --workers 1 2 4 8 --requisicoes-por-segundo 0 --latencia-ms 200
+
+PORTA_PADRAO = 8765
+DOCUMENTO_TESTE = "00000000000191"
+
+# Download_faturas_linux grava o log em ./logs ao ser importado
+os.makedirs("logs", exist_ok=True)
+
+
+def subir_mock(config, porta):
+    servidor = uvicorn.Server(uvicorn.Config(criar_app(config), host="127.0.0.1", port=porta, log_level="warning"))
+    thread = threading.Thread(target=servidor.run, name="mock-energisa", daemon=True)
+    thread.start()
+    while not servidor.started:
+        time.sleep(0.05)
+    return servidor
+
+
+def configurar_ambiente(url):
+    os.environ['ENERGISA_BASE_URL'] = url
+    os.environ['GRAPH_BASE_URL'] = f"{url}/graph/v1.0"
+    os.environ.setdefault('BOT_USER_EMAIL', "bot@teste.local")
+    os.environ.setdefault('BOT_EMAIL_FOLDER', "inbox")
+    os.environ.pop('ENERGISA_CACHE_KEY', None)  # cada rodada faz o login completo
+
+
+def medir_sync(documento, mes, ano, workers, requisicoes_por_segundo):
+    from Download_faturas_linux import EnergisaAutomacao
+
+    class AutomacaoTeste(EnergisaAutomacao):
+        def _obter_token_graph(self):
+            return "token-simulado"
+
+    automacao = AutomacaoTeste(documento)
+    inicio = time.monotonic()
+    if not automacao.executar_login_automatico():
+        raise RuntimeError("login no portal simulado falhou")
+    tempo_login = time.monotonic() - inicio
+
+    inicio = time.monotonic()
+    automacao.baixar_faturas_para_todas_unidades(mes=mes, ano=ano, max_workers=workers,
+                                                 requisicoes_por_segundo=requisicoes_por_segundo or None)
+    return tempo_login, time.monotonic() - inicio, dict(automacao.resultados)
+
+
+def medir_async(documento, mes, ano, workers, requisicoes_por_segundo):
+    from Download_faturas_async import EnergisaAutomacaoAsync
+
+    class AutomacaoTesteAsync(EnergisaAutomacaoAsync):
+        def _obter_token_graph(self):
+            return "token-simulado"
+
+    async def rodar():
+        async with AutomacaoTesteAsync(documento) as automacao:
+            inicio = time.monotonic()
+            if not await automacao.executar_login_automatico():
+                raise RuntimeError("login no portal simulado falhou")
+            tempo_login = time.monotonic() - inicio
+
+            inicio = time.monotonic()
+            await automacao.baixar_faturas_para_todas_unidades(
+                mes=mes, ano=ano, max_workers=workers, requisicoes_por_segundo=requisicoes_por_segundo or None)
+            return tempo_login, time.monotonic() - inicio, dict(automacao.resultados)
+
+    return asyncio.run(rodar())
+
+
+def main():
+    parser = argumentos_mock(argparse.ArgumentParser(description="Teste de carga do downloader da Energisa"))
+    parser.add_argument("--url", help="Mock já em execução (senão sobe um local)")
+    parser.add_argument("--porta", type=int, default=PORTA_PADRAO)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--requisicoes-por-segundo", type=float, default=0, help="Limite do cliente (0 = sem)")
+    parser.add_argument("--modo", choices=["sync", "async"], default="sync")
+    parser.add_argument("--mes", type=int, default=5)
+    parser.add_argument("--ano", type=int, default=2025)
+    args = parser.parse_args()
+
+    url = args.url or f"http://127.0.0.1:{args.porta}"
+    if not args.url:
+        subir_mock(config_dos_argumentos(args), args.porta)
+    configurar_ambiente(url)
+    # As URLs são lidas na importação: importa depois de configurar o ambiente e antes de trocar de pasta
+    import Download_faturas_linux  # noqa: F401
+    if args.modo == "async":
+        import Download_faturas_async  # noqa: F401
+    medir = medir_sync if args.modo == "sync" else medir_async
+
+    linhas = []
+    pasta_original = os.getcwd()
+    for workers in args.workers:
+        httpx.post(f"{url}/mock/zerar")
+        # Pasta nova a cada rodada: nenhuma fatura é pulada por já existir
+        with tempfile.TemporaryDirectory(prefix="carga_energisa_") as pasta:
+            os.chdir(pasta)
+            try:
+                tempo_login, tempo_download, resultados = medir(DOCUMENTO_TESTE, args.mes, args.ano, workers,
+                                                                args.requisicoes_por_segundo)
+                baixadas = len(list(Path("faturas").glob("*.pdf")))
+            finally:
+                os.chdir(pasta_original)
+        servidor = httpx.get(f"{url}/mock/estatisticas").json()
+        linhas.append((workers, tempo_login, tempo_download, baixadas,
+                       baixadas / tempo_download * 60 if tempo_download else 0.0, resultados, servidor))
+
+    print(f"\nModo {args.modo} | latência {args.latencia_ms:.0f} ms | erro {args.taxa_erro:.0%} | "
+          f"limite do servidor {args.limite_rps or 'nenhum'} req/s | limite do cliente "
+          f"{args.requisicoes_por_segundo or 'nenhum'} req/s")
+    print(f"{'workers':>7} {'login':>7} {'download':>9} {'PDFs':>5} {'PDF/min':>8}  429  503  resultados")
+    for workers, tempo_login, tempo_download, baixadas, por_minuto, resultados, servidor in linhas:
+        print(f"{workers:>7} {tempo_login:>6.1f}s {tempo_download:>8.1f}s {baixadas:>5} {por_minuto:>8.1f} "
+              f"{servidor.get('429', 0):>4} {servidor.get('503', 0):>4}  {resultados}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import hashlib
+import re
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import pdfplumber
+
+# Deduplicação dos PDFs de entrada ANTES da extração
+# A mesma fatura costuma aparecer com nomes diferentes (download da Energisa "Data_..._UC_...pdf"
+# e arquivo manual "EMP 16 FL ... NOTA FISCAL Nº ...pdf"). Cada grupo de cópias é extraído uma vez
+# só e o resultado é replicado para todos os nomes (aliases).
+#   1ª etapa: hash dos bytes do PDF (cópias idênticas)
+#   2ª etapa: impressão digital do texto normalizado da página 0 (mesmo documento, bytes diferentes)
+
+TAMANHO_BLOCO_HASH = 1024 * 1024
+
+
+def hash_conteudo(caminho) -> str:
+    """sha256 dos bytes do arquivo"""
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(TAMANHO_BLOCO_HASH), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def impressao_digital_texto(caminho) -> Optional[str]:
+    """
+    Hash do texto da página 0 sem espaços e em maiúsculas.
+    Usa os caracteres crus do pdfplumber (sem montar linhas/palavras), que é bem mais barato que extract_text.
+    """
+    try:
+        with pdfplumber.open(caminho) as pdf:
+            texto = ''.join(char['text'] for char in pdf.pages[0].chars)
+    except Exception as e:
+        print(f"Aviso: não foi possível ler o texto de {Path(caminho).name} para deduplicação: {e}")
+        return None
+
+    texto_normalizado = re.sub(r'\s+', '', texto).upper()
+    if not texto_normalizado:
+        # PDF sem camada de texto (escaneado): não dá para comparar pelo texto
+        return None
+    return hashlib.sha256(texto_normalizado.encode('utf-8')).hexdigest()
+
+
+def agrupar_pdfs_duplicados(arquivos: List[Path], hash_arquivo: Callable = hash_conteudo,
+                            comparar_texto: bool = True) -> List[List[Path]]:
+    """
+    Agrupa os PDFs que são o mesmo documento. Retorna uma lista de grupos na ordem
+    original; o primeiro arquivo de cada grupo é o representante que deve ser extraído.
+    """
+    grupos_por_hash: Dict[str, List[Path]] = {}
+    for caminho in arquivos:
+        grupos_por_hash.setdefault(hash_arquivo(caminho), []).append(caminho)
+
+    if not comparar_texto:
+        return list(grupos_por_hash.values())
+
+    grupos_por_texto: Dict[str, List[Path]] = {}
+    grupos_finais: List[List[Path]] = []
+    for grupo in grupos_por_hash.values():
+        digital = impressao_digital_texto(grupo[0])
+        if digital is None:
+            grupos_finais.append(grupo)
+        elif digital in grupos_por_texto:
+            grupos_por_texto[digital].extend(grupo)
+        else:
+            grupos_por_texto[digital] = grupo
+            grupos_finais.append(grupo)
+
+    return grupos_finais
+
+
+def resumo_duplicados(grupos: List[List[Path]]) -> str:
+    total = sum(len(grupo) for grupo in grupos)
+    duplicados = total - len(grupos)
+    return f"{total} PDF(s) de entrada, {len(grupos)} documento(s) único(s), {duplicados} cópia(s) não serão reprocessadas"
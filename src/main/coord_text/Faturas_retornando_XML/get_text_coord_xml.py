@@ -6,34 +6,23 @@ from pathlib import Path
 import concurrent.futures
 from concurrent.futures import ThreadPoolExecutor
 from dicttoxml import dicttoxml
-from database.connect_oracle import retorno_cnpj_pdf
+import sys
+# O pacote database/ (manifesto, CNPJ, Oracle) e o layout_fatura.py são compartilhados e ficam em coord_text/
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from database.backend_cnpj import retorno_cnpj_pdf, retorno_cnpj_lote
+from database.manifesto import ManifestoProcessamento, argumentos_manifesto, imprimir_relatorio
+from database.estagio_cnpj import EstagioCnpj
+from layout_fatura import REGIOES_FATURA
 from xml.dom.minidom import parseString, Node, Document  # Importação de Document
 import os
 
 # CONFIGURAÇÃO
 PASTA_PDFS = r"C:\bf_ocr\src\resource\pdf"
 PASTA_XML="C:\\bf_ocr\\\src\\resource\\xml"
+VERSAO_PARSER = "1"  # Altere ao mudar regiões/regras de extração para reprocessar os PDFs já processados
 
-regioes = {
-    "mais_a_cima": {"coordenadas": [(139.9, 4.1), (142.6, 46.2), (465.8, 42.1), (461.7, 6.8)],
-                    "descricao": "Área mais acima"},
-    "roteiro_tensao": {"coordenadas": [(43.5, 81.5), (40.7, 157.5), (319.1, 150.7), (306.9, 84.2)],
-                       "descricao": "Roteiro e tensão"},
-    "nota_fiscal_protocolo": {"coordenadas": [(422.4, 196.9), (423.7, 282.5), (559.5, 279.8), (559.5, 202.4)],
-                              "descricao": "Nota fiscal e protocolo"},
-    "nome_endereco": {"coordenadas": [(42.1, 160.3), (44.8, 201.0), (232.2, 196.9), (229.5, 163.0)],
-                      "descricao": "Nome e endereço"},
-    "codigo_cliente": {"coordenadas": [(236.3, 182.0), (237.7, 213.2), (331.4, 211.9), (334.1, 184.7)],
-                       "descricao": "Código do cliente"},
-    "ref_total_pagar": {"coordenadas": [(44.8, 260.7), (46.2, 285.2), (320.5, 282.5), (325.9, 252.6)],
-                        "descricao": "Referência e total a pagar"},
-    "tributos": {"coordenadas": [(444.1, 376.2), (563.6, 374.8), (445.4, 407.4), (566.3, 406.1)],
-                 "descricao": "Tributos"},
-    "tabela_itens": {"coordenadas": [(21.7, 361.2), (444.1, 571.7)],
-                     "descricao": "Tabela de itens da fatura"},
-    "cnpj": {"coordenadas": [(43.9, 221.3), (159.8, 234.9), (43.1, 241.3), (159.0, 240.5)],
-             "descricao": "cnpj"}
-}
+# Layout compartilhado com o OCR por região (coord_text/layout_fatura.py)
+regioes = REGIOES_FATURA
 
 ITENS_A_EXCLUIR_DO_CONSUMO = [
     "COMPENSACAO POR INDICADOR",
@@ -209,8 +198,8 @@ def processar_tabela_itens(linhas: List[Dict[str, Any]], pdf_path: str) -> List[
     return itens
 
 
-def processar_cnpj(texto: str, nome_titular="") -> dict:
-    resultado = {}
+def extrair_parametros_cnpj(texto: str, nome_titular="") -> Tuple[str, str, str, str]:
+    """Parâmetros da consulta do CNPJ no banco: (prim_num, ult_num, nome_titular, num_insc)"""
     linhas = texto.split('\n')
 
     num_cnpj = re.findall(r'\d', linhas[0])
@@ -222,9 +211,10 @@ def processar_cnpj(texto: str, nome_titular="") -> dict:
     #print(linhas[1])
     num_insc = re.findall(r'\d+', linhas[1])
     num_insc = ''.join(num_insc)
+    return prim_num, ult_num, nome_titular, num_insc
 
-    cnpj_dados_brutos = retorno_cnpj_pdf(prim_num, ult_num, nome_titular, num_insc)
 
+def montar_resultado_cnpj(cnpj_dados_brutos) -> dict:
     cnpj_completo_str = ""
     if isinstance(cnpj_dados_brutos, list) and len(cnpj_dados_brutos) > 0:
         primeiro_elemento = cnpj_dados_brutos[0]
@@ -237,6 +227,10 @@ def processar_cnpj(texto: str, nome_titular="") -> dict:
     return resultado
 
 
+def processar_cnpj(texto: str, nome_titular="") -> dict:
+    return montar_resultado_cnpj(retorno_cnpj_pdf(*extrair_parametros_cnpj(texto, nome_titular)))
+
+
 def processar_roteiro_tensao(texto: str) -> Dict[str, Any]:
     linhas = [linha.strip() for linha in texto.split('\n') if linha.strip()]
     resultado = {}
@@ -342,9 +336,11 @@ def processar_tributos(texto: str) -> Dict[str, Any]:
     return resultado
 
 
-def processar_regiao_parallel(caminho_pdf):
+def processar_regiao_parallel(caminho_pdf, estagio_cnpj=None):
     """
     Processa todas as regiões do PDF. Retorna 3 valores.
+    Com estagio_cnpj a consulta do CNPJ é só enfileirada (resultado_plano['cnpj_futuro']) e
+    o resultado é juntado depois por juntar_cnpj, sem bloquear a extração.
     """
     resultado_plano = {}
     tributos_data = {}
@@ -367,7 +363,10 @@ def processar_regiao_parallel(caminho_pdf):
             resultado_plano['nota_fiscal'] = processar_nota_fiscal_protocolo(texto)
         elif nome_regiao == 'cnpj':
             nome_titular = resultado_plano.get('cliente', {}).get('nome_titular', '')
-            resultado_plano['cnpj'] = processar_cnpj(texto, nome_titular)
+            if estagio_cnpj is None:
+                resultado_plano['cnpj'] = processar_cnpj(texto, nome_titular)
+            else:
+                resultado_plano['cnpj_futuro'] = estagio_cnpj.enviar(extrair_parametros_cnpj(texto, nome_titular))
         elif nome_regiao == 'codigo_cliente':
             resultado_plano['codigo_cliente'] = processar_codigo_cliente(texto)
         elif nome_regiao == 'nome_endereco':
@@ -381,6 +380,13 @@ def processar_regiao_parallel(caminho_pdf):
     return resultado_plano, tributos_data, itens_tabela_brutos
 
 
+def juntar_cnpj(resultado_plano: Dict[str, Any]):
+    """Espera a consulta enfileirada no estágio de CNPJ e preenche resultado_plano['cnpj']"""
+    futuro = resultado_plano.pop('cnpj_futuro', None)
+    if futuro is not None:
+        resultado_plano['cnpj'] = montar_resultado_cnpj(futuro.result())
+
+
 def extrair_informacoes_estruturadas(resultado_plano: Dict[str, Any], tributos_data: Dict[str, Any],itens_tabela_brutos: List[Dict[str, Any]]) -> Dict[str, Any]:
     def criar_item_tributo(nome_tributo: str, dados_tributo: Dict[str, str]) -> Dict[str, Any]:
         """Cria um item de fatura a partir de dados de tributo."""
@@ -560,10 +566,12 @@ def salvar_xmls_por_cnpj(faturas_dados: List[Dict[str, Any]], pasta_saida: str):
     """
     Converte as faturas em strings XML separadas e as salva na pasta de saída,
     agrupadas/nomeadas com base no CNPJ.
+    Retorna as faturas cujo XML foi gravado.
     """
+    salvas = []
     if not faturas_dados:
         print("Nenhuma fatura para salvar.")
-        return
+        return salvas
 
     # 1. Cria a pasta de saída se não existir
     Path(pasta_saida).mkdir(parents=True, exist_ok=True)
@@ -596,9 +604,12 @@ def salvar_xmls_por_cnpj(faturas_dados: List[Dict[str, Any]], pasta_saida: str):
             with open(caminho_saida, 'w', encoding='utf-8') as f:
                 f.write(xml_string)
             print(f"XML salvo com sucesso: {caminho_saida.name}")
+            salvas.append(dados_fatura)
         except Exception as e:
             print(f"Erro ao salvar o arquivo {nome_arquivo_saida}: {e}")
 
+    return salvas
+
 def converter_lote_para_xml_separado(lote_dados: List[Dict[str, Any]]) -> List[str]:
     """
     Converte o lote de dicionários de faturas em uma lista de strings XML formatadas,
@@ -672,6 +683,7 @@ def converter_lote_para_xml_separado(lote_dados: List[Dict[str, Any]]) -> List[s
 
 
 def main():
+    args = argumentos_manifesto("Extrai as faturas da pasta e gera os XMLs por CNPJ").parse_args()
     caminho_pasta = Path(PASTA_PDFS)
     arquivos_pdf = list(caminho_pasta.glob("*.pdf"))
 
@@ -679,13 +691,35 @@ def main():
         print(f"Nenhum arquivo PDF encontrado na pasta: {PASTA_PDFS}")
         return
 
-    todas_faturas = []
+    manifesto = ManifestoProcessamento(PASTA_PDFS, Path(__file__).stem, VERSAO_PARSER)
+    arquivos_pdf, relatorio = manifesto.selecionar(arquivos_pdf, desde=args.desde, todos=args.todos)
+    imprimir_relatorio(relatorio, dry_run=args.dry_run)
 
-    for i, caminho_pdf in enumerate(arquivos_pdf, 1):
-        print(f"Processando ({i}/{len(arquivos_pdf)}): {caminho_pdf.name}")
+    if args.dry_run or not arquivos_pdf:
+        manifesto.fechar()
+        return
 
-        resultado_plano, tributos_data, itens_tabela_brutos = processar_regiao_parallel(caminho_pdf)
-        dados_extraidos = extrair_informacoes_estruturadas(resultado_plano, tributos_data, itens_tabela_brutos)
+    todas_faturas = []
+    salvas = []
+
+    # As consultas de CNPJ rodam em lote no estágio assíncrono enquanto os próximos PDFs são lidos
+    extraidos = []
+    with EstagioCnpj(retorno_cnpj_lote) as estagio_cnpj:
+        for i, caminho_pdf in enumerate(arquivos_pdf, 1):
+            print(f"Processando ({i}/{len(arquivos_pdf)}): {caminho_pdf.name}")
+            try:
+                extraidos.append((i, caminho_pdf, processar_regiao_parallel(caminho_pdf, estagio_cnpj=estagio_cnpj)))
+            except Exception as e:
+                # Fica fora do manifesto: é tentado de novo na próxima execução
+                print(f"Erro ao extrair {caminho_pdf.name}: {e}")
+
+    for i, caminho_pdf, (resultado_plano, tributos_data, itens_tabela_brutos) in extraidos:
+        try:
+            juntar_cnpj(resultado_plano)
+            dados_extraidos = extrair_informacoes_estruturadas(resultado_plano, tributos_data, itens_tabela_brutos)
+        except Exception as e:
+            print(f"Erro ao extrair {caminho_pdf.name}: {e}")
+            continue
 
         dados_extraidos['@id'] = str(i)
         dados_extraidos['@nome'] = caminho_pdf.name
@@ -694,9 +728,22 @@ def main():
 
     if todas_faturas:
         faturas_filtradas = filtrar_faturas_duplicadas(todas_faturas)
-        salvar_xmls_por_cnpj(faturas_filtradas, PASTA_XML)
+        salvas = salvar_xmls_por_cnpj(faturas_filtradas, PASTA_XML)
         print("\nProcessamento concluído. XMLs salvos na pasta:", PASTA_XML)
 
+    # Só entram no manifesto os PDFs com XML gravado (sem CNPJ ou com erro de gravação voltam na próxima execução),
+    # mais as faturas descartadas por uma mais recente da mesma unidade cujo XML foi gravado: reprocessadas
+    # sozinhas, elas sobrescreveriam o XML mais novo
+    clientes_salvos = {fatura.get('cabecalho', {}).get('CodigoCliente') for fatura in salvas} - {None}
+    nomes_salvos = {fatura['@nome'] for fatura in salvas}
+    nomes_filtrados = {fatura['@nome'] for fatura in faturas_filtradas} if todas_faturas else set()
+    for fatura in todas_faturas:
+        codigo_cliente = fatura.get('cabecalho', {}).get('CodigoCliente')
+        substituida = fatura['@nome'] not in nomes_filtrados and codigo_cliente in clientes_salvos
+        if fatura['@nome'] in nomes_salvos or substituida:
+            manifesto.registrar(caminho_pasta / fatura['@nome'])
+    manifesto.fechar()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -6,13 +6,24 @@ from pathlib import Path
 import concurrent.futures
 from concurrent.futures import ThreadPoolExecutor
 from dicttoxml import dicttoxml
-from database.connect_oracle import retorno_cnpj_pdf
+import sys
+# O pacote database/ (manifesto, CNPJ, Oracle) é compartilhado pelos extratores e fica em coord_text/
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from database.backend_cnpj import retorno_cnpj_pdf, retorno_cnpj_lote, retorno_cnpj_aproximado, estatisticas_indice_local
+from database.registro_faturas import RegistroFaturas, chave_data_emissao
+from database.manifesto import ManifestoProcessamento, argumentos_manifesto, imprimir_relatorio
+from database.estagio_cnpj import EstagioCnpj
+from database.insercao_faturas import criar_sink, TAMANHO_LOTE_PADRAO
+from deduplicacao_pdfs import agrupar_pdfs_duplicados, resumo_duplicados
 from xml.dom.minidom import parseString, Node, Document  # Importação de Document
 from time import sleep
 
 # CONFIGURAÇÃO
 PASTA_PDFS = r"C:\bf_ocr\src\resource\pdf_refaturado"
 PASTA_XML="C:\\bf_ocr\\\src\\resource\\xml"
+CAMINHO_REGISTRO = str(Path(PASTA_XML) / "registro_faturas.sqlite")
+CAMINHO_SQLITE_FATURAS = str(Path(PASTA_XML) / "faturas_extraidas.sqlite")  # destino local (--gravar-banco sqlite)
+VERSAO_PARSER = "1"  # Altere ao mudar regiões/regras de extração para reprocessar os PDFs já processados
 
 regioes = {
     "mais_a_cima": {"coordenadas": [(145.3, 4.1), (146.6, 54.3), (464.3, 54.3), (462.9, 6.8)],
@@ -210,8 +221,8 @@ def processar_tabela_itens(linhas: List[Dict[str, Any]], pdf_path: str) -> List[
     return itens
 
 
-def processar_cnpj(texto: str, nome_titular="") -> dict:
-    resultado = {}
+def extrair_parametros_cnpj(texto: str, nome_titular="") -> Tuple[str, str, str, str]:
+    """Parâmetros da consulta do CNPJ no banco: (prim_num, ult_num, nome_titular, num_insc)"""
     linhas = texto.split('\n')
     num_cnpj = re.findall(r'\d', linhas[0])
     ult_num = (num_cnpj[-3:])
@@ -222,21 +233,40 @@ def processar_cnpj(texto: str, nome_titular="") -> dict:
     #print(linhas)
     num_insc = re.findall(r'\d+', linhas[1])
     num_insc = ''.join(num_insc)
+    return prim_num, ult_num, nome_titular, num_insc
 
-    cnpj_dados_brutos = retorno_cnpj_pdf(prim_num, ult_num, nome_titular, num_insc)
 
+def montar_resultado_cnpj(cnpj_dados_brutos, parametros=None) -> dict:
+    """
+    Monta o resultado a partir do retorno da consulta exata. Se ela não encontrou nada e os
+    parâmetros foram informados, tenta a busca aproximada pelo nome (ruído de OCR, nome cortado).
+    """
     cnpj_completo_str = ""
+    confianca = 0.0
     if isinstance(cnpj_dados_brutos, list) and len(cnpj_dados_brutos) > 0:
         primeiro_elemento = cnpj_dados_brutos[0]
         if isinstance(primeiro_elemento, tuple) and len(primeiro_elemento) > 0:
             cnpj_completo_str = str(primeiro_elemento[0])
+            confianca = 1.0
+
+    if not cnpj_completo_str and parametros and parametros[2]:
+        cnpj_completo_str, confianca = retorno_cnpj_aproximado(*parametros)
+        if cnpj_completo_str:
+            print(f"CNPJ encontrado pela busca aproximada do nome '{parametros[2]}' (confiança {confianca:.2f})")
 
     resultado = {
         "cnpj_consumidor": cnpj_completo_str,
+        "confianca": confianca,
     }
     return resultado
 
 
+def processar_cnpj(texto: str, nome_titular="") -> dict:
+    parametros = extrair_parametros_cnpj(texto, nome_titular)
+    cnpj_dados_brutos = retorno_cnpj_pdf(*parametros)
+    return montar_resultado_cnpj(cnpj_dados_brutos, parametros)
+
+
 def processar_roteiro_tensao(texto: str) -> Dict[str, Any]:
     linhas = [linha.strip() for linha in texto.split('\n') if linha.strip()]
     resultado = {}
@@ -277,6 +307,8 @@ def processar_nota_fiscal_protocolo(texto: str) -> Dict[str, Any]:
     if len(linhas) >= 2:
         data_match = re.search(r'\b\d{2}/\d{2}/\d{4}\b', linhas[1])
         resultado["data_emissao"] = data_match.group() if data_match else ""
+    chave_match = re.search(r'chave de acesso:\s*([\d\s]+)', texto, re.IGNORECASE)
+    resultado["chave_acesso"] = re.sub(r'\D', '', chave_match.group(1)) if chave_match else ""
     return resultado
 
 
@@ -342,9 +374,11 @@ def processar_tributos(texto: str) -> Dict[str, Any]:
     return resultado
 
 
-def processar_regiao_parallel(caminho_pdf):
+def processar_regiao_parallel(caminho_pdf, estagio_cnpj=None):
     """
     Processa todas as regiões do PDF. Retorna 3 valores.
+    Com estagio_cnpj a consulta do CNPJ é só enfileirada (resultado_plano['cnpj_futuro']) e
+    o resultado é juntado depois por juntar_cnpjs, sem bloquear a extração.
     """
     resultado_plano = {}
     tributos_data = {}
@@ -368,7 +402,11 @@ def processar_regiao_parallel(caminho_pdf):
             resultado_plano['nota_fiscal'] = processar_nota_fiscal_protocolo(texto)
         elif nome_regiao == 'cnpj':
             nome_titular = resultado_plano.get('cliente', {}).get('nome_titular', '')
-            resultado_plano['cnpj'] = processar_cnpj(texto, nome_titular)
+            if estagio_cnpj is None:
+                resultado_plano['cnpj'] = processar_cnpj(texto, nome_titular)
+            else:
+                resultado_plano['cnpj_parametros'] = extrair_parametros_cnpj(texto, nome_titular)
+                resultado_plano['cnpj_futuro'] = estagio_cnpj.enviar(resultado_plano['cnpj_parametros'])
         elif nome_regiao == 'codigo_cliente':
             resultado_plano['codigo_cliente'] = processar_codigo_cliente(texto)
         elif nome_regiao == 'nome_endereco':
@@ -382,6 +420,16 @@ def processar_regiao_parallel(caminho_pdf):
     return resultado_plano, tributos_data, itens_tabela_brutos
 
 
+def juntar_cnpjs(resultados_planos: List[Dict[str, Any]]):
+    """Espera as consultas enfileiradas no estágio de CNPJ e preenche resultado_plano['cnpj']"""
+    for plano in resultados_planos:
+        futuro = plano.pop('cnpj_futuro', None)
+        if futuro is None:
+            continue
+        parametros = plano.pop('cnpj_parametros')
+        plano['cnpj'] = montar_resultado_cnpj(futuro.result(), parametros)
+
+
 def extrair_informacoes_estruturadas(resultado_plano: Dict[str, Any], tributos_data: Dict[str, Any],itens_tabela_brutos: List[Dict[str, Any]]) -> Dict[str, Any]:
     def criar_item_tributo(nome_tributo: str, dados_tributo: Dict[str, str]) -> Dict[str, Any]:
         """Cria um item de fatura a partir de dados de tributo."""
@@ -504,67 +552,61 @@ def filtrar_faturas_duplicadas(todas_faturas: List[Dict[str, Any]]) -> List[Dict
     para cada unidade consumidora duplicado.
     """
     faturas_por_cliente = {}
+    substituidas = 0
+    descartadas = 0
 
     for fatura in todas_faturas:
         cabecalho = fatura.get('cabecalho', {})
         codigo_cliente = cabecalho.get('CodigoCliente')
         data_emissao_str = cabecalho.get('DataEmissao')
 
-        if not codigo_cliente or not data_emissao_str:
-            # Se faltar o código do cliente ou a data
-            print(
-                f"Aviso: Fatura {fatura.get('@nome', 'sem nome')} será mantida - faltando código de cliente ou data de emissão.")
-            if codigo_cliente not in faturas_por_cliente:
-                faturas_por_cliente[f'{codigo_cliente}_ou_sem_data'] = [fatura]
-            continue
+        # 'aaaammdd' compara como texto, sem precisar do strptime
+        data_emissao = chave_data_emissao(data_emissao_str)
 
-        try:
-            data_emissao = datetime.strptime(data_emissao_str, '%d/%m/%Y')
-        except ValueError:
+        if not codigo_cliente or not data_emissao:
+            # Se faltar o código do cliente ou a data (ou a data for inválida), trata como única
             print(
-                f"Aviso: Fatura {fatura.get('@nome', 'sem nome')} com formato de data inválido ({data_emissao_str}). Será mantida.")
-            # Trata como única
-            if codigo_cliente not in faturas_por_cliente:
-                faturas_por_cliente[f'{codigo_cliente}_ou_sem_data'] = [fatura]
+                f"Aviso: Fatura {fatura.get('@nome', 'sem nome')} será mantida - código de cliente ou data de emissão ausente/inválida ({data_emissao_str}).")
+            faturas_por_cliente[f"{codigo_cliente}_ou_sem_data_{fatura.get('@id', id(fatura))}"] = (None, fatura)
             continue
 
-        # Estrutura de armazenamento: (data_emissao_datetime, fatura_dict)
         cliente_key = codigo_cliente
 
         if cliente_key not in faturas_por_cliente:
             # Primeira fatura para este cliente
             faturas_por_cliente[cliente_key] = (data_emissao, fatura)
         else:
-            # Faturas subsequentes: verifica se é mais recente
-            data_existente, fatura_existente = faturas_por_cliente[cliente_key]
+            data_existente, _ = faturas_por_cliente[cliente_key]
 
-            if data_emissao > data_existente:
-                # Substitui a fatura mais antiga pela nova
-                print(
-                    f"Substituindo fatura de {cliente_key}: '{fatura_existente.get('@nome')}' ({data_existente.strftime('%d/%m/%Y')}) por '{fatura.get('@nome')}' ({data_emissao_str}).")
+            if data_emissao >= data_existente:
+                # Substitui a mais antiga (datas iguais: mantém a última encontrada)
                 faturas_por_cliente[cliente_key] = (data_emissao, fatura)
-            elif data_emissao < data_existente:
-                # Descarta a fatura atual
-                print(
-                    f"Descartando fatura de {cliente_key}: '{fatura.get('@nome')}' ({data_emissao_str}) - mais antiga que a já registrada ('{fatura_existente.get('@nome')}').")
+                substituidas += 1
             else:
-                # Datas iguais, pode manter a primeira ou a última encontrada (mantendo a última aqui)
-                print(
-                    f"Aviso: Faturas de {cliente_key} com a mesma data de emissão ({data_emissao_str}). Mantendo a última encontrada.")
-                faturas_por_cliente[cliente_key] = (data_emissao, fatura)
+                descartadas += 1
+
+    if substituidas or descartadas:
+        print(f"Faturas duplicadas por UC: {substituidas} substituídas, {descartadas} descartadas (mais antigas).")
 
     # Retorna a lista apenas com as faturas mais recentes
     return [fatura for _, fatura in faturas_por_cliente.values()]
 
 
-def salvar_xmls_por_uc(faturas_dados: List[Dict[str, Any]], pasta_saida: str):
+def caminho_xml_por_uc(codigo_cliente: str, pasta_saida: str) -> Path:
+    """Caminho do XML de saída da unidade consumidora ([UC].xml, sem separadores)."""
+    unidade_consumidora = codigo_cliente.replace('\\', '').replace('/', '').replace('-', '')
+    return Path(pasta_saida) / f"{unidade_consumidora}.xml"
+
+
+def salvar_xmls_por_uc(faturas_dados: List[Dict[str, Any]], pasta_saida: str) -> Dict[str, str]:
     """
     Converte as faturas em strings XML separadas e as salva na pasta de saída,
-    agrupadas/nomeadas com base no CNPJ.
+    agrupadas/nomeadas com base na UC. Retorna {@id da fatura: caminho do XML salvo}.
     """
+    salvos = {}
     if not faturas_dados:
         print("Nenhuma fatura para salvar.")
-        return
+        return salvos
 
     # 1. Cria a pasta de saída se não existir
     Path(pasta_saida).mkdir(parents=True, exist_ok=True)
@@ -573,37 +615,29 @@ def salvar_xmls_por_uc(faturas_dados: List[Dict[str, Any]], pasta_saida: str):
     # O dicttoxml e manipulação de DOM é feita dentro desta função
     lista_xml_strings = converter_lote_para_xml_separado(faturas_dados)
 
-    # 3. Salva cada XML, usando o CNPJ e o nome do arquivo original no nome.
+    # 3. Salva cada XML, usando a UC no nome.
     for i, xml_string in enumerate(lista_xml_strings):
         dados_fatura = faturas_dados[i]
-        #print(dados_fatura)# Usa o índice para obter os metadados do dict original
 
-        # Extrai CNPJ e Nome do Arquivo para o nome do arquivo XML
-        #cnpj_consumidor = dados_fatura.get('cabecalho', {}).get('CnpjConsumidor')
         uc = dados_fatura.get('cabecalho', {}).get('CodigoCliente')
         nome_original_pdf = dados_fatura.get('@nome', f"arquivo_{i}.pdf")
-        unidade_consumidora = uc.replace('\\', '').replace('/', '').replace('-', '')
-        # O CNPJ é crucial para o agrupamento/nome
-        #print(cnpj_consumidor)
         if not uc:
-            print(f"Aviso: CNPJ não encontrado para o arquivo {nome_original_pdf}. Pulando salvamento.")
+            print(f"Aviso: UC não encontrada para o arquivo {nome_original_pdf}. Pulando salvamento.")
             continue
 
-        # Limpa o nome do PDF (ex: 'fatura.pdf' -> 'fatura')
-        nome_base = Path(nome_original_pdf).stem
-
-        # Define o nome do arquivo: [CNPJ]-[NomeOriginalPDF].xml
-
-        nome_arquivo_saida = f"{unidade_consumidora}.xml"
-        caminho_saida = Path(pasta_saida) / nome_arquivo_saida
+        caminho_saida = caminho_xml_por_uc(uc, pasta_saida)
+        nome_arquivo_saida = caminho_saida.name
 
         try:
             with open(caminho_saida, 'w', encoding='utf-8') as f:
                 f.write(xml_string)
+            salvos[dados_fatura.get('@id')] = str(caminho_saida)
             print(f"XML salvo com sucesso: {caminho_saida.name}")
         except Exception as e:
             print(f"Erro ao salvar o arquivo {nome_arquivo_saida}: {e}")
 
+    return salvos
+
 
 def converter_lote_para_xml_separado(lote_dados: List[Dict[str, Any]]) -> List[str]:
     """
@@ -635,7 +669,7 @@ def converter_lote_para_xml_separado(lote_dados: List[Dict[str, Any]]) -> List[s
                     key_value = child.firstChild.nodeValue if child.firstChild else ""
 
                     # Adapte a lógica: os atributos 'id' e 'nome' devem ir para o <NotaFiscalEnergia>
-                    if key_name == '@id':
+                    if key_name in ('@id', '@chave_acesso'):
                         keys_to_remove.append(child)
                     elif key_name == '@nome':
                         root.setAttribute('nome', key_value)
@@ -677,6 +711,12 @@ def converter_lote_para_xml_separado(lote_dados: List[Dict[str, Any]]) -> List[s
 
 
 def main():
+    parser = argumentos_manifesto("Extrai as faturas baixadas e gera os XMLs por UC")
+    parser.add_argument("--gravar-banco", choices=["oracle", "sqlite"], default=None,
+                        help="Grava cabeçalho e itens das faturas extraídas no banco (em lote)")
+    parser.add_argument("--tamanho-lote", type=int, default=TAMANHO_LOTE_PADRAO,
+                        help="Quantidade de faturas por transação na gravação no banco")
+    args = parser.parse_args()
     caminho_pasta = Path(PASTA_PDFS)
     arquivos_pdf = list(caminho_pasta.glob("*.pdf"))
 
@@ -684,24 +724,110 @@ def main():
         print(f"Nenhum arquivo PDF encontrado na pasta: {PASTA_PDFS}")
         return
 
-    todas_faturas = []
-
-    for i, caminho_pdf in enumerate(arquivos_pdf, 1):
-        print(f"Processando ({i}/{len(arquivos_pdf)}): {caminho_pdf.name}")
-
-        resultado_plano, tributos_data, itens_tabela_brutos = processar_regiao_parallel(caminho_pdf)
-        dados_extraidos = extrair_informacoes_estruturadas(resultado_plano, tributos_data, itens_tabela_brutos)
+    manifesto = ManifestoProcessamento(PASTA_PDFS, Path(__file__).stem, VERSAO_PARSER)
+    arquivos_pdf, relatorio = manifesto.selecionar(arquivos_pdf, desde=args.desde, todos=args.todos)
+    imprimir_relatorio(relatorio, dry_run=args.dry_run)
 
-        dados_extraidos['@id'] = str(i)
-        dados_extraidos['@nome'] = caminho_pdf.name
+    if args.dry_run or not arquivos_pdf:
+        manifesto.fechar()
+        return
 
-        todas_faturas.append(dados_extraidos)
+    registro = RegistroFaturas(CAMINHO_REGISTRO)
+    todas_faturas = []
+    hashes_pdf = {}
+    caminhos_pdf = {}
+    ids_do_grupo = {}
+    pdfs_novos = []
+    ja_processados = 0
+
+    for caminho_pdf in arquivos_pdf:
+        # PDFs já lidos em execuções anteriores (mesmo conteúdo) são pulados
+        if registro.ja_processado(manifesto.hash_arquivo(caminho_pdf)):
+            ja_processados += 1
+            manifesto.registrar(caminho_pdf)
+        else:
+            pdfs_novos.append(caminho_pdf)
+
+    if ja_processados:
+        print(f"{ja_processados} PDF(s) já processados em execuções anteriores foram ignorados.")
+
+    # Cópias do mesmo documento (mesmo conteúdo ou mesmo texto) são extraídas uma única vez
+    grupos = agrupar_pdfs_duplicados(pdfs_novos, hash_arquivo=manifesto.hash_arquivo)
+    print(resumo_duplicados(grupos))
+
+    # As consultas de CNPJ rodam em lote no estágio assíncrono enquanto os próximos PDFs são lidos
+    extraidos = []
+    with EstagioCnpj(retorno_cnpj_lote) as estagio_cnpj:
+        for n_grupo, grupo in enumerate(grupos, 1):
+            representante = grupo[0]
+            print(f"Processando ({n_grupo}/{len(grupos)}): {representante.name}"
+                  + (f" (+{len(grupo) - 1} cópia(s))" if len(grupo) > 1 else ""))
+            extraidos.append(processar_regiao_parallel(representante, estagio_cnpj=estagio_cnpj))
+
+        juntar_cnpjs([resultado_plano for resultado_plano, _, _ in extraidos])
+
+    i = 0
+    for grupo, (resultado_plano, tributos_data, itens_tabela_brutos) in zip(grupos, extraidos):
+        dados_base = extrair_informacoes_estruturadas(resultado_plano, tributos_data, itens_tabela_brutos)
+        dados_base['@chave_acesso'] = resultado_plano.get('nota_fiscal', {}).get('chave_acesso', '')
+
+        # Replica o resultado para cada nome (alias) do documento
+        ids = []
+        for caminho_pdf in grupo:
+            i += 1
+            dados_extraidos = dict(dados_base)
+            dados_extraidos['@id'] = str(i)
+            dados_extraidos['@nome'] = caminho_pdf.name
+
+            hashes_pdf[dados_extraidos['@id']] = manifesto.hash_arquivo(caminho_pdf)
+            caminhos_pdf[dados_extraidos['@id']] = caminho_pdf
+            ids.append(dados_extraidos['@id'])
+            todas_faturas.append(dados_extraidos)
+        for id_fatura in ids:
+            ids_do_grupo[id_fatura] = ids
 
     if todas_faturas:
         faturas_filtradas = filtrar_faturas_duplicadas(todas_faturas)
-        salvar_xmls_por_uc(faturas_filtradas, PASTA_XML)
+
+        # Só emite a fatura se ela for a mais recente da UC também no histórico do registro
+        faturas_para_emitir = []
+        for fatura in faturas_filtradas:
+            cabecalho = fatura.get('cabecalho', {})
+            uc = cabecalho.get('CodigoCliente')
+            caminho_saida = str(caminho_xml_por_uc(uc, PASTA_XML)) if uc else None
+            if registro.atualizar_ultima_por_uc(uc, cabecalho.get('DataEmissao'), cabecalho.get('NumeroDocumento'),
+                                                hashes_pdf[fatura['@id']], caminho_saida):
+                faturas_para_emitir.append(fatura)
+
+        salvos = salvar_xmls_por_uc(faturas_para_emitir, PASTA_XML)
+
+        # O banco é gravado antes do registro e do manifesto: se a gravação falhar, os PDFs não ficam
+        # marcados como processados e voltam na próxima execução (o upsert pela chave de acesso é idempotente)
+        if args.gravar_banco:
+            with criar_sink(args.gravar_banco, CAMINHO_SQLITE_FATURAS, args.tamanho_lote) as sink:
+                for fatura in todas_faturas:
+                    sink.adicionar(fatura)
+
+        # Falhas de gravação não são registradas, para serem refeitas na próxima execução
+        falhas = {fatura['@id'] for fatura in faturas_para_emitir
+                  if fatura.get('cabecalho', {}).get('CodigoCliente') and fatura['@id'] not in salvos}
+        for fatura in todas_faturas:
+            if fatura['@id'] in falhas:
+                continue
+            # As cópias apontam para o XML emitido pelo documento do grupo
+            caminho_saida = next((salvos[id_fatura] for id_fatura in ids_do_grupo[fatura['@id']] if id_fatura in salvos), None)
+            registro.registrar_pdf(hashes_pdf[fatura['@id']], fatura['@nome'], fatura.get('cabecalho', {}),
+                                   caminho_saida)
+            manifesto.registrar(caminhos_pdf[fatura['@id']])
         print("\nProcessamento concluído. XMLs salvos na pasta:", PASTA_XML)
 
+    estatisticas_cnpj = estatisticas_indice_local()
+    if estatisticas_cnpj:
+        print(f"Índice local de CNPJ: {estatisticas_cnpj['acertos']} acerto(s), {estatisticas_cnpj['falhas']} falha(s)")
+
+    registro.fechar()
+    manifesto.fechar()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
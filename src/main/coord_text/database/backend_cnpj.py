@@ -0,0 +1,141 @@
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+# Backend da consulta de CNPJ (tabela de empresas do Protheus, sigaemp)
+# Os extratores importam as funções daqui em vez de database.connect_oracle:
+#   CNPJ_BACKEND=oracle (padrão)  -> PROTHEUS11.sigaemp via connect_oracle (oracledb só é importado aqui)
+#   CNPJ_BACKEND=sqlite           -> snapshot local em CNPJ_SQLITE_PATH, gerado por gerar_snapshot_sigaemp.py
+# O snapshot permite importar, medir e perfilar os extratores fora da rede da empresa,
+# com as mesmas regras de busca (LIKE) e o mesmo formato de retorno.
+
+CAMINHO_SQLITE_PADRAO = str(Path(__file__).resolve().parent / "sigaemp.sqlite")
+
+
+class BackendCnpj(ABC):
+    """Interface comum: mesmos retornos de connect_oracle (listas de tuplas (M0_CGC,))"""
+
+    @abstractmethod
+    def retorno_cnpj_pdf(self, prim_num, ult_num, nome_titular, num_insc):
+        """CNPJs que casam com os dígitos, o nome e a inscrição: [(M0_CGC,), ...]"""
+
+    def retorno_cnpj_lote(self, consultas):
+        return [self.retorno_cnpj_pdf(*consulta) for consulta in consultas]
+
+    @abstractmethod
+    def carregar_empresas(self):
+        """Todas as linhas (M0_CGC, M0_NOMECOM, M0_INSC)"""
+
+    def retorno_cnpj_aproximado(self, prim_num, ult_num, nome_titular, num_insc):
+        from database.indice_nomes import IndiceNomes
+
+        if getattr(self, '_indice_nomes', None) is None:
+            self._indice_nomes = IndiceNomes(self.carregar_empresas())
+        return self._indice_nomes.buscar(prim_num, ult_num, nome_titular, num_insc)
+
+    def estatisticas_indice_local(self):
+        return None
+
+
+class BackendCnpjOracle(BackendCnpj):
+    """Protheus no Oracle (connect_oracle: pool, lote, índice local e busca aproximada)"""
+
+    def __init__(self):
+        from database import connect_oracle
+        self._oracle = connect_oracle
+
+    def retorno_cnpj_pdf(self, prim_num, ult_num, nome_titular, num_insc):
+        return self._oracle.retorno_cnpj_pdf(prim_num, ult_num, nome_titular, num_insc)
+
+    def retorno_cnpj_lote(self, consultas):
+        return self._oracle.retorno_cnpj_lote(consultas)
+
+    def carregar_empresas(self):
+        return self._oracle.carregar_empresas()
+
+    def retorno_cnpj_aproximado(self, prim_num, ult_num, nome_titular, num_insc):
+        return self._oracle.retorno_cnpj_aproximado(prim_num, ult_num, nome_titular, num_insc)
+
+    def estatisticas_indice_local(self):
+        return self._oracle.estatisticas_indice_local()
+
+
+class BackendCnpjSqlite(BackendCnpj):
+    """Snapshot local da sigaemp em SQLite (tabela sigaemp: m0_cgc, m0_nomecom, m0_insc)"""
+
+    SQL_CNPJ = """
+        SELECT m0_cgc
+        FROM sigaemp
+        WHERE m0_cgc LIKE :prim_num || '%' || :ult_num
+        AND m0_nomecom LIKE '%' || :nome_titular || '%'
+        AND m0_insc LIKE :num_insc || '%'
+        ORDER BY rowid
+        """
+
+    def __init__(self, caminho_banco=CAMINHO_SQLITE_PADRAO):
+        if not Path(caminho_banco).exists():
+            raise FileNotFoundError(
+                f"Snapshot da sigaemp não encontrado: {caminho_banco} (gere com database/gerar_snapshot_sigaemp.py)")
+        self.caminho_banco = caminho_banco
+        self._local = threading.local()  # conexões SQLite não são compartilhadas entre threads
+
+    def _conexao(self):
+        conexao = getattr(self._local, 'conexao', None)
+        if conexao is None:
+            conexao = sqlite3.connect(f"file:{self.caminho_banco}?mode=ro", uri=True)
+            conexao.execute("PRAGMA case_sensitive_like = ON")  # LIKE do Oracle diferencia maiúsculas
+            self._local.conexao = conexao
+        return conexao
+
+    def retorno_cnpj_pdf(self, prim_num, ult_num, nome_titular, num_insc):
+        return self._conexao().execute(self.SQL_CNPJ, {
+            'prim_num': prim_num, 'ult_num': ult_num,
+            'nome_titular': nome_titular, 'num_insc': num_insc,
+        }).fetchall()
+
+    def carregar_empresas(self):
+        return self._conexao().execute("SELECT m0_cgc, m0_nomecom, m0_insc FROM sigaemp ORDER BY rowid").fetchall()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def obter_backend():
+    """Backend escolhido por CNPJ_BACKEND (criado no primeiro uso)"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            nome = os.getenv('CNPJ_BACKEND', 'oracle').lower()
+            if nome == 'oracle':
+                _backend = BackendCnpjOracle()
+            elif nome == 'sqlite':
+                _backend = BackendCnpjSqlite(os.getenv('CNPJ_SQLITE_PATH', CAMINHO_SQLITE_PADRAO))
+            else:
+                raise ValueError(f"CNPJ_BACKEND inválido: {nome} (use 'oracle' ou 'sqlite')")
+    return _backend
+
+
+def definir_backend(backend):
+    """Troca o backend em tempo de execução (ex.: benchmarks com um snapshot específico)"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def retorno_cnpj_pdf(prim_num, ult_num, nome_titular, num_insc):
+    return obter_backend().retorno_cnpj_pdf(prim_num, ult_num, nome_titular, num_insc)
+
+
+def retorno_cnpj_lote(consultas):
+    return obter_backend().retorno_cnpj_lote(consultas)
+
+
+def retorno_cnpj_aproximado(prim_num, ult_num, nome_titular, num_insc):
+    return obter_backend().retorno_cnpj_aproximado(prim_num, ult_num, nome_titular, num_insc)
+
+
+def estatisticas_indice_local():
+    return obter_backend().estatisticas_indice_local()
@@ -0,0 +1,244 @@
+import oracledb
+import pandas
+import os
+import atexit
+import threading
+from contextlib import contextmanager
+#from config_db import usernameBd, passwordBd, dsn
+
+usernameBd = 'rpa'
+passwordBd= 'Rpa!2023'
+dsn = 'oracle.bomfuturo.local:1521/protheus'
+
+# Pool de conexões criado só no primeiro uso (importar o módulo não acessa a rede)
+POOL_MIN = int(os.getenv('ORACLE_POOL_MIN', 1))
+POOL_MAX = int(os.getenv('ORACLE_POOL_MAX', 8))
+POOL_INCREMENTO = int(os.getenv('ORACLE_POOL_INCREMENTO', 1))
+POOL_PING_INTERVALO = 60  # segundos ociosos antes do pool testar a conexão ao entregá-la
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _obter_pool():
+    """Cria o pool na primeira chamada (e de novo em processos filhos, que não podem herdar o pool)"""
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = oracledb.create_pool(
+                user=usernameBd, password=passwordBd, dsn=dsn,
+                min=POOL_MIN, max=POOL_MAX, increment=POOL_INCREMENTO,
+                getmode=oracledb.POOL_GETMODE_WAIT,
+                ping_interval=POOL_PING_INTERVALO,
+            )
+            _pool_pid = os.getpid()
+    return _pool
+
+
+@contextmanager
+def obter_conexao():
+    """Empresta uma conexão do pool para a thread atual e devolve ao final"""
+    with _obter_pool().acquire() as conexao:
+        yield conexao
+
+
+def verificar_conexao():
+    """
+    Health-check: faz um ping no banco. Se o banco reiniciou, recria o pool
+    para as próximas consultas. Retorna True se o banco respondeu.
+    """
+    try:
+        with obter_conexao() as conexao:
+            conexao.ping()
+        return True
+    except oracledb.Error:
+        with _pool_lock:
+            _fechar_pool_sem_lock()
+        try:
+            with obter_conexao() as conexao:
+                conexao.ping()
+            return True
+        except oracledb.Error:
+            return False
+
+
+def _fechar_pool_sem_lock():
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        try:
+            _pool.close(force=True)
+        except oracledb.Error:
+            pass
+    _pool = None
+    _pool_pid = None
+
+
+def fechar_pool():
+    with _pool_lock:
+        _fechar_pool_sem_lock()
+
+
+atexit.register(fechar_pool)
+
+
+def _consultar(sql, parametros=None):
+    """Executa a consulta com uma conexão do pool; se a conexão caiu (ex.: banco reiniciado), tenta mais uma vez"""
+    for tentativa in range(2):
+        try:
+            with obter_conexao() as conexao:
+                with conexao.cursor() as cursor:
+                    cursor.execute(sql, parametros or {})
+                    return cursor.fetchall()
+        except oracledb.DatabaseError:
+            if tentativa == 1 or not verificar_conexao():
+                raise
+
+
+SQL_CNPJ = r"""
+    SELECT m0_CGC
+    FROM PROTHEUS11.sigaemp
+    WHERE m0_CGC LIKE :prim_num || '%' || :ult_num
+    AND M0_NOMECOM LIKE '%' || :nome_titular || '%'
+    AND M0_INSC LIKE :num_insc || '%'
+    """
+
+# Resolução em lote: quantidade de consultas por ida ao banco. O lote é completado
+# com linhas vazias para o texto do SQL ser sempre o mesmo (reaproveita o statement cache)
+TAMANHO_LOTE_CNPJ = int(os.getenv('ORACLE_TAMANHO_LOTE_CNPJ', 100))
+
+# Índice local da sigaemp (database/indice_cnpj.py): ligado por ativar_indice_local()
+# ou pela variável de ambiente CNPJ_INDICE_LOCAL=1 (TTL em CNPJ_INDICE_TTL, snapshot em CNPJ_INDICE_SNAPSHOT)
+_indice = None
+_indice_lock = threading.Lock()
+
+
+def carregar_empresas():
+    """Tabela de empresas inteira, para o índice local"""
+    return _consultar("SELECT m0_CGC, M0_NOMECOM, M0_INSC FROM PROTHEUS11.sigaemp")
+
+
+def ativar_indice_local(ttl=None, caminho_snapshot=None):
+    """Carrega a sigaemp em memória; retorno_cnpj_pdf e retorno_cnpj_lote passam a responder pelo índice"""
+    global _indice
+    from database.indice_cnpj import IndiceCnpj, TTL_PADRAO
+
+    with _indice_lock:
+        if _indice is None:
+            _indice = IndiceCnpj(
+                carregar_empresas,
+                ttl=ttl if ttl is not None else int(os.getenv('CNPJ_INDICE_TTL', TTL_PADRAO)),
+                caminho_snapshot=caminho_snapshot or os.getenv('CNPJ_INDICE_SNAPSHOT'),
+            )
+    return _indice
+
+
+def _indice_ativo():
+    if _indice is None and os.getenv('CNPJ_INDICE_LOCAL') == '1':
+        ativar_indice_local()
+    return _indice
+
+
+_indice_nomes = None
+_indice_nomes_versao = None
+
+
+def _obter_indice_nomes():
+    """Índice de trigramas dos nomes, montado sobre a carga do índice local (ou uma carga própria)"""
+    global _indice_nomes, _indice_nomes_versao
+    from database.indice_nomes import IndiceNomes
+
+    indice = _indice_ativo()
+    versao = indice.carregado_em if indice is not None else 'banco'
+    with _indice_lock:
+        if _indice_nomes is None or _indice_nomes_versao != versao:
+            if indice is not None:
+                _indice_nomes = IndiceNomes(carga=indice.carga)
+            else:
+                _indice_nomes = IndiceNomes(carregar_empresas())
+            _indice_nomes_versao = versao
+    return _indice_nomes
+
+
+def retorno_cnpj_aproximado(prim_num, ult_num, nome_titular, num_insc):
+    """
+    Busca tolerante a ruído no nome (OCR, letras duplicadas, nome cortado) restrita pelos dígitos
+    do CNPJ/inscrição. Retorna (cnpj, confianca entre 0 e 1); cnpj vazio se não houver candidato único.
+    """
+    return _obter_indice_nomes().buscar(prim_num, ult_num, nome_titular, num_insc)
+
+
+def estatisticas_indice_local():
+    """Acertos/falhas do índice local (None se o índice não estiver ativo)"""
+    return _indice.estatisticas() if _indice is not None else None
+
+
+def retorno_cnpj_pdf(prim_num,ult_num,nome_titular,num_insc):
+
+    indice = _indice_ativo()
+    if indice is not None:
+        return indice.buscar(prim_num, ult_num, nome_titular, num_insc)
+
+    cnpj_atual = _consultar(SQL_CNPJ, {
+        'prim_num': prim_num, 'ult_num': ult_num,
+        'nome_titular': nome_titular, 'num_insc': num_insc,
+    })
+
+    return cnpj_atual
+
+
+def _sql_cnpj_lote(tamanho_lote):
+    linhas = "\n        UNION ALL ".join(
+        f"SELECT :i{n} AS idx, :p{n} AS prim_num, :u{n} AS ult_num, :n{n} AS nome_titular, :s{n} AS num_insc FROM dual"
+        for n in range(tamanho_lote)
+    )
+    return fr"""
+        WITH consultas AS (
+        {linhas}
+        )
+        SELECT c.idx, e.m0_CGC
+        FROM consultas c
+        JOIN PROTHEUS11.sigaemp e
+          ON e.m0_CGC LIKE c.prim_num || '%' || c.ult_num
+         AND e.M0_NOMECOM LIKE '%' || c.nome_titular || '%'
+         AND e.M0_INSC LIKE c.num_insc || '%'
+        WHERE c.idx >= 0
+        ORDER BY c.idx
+        """
+
+
+def retorno_cnpj_lote(consultas, tamanho_lote=TAMANHO_LOTE_CNPJ):
+    """
+    Resolve várias consultas (prim_num, ult_num, nome_titular, num_insc) com uma ida ao banco por lote.
+    Retorna uma lista alinhada com `consultas`, cada posição no mesmo formato de retorno_cnpj_pdf.
+    """
+    consultas = [tuple(consulta) for consulta in consultas]
+    indice = _indice_ativo()
+    if indice is not None:
+        return [indice.buscar(*consulta) for consulta in consultas]
+
+    unicas = list(dict.fromkeys(consultas))  # faturas com os mesmos parâmetros são consultadas uma vez
+    resultados_unicos = {consulta: [] for consulta in unicas}
+    sql = _sql_cnpj_lote(tamanho_lote)
+
+    for inicio in range(0, len(unicas), tamanho_lote):
+        lote = unicas[inicio:inicio + tamanho_lote]
+        parametros = {}
+        for n in range(tamanho_lote):
+            # Posições de preenchimento têm idx -1 e são descartadas no WHERE
+            prim_num, ult_num, nome_titular, num_insc = lote[n] if n < len(lote) else (None, None, None, None)
+            parametros.update({
+                f'i{n}': n if n < len(lote) else -1,
+                f'p{n}': prim_num, f'u{n}': ult_num, f'n{n}': nome_titular, f's{n}': num_insc,
+            })
+
+        for idx, cgc in _consultar(sql, parametros):
+            resultados_unicos[lote[int(idx)]].append((cgc,))
+
+    return [resultados_unicos[consulta] for consulta in consultas]
+
+if __name__ == '__main__':
+    retorno_cnpj_pdf('', '', '', '')
@@ -0,0 +1,91 @@
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Estágio assíncrono de resolução de CNPJ
+# A extração do PDF enfileira a consulta e segue com o resto do documento (tabela de itens,
+# próximos PDFs); o resultado é buscado com futuro.result() só na hora de montar a fatura.
+# Um coletor agrupa as consultas que chegam em sequência (até `tamanho_lote` ou `espera_max`
+# segundos) e cada grupo vira uma chamada a `resolver_lote` em um pool pequeno de threads.
+
+TAMANHO_LOTE_PADRAO = 50
+ESPERA_MAX_PADRAO = 0.05  # segundos esperando mais consultas antes de mandar o lote
+MAX_WORKERS_PADRAO = 2
+
+_FIM = object()
+
+
+class EstagioCnpj:
+    """
+    `resolver_lote` recebe uma lista de parâmetros (prim_num, ult_num, nome_titular, num_insc)
+    e devolve a lista de resultados na mesma ordem (ex.: connect_oracle.retorno_cnpj_lote).
+    """
+
+    def __init__(self, resolver_lote, tamanho_lote=TAMANHO_LOTE_PADRAO, espera_max=ESPERA_MAX_PADRAO,
+                 max_workers=MAX_WORKERS_PADRAO):
+        self.resolver_lote = resolver_lote
+        self.tamanho_lote = tamanho_lote
+        self.espera_max = espera_max
+        self._fila = queue.Queue()
+        self._em_andamento = {}  # parâmetros -> futuro (consultas repetidas na execução reaproveitam o mesmo)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="estagio-cnpj")
+        self._coletor = threading.Thread(target=self._coletar, name="coletor-cnpj", daemon=True)
+        self._coletor.start()
+        self.lotes_enviados = 0
+
+    def enviar(self, parametros) -> Future:
+        """Enfileira a consulta e retorna um Future com o resultado"""
+        parametros = tuple(parametros)
+        with self._lock:
+            futuro = self._em_andamento.get(parametros)
+            if futuro is not None:
+                return futuro
+            futuro = Future()
+            self._em_andamento[parametros] = futuro
+        self._fila.put((parametros, futuro))
+        return futuro
+
+    def _coletar(self):
+        while True:
+            item = self._fila.get()
+            if item is _FIM:
+                return
+            lote = [item]
+            fim = False
+            while len(lote) < self.tamanho_lote:
+                try:
+                    proximo = self._fila.get(timeout=self.espera_max)
+                except queue.Empty:
+                    break
+                if proximo is _FIM:
+                    fim = True
+                    break
+                lote.append(proximo)
+
+            self._executor.submit(self._resolver, lote)
+            self.lotes_enviados += 1
+            if fim:
+                return
+
+    def _resolver(self, lote):
+        try:
+            resultados = self.resolver_lote([parametros for parametros, _ in lote])
+            for (_, futuro), resultado in zip(lote, resultados):
+                futuro.set_result(resultado)
+        except Exception as e:
+            for _, futuro in lote:
+                if not futuro.done():
+                    futuro.set_exception(e)
+
+    def fechar(self):
+        """Espera as consultas pendentes terminarem e encerra as threads"""
+        self._fila.put(_FIM)
+        self._coletor.join()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
@@ -0,0 +1,66 @@
+import argparse
+import csv
+import sqlite3
+import sys
+from pathlib import Path
+
+# Gera o snapshot SQLite da sigaemp usado pelo backend local (CNPJ_BACKEND=sqlite)
+# a partir de um CSV exportado do Protheus com as colunas M0_CGC, M0_NOMECOM e M0_INSC.
+# Uso: python gerar_snapshot_sigaemp.py sigaemp.csv [--saida sigaemp.sqlite]
+
+COLUNAS = ("M0_CGC", "M0_NOMECOM", "M0_INSC")
+CAMINHO_SAIDA_PADRAO = str(Path(__file__).resolve().parent / "sigaemp.sqlite")
+
+
+def ler_csv(caminho_csv, encoding):
+    with open(caminho_csv, newline='', encoding=encoding) as f:
+        amostra = f.read(4096)
+        f.seek(0)
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=';,\t|')
+        leitor = csv.DictReader(f, dialect=dialeto)
+
+        # Cabeçalho sem diferenciar maiúsculas/minúsculas
+        mapa = {campo.strip().upper(): campo for campo in (leitor.fieldnames or [])}
+        faltando = [coluna for coluna in COLUNAS if coluna not in mapa]
+        if faltando:
+            raise ValueError(f"Colunas ausentes no CSV: {', '.join(faltando)}")
+
+        for linha in leitor:
+            # Sem strip: os valores ficam como no banco, para o LIKE dar o mesmo resultado
+            yield tuple(linha[mapa[coluna]] for coluna in COLUNAS)
+
+
+def gerar_snapshot(caminho_csv, caminho_saida=CAMINHO_SAIDA_PADRAO, encoding='utf-8-sig'):
+    caminho_temp = Path(str(caminho_saida) + ".tmp")
+    caminho_temp.unlink(missing_ok=True)
+
+    conexao = sqlite3.connect(caminho_temp)
+    conexao.execute("CREATE TABLE sigaemp (m0_cgc TEXT, m0_nomecom TEXT, m0_insc TEXT)")
+    conexao.executemany("INSERT INTO sigaemp (m0_cgc, m0_nomecom, m0_insc) VALUES (?, ?, ?)",
+                        ler_csv(caminho_csv, encoding))
+    total = conexao.execute("SELECT COUNT(*) FROM sigaemp").fetchone()[0]
+    conexao.commit()
+    conexao.close()
+
+    # Troca atômica: quem estiver lendo o snapshot antigo não vê um arquivo pela metade
+    caminho_temp.replace(caminho_saida)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera o snapshot SQLite da sigaemp a partir de um CSV")
+    parser.add_argument("csv", help="CSV exportado com as colunas M0_CGC, M0_NOMECOM, M0_INSC")
+    parser.add_argument("--saida", default=CAMINHO_SAIDA_PADRAO, help="Arquivo SQLite de saída")
+    parser.add_argument("--encoding", default="utf-8-sig", help="Encoding do CSV (ex.: latin-1)")
+    args = parser.parse_args()
+
+    try:
+        total = gerar_snapshot(args.csv, args.saida, args.encoding)
+    except (OSError, ValueError, csv.Error) as e:
+        print(f"Erro ao gerar o snapshot: {e}")
+        sys.exit(1)
+    print(f"Snapshot gerado em {args.saida} com {total} empresa(s).")
+
+
+if __name__ == "__main__":
+    main()
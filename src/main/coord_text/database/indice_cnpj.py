@@ -0,0 +1,220 @@
+import json
+import re
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+# Índice local da tabela de empresas (PROTHEUS11.sigaemp: M0_CGC, M0_NOMECOM, M0_INSC)
+# A tabela tem poucos milhares de linhas e quase não muda: é carregada uma vez por execução
+# (ou de um arquivo de snapshot) e as consultas de retorno_cnpj_pdf são respondidas em memória,
+# com a mesma regra dos LIKE do SQL:
+#   M0_CGC LIKE 'prim%ult'  /  M0_NOMECOM LIKE '%nome%'  /  M0_INSC LIKE 'insc%'
+# Os mapas abaixo só reduzem os candidatos; a verificação final é sempre a regra exata.
+
+TAMANHO_MAX_CHAVE = 4    # prefixos/sufixos indexados (consultas mais longas filtram pelo mais longo disponível)
+TTL_PADRAO = 6 * 60 * 60  # segundos entre recargas em segundo plano
+
+
+def normalizar_nome(nome):
+    """Maiúsculas e sem acentos (só para montar/consultar o índice de nomes)"""
+    nome = unicodedata.normalize('NFKD', nome or '')
+    return ''.join(c for c in nome if not unicodedata.combining(c)).upper()
+
+
+def tokens_nome(nome):
+    return set(re.findall(r'[A-Z0-9]+', normalizar_nome(nome)))
+
+
+def _casa_digitos(cgc, insc, prim_num, ult_num, num_insc):
+    """CNPJ começa com prim_num e termina com ult_num; inscrição começa com num_insc (se informada)"""
+    if cgc is None or (num_insc and insc is None):
+        return False
+    return (len(cgc) >= len(prim_num) + len(ult_num)
+            and cgc.startswith(prim_num) and cgc.endswith(ult_num)
+            and (insc or '').startswith(num_insc))
+
+
+def _casa_like(cgc, nome_comercial, insc, prim_num, ult_num, nome_titular, num_insc):
+    """Mesma regra dos LIKE da consulta SQL (valores nulos não casam)"""
+    if cgc is None or nome_comercial is None or insc is None:
+        return False
+    return (len(cgc) >= len(prim_num) + len(ult_num)
+            and cgc.startswith(prim_num) and cgc.endswith(ult_num)
+            and nome_titular in nome_comercial
+            and insc.startswith(num_insc))
+
+
+class CargaEmpresas:
+    """
+    Dados e mapas de uma carga da tabela (trocados de uma vez na recarga).
+    Também é a base do índice de nomes (indice_nomes.py), que filtra pelos mesmos mapas de dígitos.
+    """
+
+    def __init__(self, linhas, carregado_em=None):
+        self.linhas = [tuple(linha) for linha in linhas]
+        self.carregado_em = carregado_em
+        self.por_prefixo_cgc = {}
+        self.por_sufixo_cgc = {}
+        self.por_prefixo_insc = {}
+        self.por_token_nome = {}
+
+        for pos, (cgc, nome_comercial, insc) in enumerate(self.linhas):
+            cgc = cgc or ''
+            insc = insc or ''
+            for tamanho in range(1, TAMANHO_MAX_CHAVE + 1):
+                if len(cgc) >= tamanho:
+                    self.por_prefixo_cgc.setdefault(cgc[:tamanho], set()).add(pos)
+                    self.por_sufixo_cgc.setdefault(cgc[-tamanho:], set()).add(pos)
+                if len(insc) >= tamanho:
+                    self.por_prefixo_insc.setdefault(insc[:tamanho], set()).add(pos)
+            for token in tokens_nome(nome_comercial):
+                self.por_token_nome.setdefault(token, set()).add(pos)
+
+    def _candidatos_nome(self, nome_titular):
+        """Linhas cujo nome contém a maior palavra da consulta (a palavra pode estar cortada nas pontas)"""
+        tokens = re.findall(r'[A-Z0-9]+', normalizar_nome(nome_titular))
+        if not tokens:
+            return None
+        maior = max(tokens, key=len)
+        candidatos = set()
+        for token, posicoes in self.por_token_nome.items():
+            if maior in token:
+                candidatos |= posicoes
+        return candidatos
+
+    def posicoes_por_digitos(self, prim_num, ult_num, num_insc):
+        """Linhas que casam com os dígitos do CNPJ (início/fim) e da inscrição (início); None = sem filtro"""
+        filtros = []
+        if prim_num:
+            filtros.append(self.por_prefixo_cgc.get(prim_num[:TAMANHO_MAX_CHAVE], set()))
+        if ult_num:
+            filtros.append(self.por_sufixo_cgc.get(ult_num[-TAMANHO_MAX_CHAVE:], set()))
+        if num_insc:
+            filtros.append(self.por_prefixo_insc.get(num_insc[:TAMANHO_MAX_CHAVE], set()))
+        if not filtros:
+            return None
+
+        filtros.sort(key=len)
+        posicoes = set(filtros[0]).intersection(*filtros[1:])
+        # Os mapas só guardam até TAMANHO_MAX_CHAVE dígitos: a verificação final é pelos dígitos completos
+        return {pos for pos in posicoes
+                if _casa_digitos(self.linhas[pos][0], self.linhas[pos][2], prim_num, ult_num, num_insc)}
+
+    def buscar(self, prim_num, ult_num, nome_titular, num_insc):
+        filtros = []
+        posicoes = self.posicoes_por_digitos(prim_num, ult_num, num_insc)
+        if posicoes is not None:
+            filtros.append(posicoes)
+        if nome_titular:
+            candidatos_nome = self._candidatos_nome(nome_titular)
+            if candidatos_nome is not None:
+                filtros.append(candidatos_nome)
+
+        if filtros:
+            filtros.sort(key=len)
+            candidatos = set(filtros[0]).intersection(*filtros[1:])
+        else:
+            candidatos = range(len(self.linhas))
+
+        return [(self.linhas[pos][0],) for pos in sorted(candidatos)
+                if _casa_like(*self.linhas[pos], prim_num, ult_num, nome_titular, num_insc)]
+
+
+class IndiceCnpj:
+    """
+    Índice em memória das empresas, recarregado em segundo plano a cada `ttl` segundos.
+    `carregador` é uma função sem argumentos que devolve as linhas (M0_CGC, M0_NOMECOM, M0_INSC).
+    Com `caminho_snapshot`, a carga é gravada em JSON e reaproveitada enquanto tiver menos de `ttl` segundos.
+    """
+
+    def __init__(self, carregador, ttl=TTL_PADRAO, caminho_snapshot=None, recarregar_em_segundo_plano=True):
+        self.carregador = carregador
+        self.ttl = ttl
+        self.caminho_snapshot = Path(caminho_snapshot) if caminho_snapshot else None
+        self.acertos = 0
+        self.falhas = 0
+        self.recargas = 0
+        self._lock_contadores = threading.Lock()
+        self._parar = threading.Event()
+        self._estado = self._carregar_inicial()
+
+        self._thread = None
+        if recarregar_em_segundo_plano and ttl:
+            self._thread = threading.Thread(target=self._laco_recarga, name="recarga-indice-cnpj", daemon=True)
+            self._thread.start()
+
+    def _carregar_inicial(self):
+        if self.caminho_snapshot and self.caminho_snapshot.exists():
+            try:
+                dados = json.loads(self.caminho_snapshot.read_text(encoding='utf-8'))
+                if time.time() - dados['carregado_em'] < self.ttl:
+                    return CargaEmpresas(dados['linhas'], dados['carregado_em'])
+            except (ValueError, KeyError, OSError) as e:
+                print(f"Aviso: snapshot do índice de CNPJ inválido ({e}). Carregando do banco.")
+        return self._carregar_do_banco()
+
+    def _carregar_do_banco(self):
+        estado = CargaEmpresas(self.carregador(), time.time())
+        if self.caminho_snapshot:
+            try:
+                self.caminho_snapshot.write_text(
+                    json.dumps({'carregado_em': estado.carregado_em, 'linhas': estado.linhas}),
+                    encoding='utf-8')
+            except OSError as e:
+                print(f"Aviso: não foi possível gravar o snapshot do índice de CNPJ: {e}")
+        return estado
+
+    def recarregar(self):
+        """Recarrega a tabela; as consultas continuam usando a carga anterior até a troca"""
+        self._estado = self._carregar_do_banco()
+        self.recargas += 1
+
+    def _laco_recarga(self):
+        while True:
+            espera = max(self._estado.carregado_em + self.ttl - time.time(), 1)
+            if self._parar.wait(espera):
+                return
+            try:
+                self.recarregar()
+            except Exception as e:
+                # Sem banco, segue com a carga atual e tenta de novo no próximo ciclo
+                print(f"Aviso: falha ao recarregar o índice de CNPJ: {e}")
+                if self._parar.wait(min(self.ttl, 300)):
+                    return
+
+    def buscar(self, prim_num, ult_num, nome_titular, num_insc):
+        """Mesmo retorno de retorno_cnpj_pdf: lista de tuplas (M0_CGC,)"""
+        resultado = self._estado.buscar(prim_num or '', ult_num or '', nome_titular or '', num_insc or '')
+        with self._lock_contadores:
+            if resultado:
+                self.acertos += 1
+            else:
+                self.falhas += 1
+        return resultado
+
+    @property
+    def linhas(self):
+        """Linhas da carga atual (M0_CGC, M0_NOMECOM, M0_INSC)"""
+        return self._estado.linhas
+
+    @property
+    def carga(self):
+        """CargaEmpresas atual (reaproveitada pelo índice de nomes)"""
+        return self._estado
+
+    @property
+    def carregado_em(self):
+        return self._estado.carregado_em
+
+    def estatisticas(self):
+        return {
+            'empresas': len(self._estado.linhas),
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'recargas': self.recargas,
+            'carregado_em': self._estado.carregado_em,
+        }
+
+    def parar(self):
+        self._parar.set()
@@ -0,0 +1,116 @@
+import re
+import unicodedata
+from collections import Counter
+from database.indice_cnpj import CargaEmpresas
+
+# Busca aproximada do nome do titular na tabela de empresas (sigaemp)
+# O LIKE '%nome%' falha quando o nome extraído do PDF vem com ruído de OCR, com letras
+# duplicadas pelo negrito do PDF ("EERRAAII") ou cortado pela caixa da região.
+# Aqui os nomes viram trigramas em listas invertidas: só são pontuadas as empresas que
+# compartilham algum trigrama com a consulta, e só entre as que casam com os dígitos conhecidos
+# do CNPJ/inscrição (filtrados antes da pontuação pela CargaEmpresas do indice_cnpj).
+
+LIMIAR_CONFIANCA = 0.6  # pontuação mínima para aceitar o candidato
+MARGEM_MINIMA = 0.1     # diferença mínima para o 2º CNPJ distinto (abaixo disso é ambíguo)
+
+
+def corrigir_glifos_duplicados(nome):
+    """'FFAAZZEENNDDAA BBOOMM' -> 'FAZENDA BOM' (só palavras inteiras com todas as letras em pares)"""
+    palavras = []
+    for palavra in nome.split():
+        if len(palavra) >= 4 and len(palavra) % 2 == 0 and all(
+                palavra[i] == palavra[i + 1] for i in range(0, len(palavra), 2)):
+            palavra = palavra[::2]
+        palavras.append(palavra)
+    return ' '.join(palavras)
+
+
+def normalizar(nome):
+    """Maiúsculas, sem acentos, só letras/dígitos separados por um espaço"""
+    nome = unicodedata.normalize('NFKD', nome or '')
+    nome = ''.join(c for c in nome if not unicodedata.combining(c)).upper()
+    return ' '.join(re.findall(r'[A-Z0-9]+', nome))
+
+
+def trigramas(nome):
+    grams = Counter()
+    for palavra in nome.split():
+        palavra = f"  {palavra} "
+        for i in range(len(palavra) - 2):
+            grams[palavra[i:i + 3]] += 1
+    return grams
+
+
+class IndiceNomes:
+    """
+    Índice de trigramas dos nomes das empresas sobre uma CargaEmpresas (a do índice local, quando ativo),
+    ou sobre `linhas` (M0_CGC, M0_NOMECOM, M0_INSC) numa carga própria
+    """
+
+    def __init__(self, linhas=(), carga=None):
+        self.carga = carga if carga is not None else CargaEmpresas(linhas)
+        self.linhas = self.carga.linhas
+        self._postagens = {}
+        self._total_trigramas = []
+        for pos, (_, nome_comercial, _) in enumerate(self.linhas):
+            grams = trigramas(normalizar(nome_comercial))
+            self._total_trigramas.append(sum(grams.values()))
+            for gram, quantidade in grams.items():
+                self._postagens.setdefault(gram, []).append((pos, quantidade))
+
+    def posicoes_por_digitos(self, prim_num, ult_num, num_insc):
+        """Empresas que casam com os dígitos do CNPJ/inscrição lidos do PDF (None = sem filtro)"""
+        return self.carga.posicoes_por_digitos(prim_num, ult_num, num_insc)
+
+    def candidatos(self, nome, limite=10, posicoes=None):
+        """
+        Melhores (posição, pontuação) para um nome com ruído, opcionalmente só entre `posicoes`.
+        Pontuação = fração dos trigramas da consulta encontrados no nome da empresa
+        (tolera nome cortado), com o coeficiente de Dice como desempate.
+        """
+        consulta = trigramas(normalizar(corrigir_glifos_duplicados(normalizar(nome))))
+        total_consulta = sum(consulta.values())
+        if not total_consulta:
+            return []
+
+        comuns = Counter()
+        for gram, quantidade in consulta.items():
+            for pos, quantidade_empresa in self._postagens.get(gram, ()):
+                if posicoes is None or pos in posicoes:
+                    comuns[pos] += min(quantidade, quantidade_empresa)
+
+        pontuados = []
+        for pos, compartilhados in comuns.items():
+            contencao = compartilhados / total_consulta
+            dice = 2 * compartilhados / (total_consulta + self._total_trigramas[pos])
+            pontuados.append((pos, contencao, dice))
+        pontuados.sort(key=lambda item: (item[1], item[2]), reverse=True)
+        return [(pos, round(contencao, 4)) for pos, contencao, _ in pontuados[:limite]]
+
+    def buscar(self, prim_num, ult_num, nome_titular, num_insc, limite=50):
+        """
+        Combina o nome aproximado com os dígitos do CNPJ e da inscrição lidos do PDF.
+        Retorna (cnpj, confianca); cnpj vazio se nenhum candidato for único e confiável.
+        """
+        prim_num, ult_num, num_insc = prim_num or '', ult_num or '', num_insc or ''
+        # Dígitos primeiro: com muitos nomes parecidos ("FAZENDA ..."), o corte em `limite` pelo nome
+        # não pode descartar a empresa certa antes da checagem do CNPJ/inscrição
+        posicoes = self.posicoes_por_digitos(prim_num, ult_num, num_insc)
+        if posicoes is not None and not posicoes:
+            return "", 0.0
+
+        melhores = {}
+        for pos, pontuacao in self.candidatos(nome_titular, limite, posicoes):
+            cgc = self.linhas[pos][0]
+            if cgc is None:
+                continue
+            melhores[cgc] = max(pontuacao, melhores.get(cgc, 0.0))
+
+        if not melhores:
+            return "", 0.0
+        ordenados = sorted(melhores.items(), key=lambda item: item[1], reverse=True)
+        cgc, pontuacao = ordenados[0]
+        segunda = ordenados[1][1] if len(ordenados) > 1 else 0.0
+        if pontuacao < LIMIAR_CONFIANCA or pontuacao - segunda < MARGEM_MINIMA:
+            return "", pontuacao
+        return cgc, pontuacao
@@ -0,0 +1,224 @@
+import sqlite3
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List
+
+# Gravação em lote das faturas extraídas (cabeçalho + itens)
+# - array DML (executemany) em lotes de tamanho configurável, uma transação por lote
+# - upsert pela chave de acesso (MERGE no Oracle / ON CONFLICT no SQLite)
+# - os itens da fatura são substituídos (DELETE + INSERT) na mesma transação do cabeçalho
+
+TABELA_CABECALHO = "RPA.NFCEE_CABECALHO"
+TABELA_ITENS = "RPA.NFCEE_ITENS"
+TAMANHO_LOTE_PADRAO = 500
+
+
+def valor_br_para_float(valor_str):
+    """'1.234,56' -> 1234.56 (None se vazio ou inválido)"""
+    if valor_str is None or str(valor_str).strip() == "":
+        return None
+    try:
+        return float(str(valor_str).strip().replace('.', '').replace(',', '.'))
+    except ValueError:
+        return None
+
+
+class SinkFaturas(ABC):
+    """Base dos destinos: acumula as faturas e grava em lote; as subclasses abrem `self.conexao`"""
+
+    def __init__(self, tamanho_lote=TAMANHO_LOTE_PADRAO):
+        self.tamanho_lote = tamanho_lote
+        self._buffer: Dict[str, Dict[str, Any]] = {}
+        self.total_gravadas = 0
+        self.sem_chave = 0
+
+    def adicionar(self, fatura: Dict[str, Any]):
+        """Adiciona uma fatura ao lote; grava automaticamente ao atingir o tamanho do lote"""
+        chave = fatura.get('@chave_acesso')
+        if not chave:
+            self.sem_chave += 1
+            print(f"Aviso: Fatura {fatura.get('@nome', 'sem nome')} sem chave de acesso. Não será gravada no banco.")
+            return
+
+        # Cópias da mesma fatura no lote viram uma única linha
+        self._buffer[chave] = fatura
+        if len(self._buffer) >= self.tamanho_lote:
+            self.descarregar()
+
+    def descarregar(self):
+        """Grava o lote atual em uma única transação"""
+        if not self._buffer:
+            return
+        faturas = list(self._buffer.values())
+        linhas_cabecalho = [self._linha_cabecalho(fatura) for fatura in faturas]
+        linhas_itens = [linha for fatura in faturas for linha in self._linhas_itens(fatura)]
+        chaves = [(linha['chave_acesso'],) for linha in linhas_cabecalho]
+
+        self._gravar_lote(linhas_cabecalho, chaves, linhas_itens)
+        self.total_gravadas += len(faturas)
+        self._buffer.clear()
+
+    def fechar(self):
+        """Grava o que restou no lote e fecha a conexão (fechada também se a gravação falhar)"""
+        try:
+            self.descarregar()
+        finally:
+            self.conexao.close()
+        print(f"Faturas gravadas no banco: {self.total_gravadas}" +
+              (f" ({self.sem_chave} sem chave de acesso)" if self.sem_chave else ""))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo_erro, *exc):
+        # Com erro no meio do bloco o lote pendente é descartado; só a conexão é fechada
+        if tipo_erro is None:
+            self.fechar()
+        else:
+            self.conexao.close()
+
+    @staticmethod
+    def _linha_cabecalho(fatura: Dict[str, Any]) -> Dict[str, Any]:
+        cabecalho = fatura.get('cabecalho', {})
+        return {
+            'chave_acesso': fatura.get('@chave_acesso'),
+            'tipo_documento': cabecalho.get('TipoDocumento'),
+            'especie_documento': cabecalho.get('EspecieDocumento'),
+            'data_emissao': cabecalho.get('DataEmissao'),
+            'numero_documento': cabecalho.get('NumeroDocumento'),
+            'serie': cabecalho.get('Serie'),
+            'cnpj_consumidor': cabecalho.get('CnpjConsumidor'),
+            'valor_total': valor_br_para_float(cabecalho.get('ValorTotal')),
+            'codigo_cliente': cabecalho.get('CodigoCliente'),
+            'referencia_mes_ano': cabecalho.get('ReferenciaMesAno'),
+            'data_vencimento': cabecalho.get('DataVencimento'),
+            'nome_arquivo': fatura.get('@nome'),
+        }
+
+    @staticmethod
+    def _linhas_itens(fatura: Dict[str, Any]) -> List[Dict[str, Any]]:
+        itens = fatura.get('itens', {})
+        return [
+            {'chave_acesso': fatura.get('@chave_acesso'), 'tipo_item': tipo, 'valor': valor_br_para_float(valor)}
+            for tipo, valor in itens.items()
+        ]
+
+    @abstractmethod
+    def _gravar_lote(self, linhas_cabecalho, chaves, linhas_itens):
+        """Grava cabeçalhos e itens do lote numa única transação"""
+
+
+class SinkFaturasOracle(SinkFaturas):
+    """Grava no Oracle com MERGE + executemany (array DML)"""
+
+    SQL_MERGE_CABECALHO = f"""
+        MERGE INTO {TABELA_CABECALHO} d
+        USING (SELECT :chave_acesso AS chave_acesso FROM dual) s
+        ON (d.CHAVE_ACESSO = s.chave_acesso)
+        WHEN MATCHED THEN UPDATE SET
+            d.TIPO_DOCUMENTO = :tipo_documento,
+            d.ESPECIE_DOCUMENTO = :especie_documento,
+            d.DATA_EMISSAO = TO_DATE(:data_emissao, 'DD/MM/YYYY'),
+            d.NUMERO_DOCUMENTO = :numero_documento,
+            d.SERIE = :serie,
+            d.CNPJ_CONSUMIDOR = :cnpj_consumidor,
+            d.VALOR_TOTAL = :valor_total,
+            d.CODIGO_CLIENTE = :codigo_cliente,
+            d.REFERENCIA_MES_ANO = :referencia_mes_ano,
+            d.DATA_VENCIMENTO = TO_DATE(:data_vencimento, 'DD/MM/YYYY'),
+            d.NOME_ARQUIVO = :nome_arquivo,
+            d.ATUALIZADO_EM = SYSDATE
+        WHEN NOT MATCHED THEN INSERT (
+            CHAVE_ACESSO, TIPO_DOCUMENTO, ESPECIE_DOCUMENTO, DATA_EMISSAO, NUMERO_DOCUMENTO, SERIE,
+            CNPJ_CONSUMIDOR, VALOR_TOTAL, CODIGO_CLIENTE, REFERENCIA_MES_ANO, DATA_VENCIMENTO, NOME_ARQUIVO, ATUALIZADO_EM
+        ) VALUES (
+            s.chave_acesso, :tipo_documento, :especie_documento, TO_DATE(:data_emissao, 'DD/MM/YYYY'), :numero_documento, :serie,
+            :cnpj_consumidor, :valor_total, :codigo_cliente, :referencia_mes_ano, TO_DATE(:data_vencimento, 'DD/MM/YYYY'),
+            :nome_arquivo, SYSDATE
+        )"""
+
+    SQL_DELETE_ITENS = f"DELETE FROM {TABELA_ITENS} WHERE CHAVE_ACESSO = :1"
+    SQL_INSERT_ITENS = f"INSERT INTO {TABELA_ITENS} (CHAVE_ACESSO, TIPO_ITEM, VALOR) VALUES (:chave_acesso, :tipo_item, :valor)"
+
+    def __init__(self, conexao=None, tamanho_lote=TAMANHO_LOTE_PADRAO):
+        super().__init__(tamanho_lote)
+        if conexao is None:
+            import oracledb
+            from database.connect_oracle import usernameBd, passwordBd, dsn
+            conexao = oracledb.connect(user=usernameBd, password=passwordBd, dsn=dsn)
+        self.conexao = conexao
+
+    def _gravar_lote(self, linhas_cabecalho, chaves, linhas_itens):
+        cursor = self.conexao.cursor()
+        try:
+            cursor.executemany(self.SQL_MERGE_CABECALHO, linhas_cabecalho)
+            cursor.executemany(self.SQL_DELETE_ITENS, chaves)
+            if linhas_itens:
+                cursor.executemany(self.SQL_INSERT_ITENS, linhas_itens)
+            self.conexao.commit()
+        except Exception:
+            self.conexao.rollback()
+            raise
+        finally:
+            cursor.close()
+
+
+class SinkFaturasSqlite(SinkFaturas):
+    """Mesma interface do Oracle, gravando em um arquivo SQLite (testes locais)"""
+
+    def __init__(self, caminho_banco, tamanho_lote=TAMANHO_LOTE_PADRAO):
+        super().__init__(tamanho_lote)
+        self.conexao = sqlite3.connect(caminho_banco)
+        self.conexao.executescript("""
+            CREATE TABLE IF NOT EXISTS nfcee_cabecalho (
+                chave_acesso TEXT PRIMARY KEY,
+                tipo_documento TEXT, especie_documento TEXT, data_emissao TEXT, numero_documento TEXT,
+                serie TEXT, cnpj_consumidor TEXT, valor_total REAL, codigo_cliente TEXT,
+                referencia_mes_ano TEXT, data_vencimento TEXT, nome_arquivo TEXT, atualizado_em TEXT
+            );
+            CREATE TABLE IF NOT EXISTS nfcee_itens (
+                chave_acesso TEXT NOT NULL,
+                tipo_item TEXT NOT NULL,
+                valor REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_itens_chave ON nfcee_itens (chave_acesso);
+        """)
+
+    def _gravar_lote(self, linhas_cabecalho, chaves, linhas_itens):
+        with self.conexao:  # commit no sucesso, rollback na exceção
+            self.conexao.executemany("""
+                INSERT INTO nfcee_cabecalho (
+                    chave_acesso, tipo_documento, especie_documento, data_emissao, numero_documento, serie,
+                    cnpj_consumidor, valor_total, codigo_cliente, referencia_mes_ano, data_vencimento, nome_arquivo,
+                    atualizado_em
+                ) VALUES (
+                    :chave_acesso, :tipo_documento, :especie_documento, :data_emissao, :numero_documento, :serie,
+                    :cnpj_consumidor, :valor_total, :codigo_cliente, :referencia_mes_ano, :data_vencimento, :nome_arquivo,
+                    datetime('now')
+                )
+                ON CONFLICT (chave_acesso) DO UPDATE SET
+                    tipo_documento = excluded.tipo_documento,
+                    especie_documento = excluded.especie_documento,
+                    data_emissao = excluded.data_emissao,
+                    numero_documento = excluded.numero_documento,
+                    serie = excluded.serie,
+                    cnpj_consumidor = excluded.cnpj_consumidor,
+                    valor_total = excluded.valor_total,
+                    codigo_cliente = excluded.codigo_cliente,
+                    referencia_mes_ano = excluded.referencia_mes_ano,
+                    data_vencimento = excluded.data_vencimento,
+                    nome_arquivo = excluded.nome_arquivo,
+                    atualizado_em = excluded.atualizado_em
+            """, linhas_cabecalho)
+            self.conexao.executemany("DELETE FROM nfcee_itens WHERE chave_acesso = ?", chaves)
+            self.conexao.executemany(
+                "INSERT INTO nfcee_itens (chave_acesso, tipo_item, valor) VALUES (:chave_acesso, :tipo_item, :valor)",
+                linhas_itens)
+
+
+def criar_sink(destino, caminho_sqlite=None, tamanho_lote=TAMANHO_LOTE_PADRAO):
+    """Cria o destino pelo nome ('oracle' ou 'sqlite')"""
+    if destino == 'oracle':
+        return SinkFaturasOracle(tamanho_lote=tamanho_lote)
+    if destino == 'sqlite':
+        return SinkFaturasSqlite(caminho_sqlite, tamanho_lote=tamanho_lote)
+    raise ValueError(f"Destino de gravação inválido: {destino}")
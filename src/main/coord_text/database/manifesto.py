@@ -0,0 +1,152 @@
+import sqlite3
+import hashlib
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+# Manifesto de processamento incremental da pasta de PDFs
+# Guarda tamanho, mtime e hash de cada PDF junto com a versão do parser que o processou,
+# para que as próximas execuções peguem só arquivos novos, alterados ou com versão antiga.
+
+NOME_MANIFESTO = ".manifesto_processamento.sqlite"
+TAMANHO_BLOCO_HASH = 1024 * 1024
+
+STATUS_NOVO = "novo"
+STATUS_ALTERADO = "alterado"
+STATUS_VERSAO = "versao_desatualizada"
+STATUS_INALTERADO = "inalterado"
+STATUS_FORA_PERIODO = "fora_do_periodo"
+
+
+def argumentos_manifesto(descricao=None):
+    """Argumentos de linha de comando comuns aos main() que usam o manifesto"""
+    parser = argparse.ArgumentParser(description=descricao)
+    parser.add_argument("--since", dest="desde", default=None,
+                        help="Processa só PDFs modificados a partir desta data (AAAA-MM-DD)")
+    parser.add_argument("--dry-run", dest="dry_run", action="store_true",
+                        help="Somente mostra o que seria processado, sem processar")
+    parser.add_argument("--todos", action="store_true",
+                        help="Ignora o manifesto e processa todos os PDFs da pasta")
+    return parser
+
+
+class ManifestoProcessamento:
+    """Manifesto em SQLite (um por pasta de entrada, separado por pipeline)"""
+
+    def __init__(self, pasta_pdfs, pipeline, versao_parser, caminho_banco=None):
+        self.pipeline = pipeline
+        self.versao_parser = versao_parser
+        self.caminho_banco = caminho_banco or str(Path(pasta_pdfs) / NOME_MANIFESTO)
+        self.conexao = sqlite3.connect(self.caminho_banco)
+        self.conexao.execute("PRAGMA journal_mode=WAL")
+        self.conexao.execute("""
+            CREATE TABLE IF NOT EXISTS arquivos (
+                pipeline TEXT NOT NULL,
+                caminho TEXT NOT NULL,
+                tamanho INTEGER,
+                mtime REAL,
+                sha256 TEXT,
+                versao_parser TEXT,
+                processado_em TEXT,
+                PRIMARY KEY (pipeline, caminho)
+            )
+        """)
+        self.conexao.commit()
+        self._hashes = {}
+        self._pendentes_registro = 0
+
+    def hash_arquivo(self, caminho):
+        """sha256 do arquivo (calculado uma única vez por execução)"""
+        chave = str(caminho)
+        if chave not in self._hashes:
+            sha = hashlib.sha256()
+            with open(caminho, 'rb') as f:
+                for bloco in iter(lambda: f.read(TAMANHO_BLOCO_HASH), b''):
+                    sha.update(bloco)
+            self._hashes[chave] = sha.hexdigest()
+        return self._hashes[chave]
+
+    def _registros_conhecidos(self):
+        cursor = self.conexao.execute(
+            "SELECT caminho, tamanho, mtime, sha256, versao_parser FROM arquivos WHERE pipeline = ?",
+            (self.pipeline,))
+        return {linha[0]: linha[1:] for linha in cursor}
+
+    def selecionar(self, arquivos, desde=None, todos=False):
+        """
+        Classifica os arquivos e retorna (pendentes, relatorio).
+        relatorio: {status: [caminhos]}. Só arquivos com tamanho/mtime diferentes são relidos para hash.
+        """
+        limite_mtime = datetime.strptime(desde, "%Y-%m-%d").timestamp() if desde else None
+        conhecidos = self._registros_conhecidos()
+        relatorio = {STATUS_NOVO: [], STATUS_ALTERADO: [], STATUS_VERSAO: [],
+                     STATUS_INALTERADO: [], STATUS_FORA_PERIODO: []}
+        pendentes = []
+
+        for caminho in arquivos:
+            info = Path(caminho).stat()
+
+            if limite_mtime is not None and info.st_mtime < limite_mtime:
+                relatorio[STATUS_FORA_PERIODO].append(caminho)
+                continue
+
+            registro = conhecidos.get(str(caminho))
+            if registro is None:
+                status = STATUS_NOVO
+            else:
+                tamanho, mtime, sha256, versao = registro
+                if tamanho != info.st_size or mtime != info.st_mtime:
+                    if self.hash_arquivo(caminho) != sha256:
+                        status = STATUS_ALTERADO
+                    else:
+                        # Só o mtime mudou (cópia/touch): atualiza o manifesto sem reprocessar
+                        self._atualizar_stat(caminho, info)
+                        status = STATUS_VERSAO if versao != self.versao_parser else STATUS_INALTERADO
+                elif versao != self.versao_parser:
+                    status = STATUS_VERSAO
+                else:
+                    status = STATUS_INALTERADO
+
+            relatorio[status].append(caminho)
+            if todos or status != STATUS_INALTERADO:
+                pendentes.append(caminho)
+
+        self.conexao.commit()
+        return pendentes, relatorio
+
+    def _atualizar_stat(self, caminho, info):
+        self.conexao.execute(
+            "UPDATE arquivos SET tamanho = ?, mtime = ? WHERE pipeline = ? AND caminho = ?",
+            (info.st_size, info.st_mtime, self.pipeline, str(caminho)))
+
+    def registrar(self, caminho):
+        """Marca o arquivo como processado pela versão atual do parser"""
+        info = Path(caminho).stat()
+        self.conexao.execute("""
+            INSERT OR REPLACE INTO arquivos (pipeline, caminho, tamanho, mtime, sha256, versao_parser, processado_em)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (self.pipeline, str(caminho), info.st_size, info.st_mtime, self.hash_arquivo(caminho),
+              self.versao_parser, datetime.now().isoformat()))
+
+        # Commit em blocos para não pagar um fsync por arquivo
+        self._pendentes_registro += 1
+        if self._pendentes_registro >= 100:
+            self.conexao.commit()
+            self._pendentes_registro = 0
+
+    def fechar(self):
+        self.conexao.commit()
+        self.conexao.close()
+
+
+def imprimir_relatorio(relatorio, dry_run=False):
+    """Resumo do que será (ou seria, no dry-run) processado"""
+    print(f"{'=' * 80}")
+    print("MANIFESTO DE PROCESSAMENTO" + (" (dry-run)" if dry_run else ""))
+    for status, caminhos in relatorio.items():
+        print(f"  {status}: {len(caminhos)}")
+    if dry_run:
+        for status in (STATUS_NOVO, STATUS_ALTERADO, STATUS_VERSAO):
+            for caminho in relatorio[status]:
+                print(f"  [{status}] {Path(caminho).name}")
+    print(f"{'=' * 80}")
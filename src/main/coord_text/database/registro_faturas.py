@@ -0,0 +1,119 @@
+import sqlite3
+import hashlib
+import re
+from datetime import datetime
+from pathlib import Path
+
+# Registro persistente das faturas já processadas (entre execuções)
+# - pdfs: todo PDF já lido, pelo hash do conteúdo (permite pular na próxima execução)
+# - ultima_fatura_uc: fatura mais recente emitida por unidade consumidora
+
+TAMANHO_BLOCO_HASH = 1024 * 1024
+
+
+def hash_arquivo(caminho):
+    """Calcula o sha256 do conteúdo do arquivo lendo em blocos"""
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(TAMANHO_BLOCO_HASH), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+
+def chave_data_emissao(data_emissao_str):
+    """
+    Converte 'dd/mm/aaaa' em 'aaaammdd' (ordenável como texto) sem usar strptime.
+    Retorna None se o formato for inválido.
+    """
+    if not data_emissao_str or not re.fullmatch(r'\d{2}/\d{2}/\d{4}', data_emissao_str):
+        return None
+    dia, mes, ano = data_emissao_str[0:2], data_emissao_str[3:5], data_emissao_str[6:10]
+    if not ('01' <= mes <= '12' and '01' <= dia <= '31'):
+        return None
+    return f"{ano}{mes}{dia}"
+
+
+class RegistroFaturas:
+    """Registro em SQLite das faturas processadas e da última fatura emitida por UC"""
+
+    def __init__(self, caminho_banco):
+        Path(caminho_banco).parent.mkdir(parents=True, exist_ok=True)
+        self.conexao = sqlite3.connect(caminho_banco)
+        self.conexao.execute("PRAGMA journal_mode=WAL")
+        self.conexao.execute("PRAGMA synchronous=NORMAL")
+        self._criar_tabelas()
+
+    def _criar_tabelas(self):
+        self.conexao.executescript("""
+            CREATE TABLE IF NOT EXISTS pdfs (
+                hash_pdf TEXT PRIMARY KEY,
+                nome_arquivo TEXT,
+                codigo_cliente TEXT,
+                data_emissao TEXT,
+                numero_documento TEXT,
+                caminho_saida TEXT,
+                registrado_em TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_pdfs_cliente_data ON pdfs (codigo_cliente, data_emissao);
+            CREATE INDEX IF NOT EXISTS idx_pdfs_documento ON pdfs (numero_documento);
+
+            CREATE TABLE IF NOT EXISTS ultima_fatura_uc (
+                codigo_cliente TEXT PRIMARY KEY,
+                data_emissao TEXT NOT NULL,
+                numero_documento TEXT,
+                hash_pdf TEXT,
+                caminho_saida TEXT,
+                atualizado_em TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_ultima_data ON ultima_fatura_uc (data_emissao);
+        """)
+        self.conexao.commit()
+
+    def ja_processado(self, hash_pdf):
+        """Verifica se o PDF (pelo hash) já foi processado em alguma execução anterior"""
+        cursor = self.conexao.execute("SELECT 1 FROM pdfs WHERE hash_pdf = ?", (hash_pdf,))
+        return cursor.fetchone() is not None
+
+    def atualizar_ultima_por_uc(self, codigo_cliente, data_emissao_str, numero_documento, hash_pdf, caminho_saida):
+        """
+        Upsert da fatura mais recente da UC. Retorna True se esta fatura passou a ser
+        a mais recente (e portanto deve ser emitida), False se já existe uma mais nova.
+        """
+        data_emissao = chave_data_emissao(data_emissao_str)
+        if not codigo_cliente or not data_emissao:
+            return True
+
+        cursor = self.conexao.execute("""
+            INSERT INTO ultima_fatura_uc (codigo_cliente, data_emissao, numero_documento, hash_pdf, caminho_saida, atualizado_em)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (codigo_cliente) DO UPDATE SET
+                data_emissao = excluded.data_emissao,
+                numero_documento = excluded.numero_documento,
+                hash_pdf = excluded.hash_pdf,
+                caminho_saida = excluded.caminho_saida,
+                atualizado_em = excluded.atualizado_em
+            WHERE excluded.data_emissao >= ultima_fatura_uc.data_emissao
+        """, (codigo_cliente, data_emissao, numero_documento, hash_pdf, caminho_saida, datetime.now().isoformat()))
+        return cursor.rowcount > 0
+
+    def registrar_pdf(self, hash_pdf, nome_arquivo, cabecalho, caminho_saida=None):
+        """Registra o PDF processado (emitido ou descartado) para ser pulado nas próximas execuções"""
+        self.conexao.execute("""
+            INSERT OR REPLACE INTO pdfs (hash_pdf, nome_arquivo, codigo_cliente, data_emissao, numero_documento, caminho_saida, registrado_em)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (
+            hash_pdf,
+            nome_arquivo,
+            cabecalho.get('CodigoCliente'),
+            chave_data_emissao(cabecalho.get('DataEmissao')),
+            cabecalho.get('NumeroDocumento'),
+            caminho_saida,
+            datetime.now().isoformat()
+        ))
+
+    def salvar(self):
+        self.conexao.commit()
+
+    def fechar(self):
+        self.conexao.commit()
+        self.conexao.close()
@@ -0,0 +1,34 @@
+# Regiões do layout da fatura (pontos do PDF, página 1), compartilhadas pelos extratores por coordenada
+# (get_text_coord_xml.py) e pelo OCR por região (ocr_text/ocr_regioes.py)
+
+REGIOES_FATURA = {
+    "mais_a_cima": {"coordenadas": [(139.9, 4.1), (142.6, 46.2), (465.8, 42.1), (461.7, 6.8)],
+                    "descricao": "Área mais acima"},
+    "roteiro_tensao": {"coordenadas": [(43.5, 81.5), (40.7, 157.5), (319.1, 150.7), (306.9, 84.2)],
+                       "descricao": "Roteiro e tensão"},
+    "nota_fiscal_protocolo": {"coordenadas": [(422.4, 196.9), (423.7, 282.5), (559.5, 279.8), (559.5, 202.4)],
+                              "descricao": "Nota fiscal e protocolo"},
+    "nome_endereco": {"coordenadas": [(42.1, 160.3), (44.8, 201.0), (232.2, 196.9), (229.5, 163.0)],
+                      "descricao": "Nome e endereço"},
+    "codigo_cliente": {"coordenadas": [(236.3, 182.0), (237.7, 213.2), (331.4, 211.9), (334.1, 184.7)],
+                       "descricao": "Código do cliente"},
+    "ref_total_pagar": {"coordenadas": [(44.8, 260.7), (46.2, 285.2), (320.5, 282.5), (325.9, 252.6)],
+                        "descricao": "Referência e total a pagar"},
+    "tributos": {"coordenadas": [(444.1, 376.2), (563.6, 374.8), (445.4, 407.4), (566.3, 406.1)],
+                 "descricao": "Tributos"},
+    "tabela_itens": {"coordenadas": [(21.7, 361.2), (444.1, 571.7)],
+                     "descricao": "Tabela de itens da fatura"},
+    "cnpj": {"coordenadas": [(43.9, 221.3), (159.8, 234.9), (43.1, 241.3), (159.0, 240.5)],
+             "descricao": "cnpj"}
+}
+
+# Cabeçalhos da tabela de itens e do quadro de tributos, logo acima da primeira linha de itens; só o OCR por
+# região usa (o extrair_secao_tributos do text_extractor_ocr_itens.py procura a seção a partir do cabeçalho
+# "Tributo / Base de Cálc. / Alíquota"). Conferidas nas faturas de resource/pdf_refaturado, onde a tabela
+# fica na mesma posição; ficam fora de REGIOES_FATURA para o extrator por coordenada não processá-las
+REGIOES_CABECALHO_TABELA = {
+    "cabecalho_itens": {"coordenadas": [(21.7, 340.0), (432.0, 356.0)],
+                        "descricao": "Cabeçalho da tabela de itens"},
+    "cabecalho_tributos": {"coordenadas": [(434.4, 340.0), (566.3, 353.5)],
+                           "descricao": "Cabeçalho dos tributos"},
+}
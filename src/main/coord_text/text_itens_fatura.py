@@ -1,10 +1,21 @@
 import pdfplumber
 import re
 import os
+import argparse
+import csv
+import tempfile
 import pandas as pd
 from pathlib import Path
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill
+from openpyxl.utils import get_column_letter
+
+
+COLUNAS_ORDENADAS = [
+    'arquivo', 'caminho', 'descricao', 'quant', 'preco_unit_com_tributos',
+    'valor', 'pis_confins', 'base_calc_icms', 'porcent_icms', 'icms', 'tarifa_unit'
+]
 
 
 def extrair_texto_por_linhas(pdf_path, coordenadas, pagina=0):
@@ -120,6 +131,118 @@ def processar_pdf(pdf_path, coordenadas):
     return dados_pdf
 
 
+class EscritorXlsxStreaming:
+    """
+    Grava os itens no XLSX com o openpyxl em modo write_only, sem manter as linhas em memória.
+    As linhas vão para um arquivo temporário conforme cada PDF termina e a largura das colunas
+    é calculada por contadores de tamanho máximo durante a escrita.
+    Use com `with`: o arquivo temporário é fechado (e apagado) mesmo se algum PDF falhar no meio.
+    """
+
+    def __init__(self, output_xlsx, colunas=COLUNAS_ORDENADAS, sheet_name='Dados'):
+        self.output_xlsx = output_xlsx
+        self.colunas = list(colunas)
+        self.sheet_name = sheet_name
+        self.total_linhas = 0
+
+        # Tamanho máximo do texto de cada coluna (começa pelo próprio cabeçalho)
+        self.max_length = {col: len(col) for col in self.colunas}
+        self.colunas_com_valor = set()
+
+        # O write_only grava as larguras antes das linhas, por isso as linhas passam por um spool em disco
+        self._spool = tempfile.TemporaryFile(mode='w+', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._spool)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def fechar(self):
+        """Fecha o spool; o TemporaryFile é apagado ao fechar"""
+        self._spool.close()
+
+    def adicionar_linhas(self, linhas):
+        """Adiciona as linhas (dicionários) de um PDF e atualiza os contadores de largura"""
+        for linha in linhas:
+            valores = []
+            for col in self.colunas:
+                valor = linha.get(col)
+                if valor is None or valor == '':
+                    valores.append('')
+                    continue
+
+                texto = str(valor)
+                valores.append(texto)
+                self.colunas_com_valor.add(col)
+                if len(texto) > self.max_length[col]:
+                    self.max_length[col] = len(texto)
+
+            self._writer.writerow(valores)
+            self.total_linhas += 1
+
+    def colunas_finais(self):
+        """Mantém somente as colunas que receberam algum valor, na ordem padrão"""
+        return [col for col in self.colunas if col in self.colunas_com_valor]
+
+    def salvar(self):
+        """Gera o XLSX final a partir do spool e libera o arquivo temporário"""
+        colunas = self.colunas_finais()
+        indices = [self.colunas.index(col) for col in colunas]
+
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet(self.sheet_name)
+
+        # Ajustar largura das colunas a partir dos contadores
+        for col_num, col in enumerate(colunas, 1):
+            worksheet.column_dimensions[get_column_letter(col_num)].width = min(self.max_length[col] + 2, 50)
+
+        # Formatar cabeçalho (uma única vez)
+        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+        header_font = Font(color="FFFFFF", bold=True)
+
+        cabecalho = []
+        for col in colunas:
+            cell = WriteOnlyCell(worksheet, value=col)
+            cell.fill = header_fill
+            cell.font = header_font
+            cabecalho.append(cell)
+        worksheet.append(cabecalho)
+
+        self._spool.seek(0)
+        for valores in csv.reader(self._spool):
+            worksheet.append([valores[i] if valores[i] != '' else None for i in indices])
+
+        workbook.save(self.output_xlsx)
+        self.fechar()
+
+
+def processar_pasta_pdfs_streaming(pasta, coordenadas, output_xlsx="resultado.xlsx"):
+    """
+    Processa todos os PDFs de uma pasta e gera um XLSX único, gravando as linhas
+    conforme cada PDF termina (memória limitada). Retorna o total de itens.
+    """
+
+    pdf_files = list(Path(pasta).glob("*.pdf"))
+
+    if not pdf_files:
+        print(f"Nenhum arquivo PDF encontrado na pasta: {pasta}")
+        return 0
+
+    print(f"Encontrados {len(pdf_files)} arquivos PDF para processar")
+
+    with EscritorXlsxStreaming(output_xlsx) as escritor:
+        for i, pdf_path in enumerate(pdf_files, 1):
+            print(f"Processando ({i}/{len(pdf_files)}): {pdf_path.name}")
+            escritor.adicionar_linhas(processar_pdf(pdf_path, coordenadas))
+
+        escritor.salvar()
+
+    print(f"Arquivo XLSX salvo como: {output_xlsx}")
+    return escritor.total_linhas
+
+
 def processar_pasta_pdfs(pasta, coordenadas, output_xlsx="resultado.xlsx"):
     """Processa todos os PDFs de uma pasta e gera um XLSX único"""
 
@@ -142,14 +265,8 @@ def processar_pasta_pdfs(pasta, coordenadas, output_xlsx="resultado.xlsx"):
     # Converter para DataFrame
     df = pd.DataFrame(todos_dados)
 
-    # Definir ordem das colunas
-    colunas_ordenadas = [
-        'arquivo', 'caminho', 'descricao', 'quant', 'preco_unit_com_tributos',
-        'valor', 'pis_confins', 'base_calc_icms', 'porcent_icms', 'icms', 'tarifa_unit'
-    ]
-
     # Reordenar colunas
-    df = df.reindex(columns=[col for col in colunas_ordenadas if col in df.columns])
+    df = df.reindex(columns=[col for col in COLUNAS_ORDENADAS if col in df.columns])
 
     # Salvar como XLSX com formatação
     with pd.ExcelWriter(output_xlsx, engine='openpyxl') as writer:
@@ -190,13 +307,22 @@ pasta_pdfs = r"T:\vitor energia\FATURAS AGRICOLA 2025\2025\TODAS"  # Altere para
 coordenadas = [(21.7, 361.2), (444.1, 571.7)]
 output_xlsx = "conta_energia_padrao.xlsx"
 
+parser = argparse.ArgumentParser(description="Itens das faturas de uma pasta de PDFs em um XLSX")
+parser.add_argument("--streaming", action="store_true",
+                    help="Grava o XLSX conforme os PDFs terminam, sem DataFrame (recomendado para pastas grandes)")
+args = parser.parse_args()
+
 # Processar todos os PDFs da pasta
-df_resultado = processar_pasta_pdfs(pasta_pdfs, coordenadas, output_xlsx)
-
-# Mostrar preview dos dados
-print("\nPreview dos dados:")
-print("=" * 80)
-print(f"Total de itens processados: {len(df_resultado)}")
-print(f"Colunas: {list(df_resultado.columns)}")
-print(f"\nPrimeiras 5 linhas:")
-print(df_resultado.head())
\ No newline at end of file
+if args.streaming:
+    total_itens = processar_pasta_pdfs_streaming(pasta_pdfs, coordenadas, output_xlsx)
+    print(f"\nTotal de itens processados: {total_itens}")
+else:
+    df_resultado = processar_pasta_pdfs(pasta_pdfs, coordenadas, output_xlsx)
+
+    # Mostrar preview dos dados
+    print("\nPreview dos dados:")
+    print("=" * 80)
+    print(f"Total de itens processados: {len(df_resultado)}")
+    print(f"Colunas: {list(df_resultado.columns)}")
+    print(f"\nPrimeiras 5 linhas:")
+    print(df_resultado.head())
\ No newline at end of file
@@ -5,9 +5,14 @@ from typing import Dict, Any
 from pathlib import Path
 import concurrent.futures
 from concurrent.futures import ThreadPoolExecutor
+import sys
+# O pacote database/ (manifesto, CNPJ, Oracle) é compartilhado pelos extratores e fica em coord_text/
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from database.manifesto import ManifestoProcessamento, argumentos_manifesto, imprimir_relatorio
 
 # CONFIGURAÇÃO
 PASTA_PDFS = r"C:\bf_ocr\src\resource\pdf_fino"
+VERSAO_PARSER = "1"  # Altere ao mudar regiões/regras de extração para reprocessar os PDFs já processados
 
 # Regiões a serem extraídas
 regioes = {
@@ -662,6 +667,7 @@ def extrair_informacoes_json(pdf_path: str) -> Dict[str, Any]:
     return resultado_final
 
 def main():
+    args = argumentos_manifesto("Extrai as faturas finas da pasta e mostra os dados em JSON").parse_args()
     caminho_pasta = Path(PASTA_PDFS)
     arquivos_pdf = list(caminho_pasta.glob("*.pdf"))
 
@@ -669,6 +675,14 @@ def main():
         print(f"Nenhum arquivo PDF encontrado na pasta: {PASTA_PDFS}")
         return
 
+    manifesto = ManifestoProcessamento(PASTA_PDFS, Path(__file__).stem, VERSAO_PARSER)
+    arquivos_pdf, relatorio = manifesto.selecionar(arquivos_pdf, desde=args.desde, todos=args.todos)
+    imprimir_relatorio(relatorio, dry_run=args.dry_run)
+
+    if args.dry_run or not arquivos_pdf:
+        manifesto.fechar()
+        return
+
     print(f"Encontrados {len(arquivos_pdf)} arquivos PDF para processar")
     print(f"{'=' * 80}")
 
@@ -688,6 +702,7 @@ def main():
             caminho_saida = caminho_pdf.parent / nome_arquivo_saida
 
             print(json_output)
+            manifesto.registrar(caminho_pdf)
             #with open(caminho_saida, 'w', encoding='utf-8') as f:
             #    f.write(json_output)
 
@@ -698,6 +713,7 @@ def main():
 
         print("-" * 80)
 
+    manifesto.fechar()
     print("Processamento concluído!")
 
 
@@ -6,10 +6,16 @@ from typing import Dict, Any, List, Tuple
 from pathlib import Path
 import concurrent.futures
 from concurrent.futures import ThreadPoolExecutor
-from database.connect_oracle import retorno_cnpj_pdf
+import sys
+# O pacote database/ (manifesto, CNPJ, Oracle) é compartilhado pelos extratores e fica em coord_text/
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from database.backend_cnpj import retorno_cnpj_pdf, retorno_cnpj_lote
+from database.estagio_cnpj import EstagioCnpj
+from database.manifesto import ManifestoProcessamento, argumentos_manifesto, imprimir_relatorio
 
 # CONFIGURAÇÃO
 PASTA_PDFS = r"C:\bf_ocr\src\resource\pdf_refaturado"
+VERSAO_PARSER = "1"  # Altere ao mudar regiões/regras de extração para reprocessar os PDFs já processados
 ARQUIVO_EXCEL_SAIDA = r"C:\bf_ocr\src\resource\pdf_refaturado\faturas_processadas_botzin.xlsx"
 
 # Regiões a serem extraídas
@@ -233,22 +239,23 @@ def processar_area_mais_acima(texto: str) -> Dict[str, Any]:
 
 
 
-def processar_cnpj(texto: str, nome_titular="") -> dict:
-    resultado = {}
+def extrair_parametros_cnpj(texto: str, nome_titular="") -> Tuple[str, str, str, str]:
+    """Parâmetros da consulta do CNPJ no banco: (prim_num, ult_num, nome_titular, num_insc)"""
     linhas = texto.split('\n')
 
     num_cnpj = re.findall(r'\d', linhas[0])
     ult_num = (num_cnpj[-3:])
     prim_num = (num_cnpj[0])
     ult_num = ''.join(ult_num)
-    #print(ult_num)
 
-    print(linhas[1])
     num_insc = re.findall(r'\d+', linhas[1])
     num_insc = ''.join(num_insc)
 
-    print(prim_num,ult_num,nome_titular,num_insc)
-    cnpj = retorno_cnpj_pdf(prim_num,ult_num,nome_titular,num_insc)
+    return prim_num, ult_num, nome_titular, num_insc
+
+
+def processar_cnpj(texto: str, nome_titular="") -> dict:
+    cnpj = retorno_cnpj_pdf(*extrair_parametros_cnpj(texto, nome_titular))
 
     resultado = cnpj
 
@@ -482,9 +489,14 @@ def processar_regiao_parallel(nome, texto, resultado_parcial):
         return nome, {"erro": f"Erro no processamento: {str(e)}", "texto_bruto": texto}
 
 
-def extrair_informacoes_json(pdf_path: str) -> Dict[str, Any]:
-    """Extrai todas as informações e retorna como JSON com threading"""
+def extrair_informacoes_json(pdf_path: str, estagio_cnpj=None) -> Dict[str, Any]:
+    """
+    Extrai todas as informações e retorna como JSON com threading.
+    Com estagio_cnpj a consulta do CNPJ só é enfileirada: o resultado fica pendente
+    e é preenchido por juntar_cnpj, depois que os próximos PDFs já foram lidos.
+    """
     resultado_final = {}
+    futuro_cnpj = None
 
     # Extrair todos os textos primeiro (fora das threads)
     textos_regioes = {}
@@ -530,7 +542,11 @@ def extrair_informacoes_json(pdf_path: str) -> Dict[str, Any]:
     if "cnpj" in textos_regioes and "cliente" in resultado_final:
         try:
             nome_titular = resultado_final.get('cliente', {}).get('nome_titular', '')
-            resultado_final["cnpj"] = processar_cnpj(textos_regioes["cnpj"], nome_titular)
+            if estagio_cnpj is None:
+                resultado_final["cnpj"] = processar_cnpj(textos_regioes["cnpj"], nome_titular)
+            else:
+                # Só enfileira a consulta; o resultado é juntado depois da tabela de itens
+                futuro_cnpj = estagio_cnpj.enviar(extrair_parametros_cnpj(textos_regioes["cnpj"], nome_titular))
         except Exception as e:
             resultado_final["cnpj"] = {"erro": f"Erro no processamento: {str(e)}",
                                        "texto_bruto": textos_regioes["cnpj"]}
@@ -543,9 +559,24 @@ def extrair_informacoes_json(pdf_path: str) -> Dict[str, Any]:
         except Exception as e:
             resultado_final["itens_fatura"] = {"erro": f"Erro na tabela: {str(e)}"}
 
+    if futuro_cnpj is not None:
+        resultado_final["_cnpj_pendente"] = (futuro_cnpj, textos_regioes["cnpj"])
+
     return resultado_final
 
 
+def juntar_cnpj(resultado_final: Dict[str, Any]):
+    """Espera a consulta enfileirada no estágio de CNPJ e preenche resultado_final['cnpj']"""
+    pendente = resultado_final.pop("_cnpj_pendente", None)
+    if pendente is None:
+        return
+    futuro_cnpj, texto_bruto = pendente
+    try:
+        resultado_final["cnpj"] = futuro_cnpj.result()
+    except Exception as e:
+        resultado_final["cnpj"] = {"erro": f"Erro no processamento: {str(e)}", "texto_bruto": texto_bruto}
+
+
 def criar_dataframe_consolidado(dados_todos_pdfs: List[Tuple[str, Dict[str, Any]]]) -> pd.DataFrame:
     """Cria um DataFrame consolidado com todos os dados dos PDFs"""
     linhas_consolidadas = []
@@ -604,6 +635,7 @@ def criar_dataframe_consolidado(dados_todos_pdfs: List[Tuple[str, Dict[str, Any]
 
 
 def main():
+    args = argumentos_manifesto("Extrai as faturas da pasta e mostra os dados em JSON").parse_args()
     caminho_pasta = Path(PASTA_PDFS)
     arquivos_pdf = list(caminho_pasta.glob("*.pdf"))
 
@@ -611,18 +643,29 @@ def main():
         print(f"Nenhum arquivo PDF encontrado na pasta: {PASTA_PDFS}")
         return
 
+    manifesto = ManifestoProcessamento(PASTA_PDFS, Path(__file__).stem, VERSAO_PARSER)
+    arquivos_pdf, relatorio = manifesto.selecionar(arquivos_pdf, desde=args.desde, todos=args.todos)
+    imprimir_relatorio(relatorio, dry_run=args.dry_run)
+
+    if args.dry_run or not arquivos_pdf:
+        manifesto.fechar()
+        return
+
     print(f"Encontrados {len(arquivos_pdf)} arquivos PDF para processar")
     print(f"{'=' * 80}")
 
     dados_todos_pdfs = []
 
-    # Processa cada arquivo PDF
-    for i, caminho_pdf in enumerate(arquivos_pdf, 1):
-        print(f"Processando ({i}/{len(arquivos_pdf)}): {caminho_pdf.name}")
+    # Processa cada arquivo PDF; as consultas de CNPJ rodam em lote no estágio enquanto os próximos PDFs são lidos
+    with EstagioCnpj(retorno_cnpj_lote) as estagio_cnpj:
+        for i, caminho_pdf in enumerate(arquivos_pdf, 1):
+            print(f"Processando ({i}/{len(arquivos_pdf)}): {caminho_pdf.name}")
 
+            # Extrai informações estruturadas
+            dados_todos_pdfs.append((caminho_pdf, extrair_informacoes_json(caminho_pdf, estagio_cnpj)))
 
-        # Extrai informações estruturadas
-        dados_extraidos = extrair_informacoes_json(caminho_pdf)
+    for caminho_pdf, dados_extraidos in dados_todos_pdfs:
+        juntar_cnpj(dados_extraidos)
 
         # Converte para JSON com formatação
         nome_titular = dados_extraidos['cliente']['nome_titular']
@@ -632,6 +675,8 @@ def main():
         print("DADOS EXTRAÍDOS (JSON):")
         print(json_output)
 
+        manifesto.registrar(caminho_pdf)
+
         # Salva em arquivo (opcional)
         #nome_arquivo_saida = os.path.splitext(os.path.basename(CAMINHO_PDF))[0] + "_dados.json"
         #caminho_saida = os.path.join(os.path.dirname(CAMINHO_PDF), nome_arquivo_saida)
@@ -641,6 +686,8 @@ def main():
 
         #print(f"\nDados salvos em: {caminho_saida}")
 
+    manifesto.fechar()
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,79 @@
+import sys
+from pathlib import Path
+import pytesseract
+from PIL import Image
+from renderizador_pdf import renderizar_recortes
+
+# As regiões vêm do layout compartilhado com os extratores por coordenada (coord_text/layout_fatura.py)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "coord_text"))
+from layout_fatura import REGIOES_FATURA, REGIOES_CABECALHO_TABELA  # noqa: E402
+
+"""
+OCR só das regiões do layout da fatura, em vez da página inteira
+    - só as regiões (tabela de itens, tributos, quadros do cabeçalho) são renderizadas, direto do PDF
+    - os recortes de uma fatura são empilhados num único mosaico e lidos numa única chamada ao Tesseract
+    - o texto volta separado por região pela posição vertical de cada linha no mosaico
+"""
+
+regioes = {**REGIOES_FATURA, **REGIOES_CABECALHO_TABELA}
+
+DPI_OCR = 300
+MARGEM_RECORTE = 3        # pontos a mais em volta da região, para não cortar letras na borda
+ESPACO_MOSAICO = 40       # pixels em branco entre os recortes (o Tesseract não junta linhas de regiões vizinhas)
+# psm 6: bloco uniforme de texto; o mosaico é uma coluna de blocos e a ordem das linhas é preservada
+CONFIG_TESSERACT = "--psm 6"
+
+
+def calcular_retangulo(coordenadas, margem=0):
+    x_coords = [coord[0] for coord in coordenadas]
+    y_coords = [coord[1] for coord in coordenadas]
+    return (min(x_coords) - margem, min(y_coords) - margem, max(x_coords) + margem, max(y_coords) + margem)
+
+
+def recortar_regioes(documento, nomes_regioes, numero_pagina=0, dpi=DPI_OCR):
+    """Renderiza em `dpi`, em tons de cinza, só as regiões pedidas da página do documento (fitz)"""
+    retangulos = {nome: calcular_retangulo(regioes[nome]["coordenadas"], MARGEM_RECORTE) for nome in nomes_regioes}
+    return renderizar_recortes(documento, retangulos, numero_pagina, dpi)
+
+
+def montar_mosaico(recortes):
+    """Empilha os recortes; retorna a imagem e a faixa vertical (y0, y1) de cada região"""
+    largura = max(recorte.width for recorte in recortes.values())
+    altura = sum(recorte.height for recorte in recortes.values()) + ESPACO_MOSAICO * (len(recortes) + 1)
+    mosaico = Image.new("L", (largura, altura), 255)
+
+    faixas = {}
+    y = ESPACO_MOSAICO
+    for nome, recorte in recortes.items():
+        mosaico.paste(recorte, (0, y))
+        faixas[nome] = (y, y + recorte.height)
+        y += recorte.height + ESPACO_MOSAICO
+    return mosaico, faixas
+
+
+def separar_texto_por_regiao(dados, faixas):
+    """Reconstrói o texto de cada região a partir do image_to_data do mosaico"""
+    linhas = {}  # (bloco, parágrafo, linha, região) -> [(x, palavra)]
+    for i, palavra in enumerate(dados["text"]):
+        if not palavra.strip():
+            continue
+        centro = dados["top"][i] + dados["height"][i] / 2
+        regiao = next((nome for nome, (y0, y1) in faixas.items() if y0 - ESPACO_MOSAICO / 2 <= centro < y1 + ESPACO_MOSAICO / 2), None)
+        if regiao is None:
+            continue
+        chave = (dados["block_num"][i], dados["par_num"][i], dados["line_num"][i], regiao)
+        linhas.setdefault(chave, []).append((dados["left"][i], palavra))
+
+    textos = {nome: [] for nome in faixas}
+    for (_, _, _, regiao), palavras in linhas.items():
+        textos[regiao].append(" ".join(palavra for _, palavra in sorted(palavras)))
+    return {nome: "\n".join(linhas_regiao) for nome, linhas_regiao in textos.items()}
+
+
+def ocr_regioes(documento, nomes_regioes, numero_pagina=0, dpi=DPI_OCR, lang="por"):
+    """OCR das regiões pedidas numa única chamada ao Tesseract; retorna {região: texto}"""
+    recortes = recortar_regioes(documento, nomes_regioes, numero_pagina, dpi)
+    mosaico, faixas = montar_mosaico(recortes)
+    dados = pytesseract.image_to_data(mosaico, lang=lang, config=CONFIG_TESSERACT,
+                                      output_type=pytesseract.Output.DICT)
+    return separar_texto_por_regiao(dados, faixas)
@@ -0,0 +1,53 @@
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+"""
+Renderização de PDF para OCR dentro do próprio processo (PyMuPDF)
+    - substitui o convert_from_path do pdf2image: sem pdftoppm, sem arquivos PPM temporários e sem poppler_path
+    - a página (ou só um recorte dela, em pontos do PDF) vai direto para um buffer em memória
+    - tons de cinza por padrão, que é o que o Tesseract usa; "rgb" para quem precisar de cor
+"""
+
+DPI_PADRAO = 300
+ESPACOS_COR = {"cinza": fitz.csGRAY, "rgb": fitz.csRGB}
+
+
+def _pixmap(pagina, dpi, cor, recorte):
+    matriz = fitz.Matrix(dpi / 72, dpi / 72)
+    clip = fitz.Rect(recorte) & pagina.rect if recorte else None
+    return pagina.get_pixmap(matrix=matriz, colorspace=ESPACOS_COR[cor], clip=clip, alpha=False)
+
+
+def pixmap_para_imagem(pixmap):
+    modo = "L" if pixmap.n == 1 else "RGB"
+    return Image.frombytes(modo, (pixmap.width, pixmap.height), pixmap.samples)
+
+
+def pixmap_para_array(pixmap):
+    """Array (altura, largura) em cinza ou (altura, largura, 3) em RGB; copiado, não depende do pixmap"""
+    array = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.width, pixmap.n).copy()
+    return array[:, :, 0] if pixmap.n == 1 else array
+
+
+def renderizar_pagina(documento, numero_pagina=0, dpi=DPI_PADRAO, cor="cinza", recorte=None):
+    """Imagem PIL da página (índice a partir de 0); `recorte` = (x0, y0, x1, y1) em pontos renderiza só essa área"""
+    return pixmap_para_imagem(_pixmap(documento[numero_pagina], dpi, cor, recorte))
+
+
+def renderizar_array(documento, numero_pagina=0, dpi=DPI_PADRAO, cor="cinza", recorte=None):
+    """Como renderizar_pagina, mas devolve um array NumPy uint8"""
+    return pixmap_para_array(_pixmap(documento[numero_pagina], dpi, cor, recorte))
+
+
+def renderizar_recortes(documento, recortes, numero_pagina=0, dpi=DPI_PADRAO, cor="cinza"):
+    """{nome: retângulo em pontos} -> {nome: imagem PIL}, renderizando só as áreas pedidas da página"""
+    pagina = documento[numero_pagina]
+    return {nome: pixmap_para_imagem(_pixmap(pagina, dpi, cor, retangulo)) for nome, retangulo in recortes.items()}
+
+
+def renderizar_paginas(caminho_pdf, dpi=DPI_PADRAO, cor="cinza", paginas=None):
+    """Imagens PIL das páginas do arquivo (todas, ou só os índices em `paginas`), como o convert_from_path"""
+    with fitz.open(caminho_pdf) as documento:
+        indices = range(documento.page_count) if paginas is None else paginas
+        return [renderizar_pagina(documento, i, dpi, cor) for i in indices]
@@ -0,0 +1,149 @@
+import argparse
+import os
+import time
+import fitz  # PyMuPDF
+import pdfplumber
+import pytesseract
+from ocr_regioes import regioes, calcular_retangulo, ocr_regioes, DPI_OCR, MARGEM_RECORTE
+from renderizador_pdf import renderizar_pagina
+
+"""
+Roteador por página/região entre a camada de texto do PDF e o OCR
+    - PDF digital: o texto de cada região do layout sai da camada de texto (pdfplumber), sem OCR
+    - PDF escaneado (ou com fonte sem mapeamento, que o pdfplumber devolve como "(cid:N)"): só as regiões
+      sem camada de texto utilizável vão para o OCR, todas juntas numa única chamada (ocr_regioes.py)
+    - região vazia numa página com camada de texto e sem imagem dentro dela está vazia de verdade: não vai para o OCR
+    - com --todas-paginas, as demais páginas passam pela mesma decisão, página inteira
+Uso: python roteador_texto_ocr.py [--pasta C:\\pdfs] [--regioes tabela_itens tributos] [--todas-paginas]
+"""
+
+PASTA_PDFS = r"C:\bf_ocr\src\resource\pdf"
+pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+
+MIN_CARACTERES_REGIAO = 5       # menos que isso na região: sem camada de texto (ou região vazia de verdade)
+MIN_CARACTERES_PAGINA = 50
+PROPORCAO_MINIMA_VALIDOS = 0.9  # fração mínima de glifos mapeados para texto legível
+
+TEXTO = "texto"
+OCR = "ocr"
+
+
+def glifo_valido(caractere):
+    texto = caractere["text"]
+    return len(texto) == 1 and texto.isprintable() and texto != "\ufffd"
+
+
+def camada_utilizavel(caracteres, minimo):
+    """True se os caracteres da camada de texto bastam para dispensar o OCR"""
+    caracteres = [c for c in caracteres if not c["text"].isspace()]
+    if len(caracteres) < minimo:
+        return False
+    return sum(glifo_valido(c) for c in caracteres) / len(caracteres) >= PROPORCAO_MINIMA_VALIDOS
+
+
+def texto_da_area(pagina):
+    """Mesma montagem de linhas do extrair_texto_nas_coordenadas (coord_text), sobre uma área já recortada"""
+    palavras = pagina.extract_words(x_tolerance=3, y_tolerance=3, keep_blank_chars=False, use_text_flow=True)
+    linhas = {}
+    for palavra in palavras:
+        linhas.setdefault(round(palavra['top']), []).append((palavra['x0'], palavra['text']))
+    return '\n'.join(' '.join(texto for _, texto in sorted(linhas[y])) for y in sorted(linhas))
+
+
+def area_da_regiao(pagina, nome):
+    """
+    Mesmo retângulo (com MARGEM_RECORTE) que o ocr_regioes renderiza, para os dois caminhos lerem a mesma área;
+    crop e não within_bbox: uma linha que encosta na borda (ex.: "Consumo em kWh" no topo da tabela_itens)
+    entra com os caracteres que cruzam o limite, em vez de ser descartada
+    """
+    x0, y0, x1, y1 = calcular_retangulo(regioes[nome]["coordenadas"], MARGEM_RECORTE)
+    px0, py0, px1, py1 = pagina.bbox
+    return pagina.crop((max(x0, px0), max(y0, py0), min(x1, px1), min(y1, py1)))
+
+
+def rotear_pdf(caminho_pdf, nomes_regioes=tuple(regioes), todas_paginas=False, dpi=DPI_OCR):
+    """
+    Texto das regiões do layout (página 1) e, com `todas_paginas`, das demais páginas
+    Retorna {"regioes": {nome: {"texto", "origem"}}, "paginas": [{"numero", "texto", "origem"}]}
+    """
+    resultado = {"regioes": {}, "paginas": []}
+    sem_camada = []
+
+    with pdfplumber.open(caminho_pdf) as pdf:
+        primeira = pdf.pages[0]
+        pagina_digital = camada_utilizavel(primeira.chars, MIN_CARACTERES_PAGINA)
+        for nome in nomes_regioes:
+            area = area_da_regiao(primeira, nome)
+            if camada_utilizavel(area.chars, MIN_CARACTERES_REGIAO) or (pagina_digital and not area.images):
+                resultado["regioes"][nome] = {"texto": texto_da_area(area), "origem": TEXTO}
+            else:
+                sem_camada.append(nome)
+
+        paginas_ocr = []
+        if todas_paginas:
+            for numero, pagina in enumerate(pdf.pages[1:], start=1):
+                if camada_utilizavel(pagina.chars, MIN_CARACTERES_PAGINA):
+                    resultado["paginas"].append({"numero": numero, "texto": texto_da_area(pagina), "origem": TEXTO})
+                else:
+                    paginas_ocr.append(numero)
+
+    if sem_camada or paginas_ocr:
+        with fitz.open(caminho_pdf) as documento:
+            if sem_camada:
+                for nome, texto in ocr_regioes(documento, sem_camada, dpi=dpi).items():
+                    resultado["regioes"][nome] = {"texto": texto, "origem": OCR}
+            for numero in paginas_ocr:
+                texto = pytesseract.image_to_string(renderizar_pagina(documento, numero, dpi), lang='por')
+                resultado["paginas"].append({"numero": numero, "texto": texto, "origem": OCR})
+
+    # Mesma ordem pedida, independente de qual caminho cada região seguiu
+    resultado["regioes"] = {nome: resultado["regioes"][nome] for nome in nomes_regioes}
+    resultado["paginas"].sort(key=lambda pagina: pagina["numero"])
+    return resultado
+
+
+def processar_pasta(pasta, nomes_regioes=tuple(regioes), todas_paginas=False):
+    contagem = {"pdfs": 0, "erros": 0, "regioes": {TEXTO: 0, OCR: 0}, "paginas": {TEXTO: 0, OCR: 0}}
+    resultados = {}
+    inicio = time.monotonic()
+
+    for arquivo in sorted(os.listdir(pasta)):
+        if not arquivo.lower().endswith(".pdf"):
+            continue
+        try:
+            resultado = rotear_pdf(os.path.join(pasta, arquivo), nomes_regioes, todas_paginas)
+        except Exception as e:
+            print(f"❌ Erro ao processar {arquivo}: {e}")
+            contagem["erros"] += 1
+            continue
+
+        contagem["pdfs"] += 1
+        resultados[arquivo] = resultado
+        origens = [regiao["origem"] for regiao in resultado["regioes"].values()]
+        for origem in origens:
+            contagem["regioes"][origem] += 1
+        for pagina in resultado["paginas"]:
+            contagem["paginas"][pagina["origem"]] += 1
+        print(f"📄 {arquivo}: {origens.count(TEXTO)} região(ões) pela camada de texto, {origens.count(OCR)} por OCR")
+
+    contagem["duracao"] = time.monotonic() - inicio
+    return resultados, contagem
+
+
+def imprimir_resumo(contagem):
+    print("-" * 50)
+    print(f"PDFs processados: {contagem['pdfs']} ({contagem['erros']} com erro) em {contagem['duracao']:.1f}s")
+    print(f"Regiões: {contagem['regioes'][TEXTO]} pela camada de texto, {contagem['regioes'][OCR]} por OCR")
+    if any(contagem["paginas"].values()):
+        print(f"Páginas extras: {contagem['paginas'][TEXTO]} pela camada de texto, {contagem['paginas'][OCR]} por OCR")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Texto das faturas pela camada de texto, com OCR só onde faltar")
+    parser.add_argument("--pasta", default=PASTA_PDFS)
+    parser.add_argument("--regioes", nargs="+", choices=list(regioes), default=list(regioes))
+    parser.add_argument("--todas-paginas", action="store_true", help="Roteia também as páginas depois da primeira")
+    args = parser.parse_args()
+
+    _, contagem = processar_pasta(args.pasta, tuple(args.regioes), args.todas_paginas)
+    imprimir_resumo(contagem)
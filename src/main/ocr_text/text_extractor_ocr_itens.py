@@ -1,7 +1,9 @@
+import argparse
 import os
 import pytesseract
-from pdf2image import convert_from_path
 import re
+from renderizador_pdf import renderizar_paginas
+from roteador_texto_ocr import rotear_pdf
 
 """ Terceiro codigo para pegar os itens dos pdfs de conta de energia
     Pegando somente os valores e descricao dos itens que foram passados pelo analista 
@@ -15,12 +17,19 @@ import re
 pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 PASTA_PDFS = r"C:\bf_ocr\src\resource\pdf"
 
+# Por padrão o OCR é da página inteira. Com "--regioes" só as regiões do layout (cabeçalhos, tabela de itens e
+# tributos) são lidas: pela camada de texto quando o PDF tem uma, senão por OCR num único mosaico. Nas faturas
+# de resource/pdf_refaturado o resultado é o mesmo da página inteira; as coordenadas não valem para o layout
+# da fatura fina, que fica com o text_extractor_ocr_fatura_fina.py
+REGIOES_OCR = ("cabecalho_tributos", "cabecalho_itens", "tabela_itens", "tributos")
+
 def extrair_secao_tributos(texto):
     """Extrai a seção específica entre Tributo/Alíquota e ICMS"""
 
     # Padrão para capturar desde "Tributo" ou "Base de Alíquota" até "ICMS"
     # Tarifa e unit os valres nao foram encontrados no lumber
-    padrao = r'(Tributo.*?Base de Alíquota.*?)(Consumo em kWh.*?Adic\. B\. Vermelha.*?)(?=ICMS|\Z)'
+    # As duas linhas do cabeçalho ficam empilhadas e a ordem em que saem depende de quem lê (OCR ou camada de texto)
+    padrao = r'((?:Tributo.*?Base de Alíquota|Base de Alíquota.*?Tributo).*?)(Consumo em kWh.*?Adic\. B\. Vermelha.*?)(?=ICMS|\Z)'
     resultado = re.search(padrao, texto, re.DOTALL | re.IGNORECASE)
 
     #re.IGNORECASE = caracteriza . como quebra de linha
@@ -228,24 +237,36 @@ def processar_texto(texto):
     return resultados
 
 
+parser = argparse.ArgumentParser(description="Extrai os itens das faturas de energia por OCR")
+parser.add_argument("--regioes", action="store_true",
+                    help="lê só as regiões do layout em vez de fazer OCR da página inteira")
+parser.add_argument("--pasta", default=PASTA_PDFS, help="pasta com os PDFs")
+args = parser.parse_args()
 
-for arquivo in os.listdir(PASTA_PDFS):
+for arquivo in os.listdir(args.pasta):
     #pega todos os arquivos que tenham a extensao pdf
     if arquivo.lower().endswith(".pdf"):
-        caminho_pdf = os.path.join(PASTA_PDFS, arquivo)
+        caminho_pdf = os.path.join(args.pasta, arquivo)
         print(f"🔍 Processando: {arquivo}")
         print("-" * 50)
 
         try:
-            #converte o pdf em imagem
-            imagens = convert_from_path(caminho_pdf, dpi=300, poppler_path=r"C:\poppler-24.08.0\Library\bin")
-            texto_completo = ""
-
-            for i, imagem in enumerate(imagens):
-                print(f"📄 Página {i + 1}/{len(imagens)}...")
-                #identifica a texto como portugues
-                texto = pytesseract.image_to_string(imagem, lang='por')
-                texto_completo += texto + "\n"
+            if not args.regioes:
+                #converte o pdf em imagem
+                imagens = renderizar_paginas(caminho_pdf, dpi=300)
+                texto_completo = ""
+
+                for i, imagem in enumerate(imagens):
+                    print(f"📄 Página {i + 1}/{len(imagens)}...")
+                    #identifica a texto como portugues
+                    texto = pytesseract.image_to_string(imagem, lang='por')
+                    texto_completo += texto + "\n"
+            else:
+                # As regiões ficam na primeira página; só as que não têm camada de texto passam pelo OCR
+                textos_regioes = rotear_pdf(caminho_pdf, REGIOES_OCR)["regioes"]
+                origens = [f"{nome}={regiao['origem']}" for nome, regiao in textos_regioes.items()]
+                print(f"📄 Origem do texto: {', '.join(origens)}")
+                texto_completo = "\n".join(textos_regioes[nome]["texto"] for nome in REGIOES_OCR)
 
             #print(texto_completo)
             secao_tributos = extrair_secao_tributos(texto_completo)